@@ -0,0 +1,139 @@
+"""
+Content-addressed cache of /process results.
+
+Results are keyed by a hash of the uploaded bytes plus everything else that
+influences the output (classifier model version, extractor version, OCR and
+preprocessing settings), so a retrained model, changed extractor or toggled
+setting never serves stale results. Entries live in a local SQLite database in WAL mode, which makes the
+cache safe to share between uvicorn worker processes. Entries are evicted
+least-recently-used first once the cache grows past RESULT_CACHE_MAX_BYTES,
+and dropped entirely after RESULT_CACHE_MAX_AGE seconds. Hit/miss counters are
+kept in the same database so they cover every worker.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+try:
+    from .config import (RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_AGE,
+                         OCR_PDF_DPI, OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE, OCR_PDF_TEXT_LAYER,
+                         OCR_ENGINE, OCR_TWO_PASS, OCR_EARLY_EXIT, OCR_EARLY_EXIT_CONFIDENCE,
+                         OCR_EARLY_EXIT_COVERAGE, OCR_EARLY_EXIT_STEP, OCR_PAGE_LIMIT, OCR_PDF_MIN_DPI,
+                         OCR_TEXT_LAYER_MIN_CHARS, OCR_COARSE_SCALE, OCR_FINE_MAX_COVERAGE,
+                         PREPROCESS_TARGET_LINE_HEIGHT)
+    from .classifier import model_version
+    from .preprocess import active_steps
+    from .extractor import EXTRACTOR_VERSION
+except ImportError:
+    from config import (RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_AGE,
+                        OCR_PDF_DPI, OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE, OCR_PDF_TEXT_LAYER,
+                        OCR_ENGINE, OCR_TWO_PASS, OCR_EARLY_EXIT, OCR_EARLY_EXIT_CONFIDENCE,
+                        OCR_EARLY_EXIT_COVERAGE, OCR_EARLY_EXIT_STEP, OCR_PAGE_LIMIT, OCR_PDF_MIN_DPI,
+                        OCR_TEXT_LAYER_MIN_CHARS, OCR_COARSE_SCALE, OCR_FINE_MAX_COVERAGE,
+                        PREPROCESS_TARGET_LINE_HEIGHT)
+    from classifier import model_version
+    from preprocess import active_steps
+    from extractor import EXTRACTOR_VERSION
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(RESULT_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(RESULT_CACHE_PATH, timeout=30, isolation_level=None)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+        _initialized = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def cache_key(content: bytes, suffix: str):
+    """Key for an upload: its content hash plus the versions that shape the result."""
+    digest = hashlib.sha256(content).hexdigest()
+    steps = ",".join(step for step, on in sorted(active_steps().items()) if on)
+    settings = (f"{suffix}|{OCR_PDF_DPI}|{OCR_PDF_MIN_DPI}|{OCR_PDF_FIRST_PAGE}|{OCR_PDF_LAST_PAGE}"
+                f"|{OCR_PDF_TEXT_LAYER}|{OCR_TEXT_LAYER_MIN_CHARS}|{OCR_ENGINE}"
+                f"|{steps}|{PREPROCESS_TARGET_LINE_HEIGHT}|{OCR_TWO_PASS}")
+    if OCR_TWO_PASS:
+        settings += f"|{OCR_COARSE_SCALE}|{OCR_FINE_MAX_COVERAGE}"
+    if OCR_EARLY_EXIT:
+        settings += f"|{OCR_EARLY_EXIT_CONFIDENCE}|{OCR_EARLY_EXIT_COVERAGE}|{OCR_EARLY_EXIT_STEP}|{OCR_PAGE_LIMIT}"
+    return f"{digest}:{model_version()}:{EXTRACTOR_VERSION}:{hashlib.sha1(settings.encode()).hexdigest()[:8]}"
+
+
+def get(key):
+    """Return the cached result for key, or None. Counts a hit or a miss."""
+    with closing(_connect()) as conn:
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM results WHERE key = ? AND created_at >= ?", (key, now - RESULT_CACHE_MAX_AGE)
+        ).fetchone()
+        if row is None:
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+            return None
+        conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+
+def put(key, result):
+    """Store a result and evict expired / least recently used entries.
+
+    Results whose OCR failed (result["ocr_failed"], see workers.analyze_text) aren't stored:
+    a poppler or Tesseract error may be gone on the next upload.
+    """
+    if result.get("ocr_failed"):
+        return
+    value = json.dumps(result, ensure_ascii=False)
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now)
+            )
+            evicted = conn.execute("DELETE FROM results WHERE created_at < ?", (now - RESULT_CACHE_MAX_AGE,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > RESULT_CACHE_MAX_BYTES:
+                oldest = conn.execute("SELECT key, size FROM results ORDER BY last_access LIMIT 100").fetchall()
+                if not oldest:
+                    break
+                for old_key, size in oldest:
+                    if total <= RESULT_CACHE_MAX_BYTES:
+                        break
+                    conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    total -= size
+                    evicted += 1
+            if evicted:
+                conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def cache_stats():
+    with closing(_connect()) as conn:
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        **counters,
+        "hit_rate": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+        "entries": entries,
+        "size_bytes": size,
+        "max_bytes": RESULT_CACHE_MAX_BYTES,
+    }
@@ -1,30 +1,119 @@
-import pickle
 import os
+import time
 try:
     from .config import CLASSIFIER_MODEL_PATH
+    from .model_artifact import load_artifact, artifact_version, predict
+    from . import model_registry
 except ImportError:
     from config import CLASSIFIER_MODEL_PATH
+    from model_artifact import load_artifact, artifact_version, predict
+    import model_registry
 
-model = None
-vectorizer = None
+# The model this process classifies with: {"version", "artifact", "stamp"}. Replaced as a
+# whole when the registry's active version changes, so a batch in flight keeps the model it
+# started with.
+_active = None
+WARM_UP_TEXT = "invoice total amount date"
 
-def load_model():
-    """Load the classifier model if not already loaded."""
-    global model, vectorizer
-    if model is None:
-        if not os.path.exists(CLASSIFIER_MODEL_PATH):
+
+def _load(stamp):
+    active = model_registry.read_active() if stamp else None
+    if active:
+        version = active["version"]
+        path = model_registry.version_path(version)
+    else:
+        # No registry in use: the artifact at CLASSIFIER_MODEL_PATH, versioned by its content hash
+        path = CLASSIFIER_MODEL_PATH
+        if not os.path.exists(os.path.join(path, "meta.json")):
             raise FileNotFoundError(
-                f"Classifier model not found at {CLASSIFIER_MODEL_PATH}. "
+                f"Classifier model not found at {path}. "
                 "Run 'python app/train_classifier.py' to train the model."
             )
-        with open(CLASSIFIER_MODEL_PATH, "rb") as f:
-            model, vectorizer = pickle.load(f)
+        version = artifact_version(path)
+    return {"version": version, "artifact": load_artifact(path), "stamp": stamp}
+
+
+def active_model():
+    """The active model, switching to a newly activated registry version on first use after a swap."""
+    global _active
+    stamp = model_registry.active_stamp()
+    if _active is None:
+        _active = _load(stamp)
+    elif stamp != _active["stamp"]:
+        try:
+            _active = _load(stamp)
+        except Exception as e:
+            # Keep serving with the model we have rather than failing requests
+            print(f"Classifier reload warning, staying on {_active['version']}: {e}")
+            _active = {**_active, "stamp": stamp}
+    return _active
+
+
+def load_model():
+    """Load the classifier artifact (memory-mapped, see app/model_artifact.py) if not already loaded."""
+    active_model()
+
+
+def model_version():
+    """Version of the active classifier (registry version or artifact content hash), used to key cached results."""
+    return active_model()["version"]
+
+
+def classify_batch(texts):
+    """Classify a batch of texts with one sparse matrix product. Returns (model version, [(document type, confidence)])."""
+    model = active_model()
+    if not texts:
+        return model["version"], []
+    labels, confidences = predict(model["artifact"], list(texts))
+    return model["version"], [(str(label), float(confidence)) for label, confidence in zip(labels, confidences)]
+
+
+def classify_documents(texts):
+    """Classify a batch of texts. Returns [(document type, confidence)]."""
+    return classify_batch(texts)[1]
+
 
 def classify_document(text: str):
     """Classify document type and return prediction with confidence."""
+    return classify_documents([text])[0]
+
+
+def swap_model(version=None):
+    """Hot-swap to a registry version (default: the newest published one).
+
+    The new artifact is loaded and test-classified before it is activated, so a
+    broken version never goes live. Requests already running finish on the old
+    model; every process picks up the new one on its next classification.
+    Returns {"active", "previous"}.
+    """
+    if version is None:
+        versions = model_registry.list_versions()
+        if not versions:
+            raise LookupError("No model versions have been published to the registry")
+        version = versions[0]["version"]
+    return _activate(version, rollback=False)
+
+
+def rollback_model():
+    """Switch back to the version that was active before the current one. Returns {"active", "previous"}."""
+    version = model_registry.rollback_target()
+    if version is None:
+        raise LookupError("There is no earlier model version to roll back to")
+    return _activate(version, rollback=True)
+
+
+def _activate(version, rollback):
+    predict(load_artifact(model_registry.version_path(version)), [WARM_UP_TEXT])
+    previous = model_registry.activate(version, rollback=rollback)
+    active_model()
+    return {"active": version, "previous": previous}
+
+
+def warm_up():
+    """Load the model and run one dummy prediction. Returns timings in ms."""
+    started = time.perf_counter()
     load_model()
-    vec = vectorizer.transform([text])
-    pred = model.predict(vec)[0]
-    probabilities = model.predict_proba(vec)[0]
-    confidence = float(max(probabilities))
-    return pred, confidence
+    loaded = time.perf_counter()
+    classify_document(WARM_UP_TEXT)
+    done = time.perf_counter()
+    return {"load_ms": round(1000 * (loaded - started), 1), "first_inference_ms": round(1000 * (done - loaded), 1)}
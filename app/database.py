@@ -1,18 +1,37 @@
 # app/database.py
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import (create_engine, event, insert, inspect, select, text, Column, Integer, String, Text, DateTime,
+                        JSON, LargeBinary, Float, ForeignKey, Index)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 try:
-    from .config import DATABASE_URL
+    from .config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
 except ImportError:
-    from config import DATABASE_URL
+    from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
 import datetime
 import json
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, echo=False)
+
+
+def _engine_options(url):
+    if url.startswith("sqlite"):
+        # The write-behind persister and request threads share connections
+        return {"connect_args": {"check_same_thread": False}}
+    # Keep warm connections for the persister and job queue; drop ones the server closed
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True}
+
+
+engine = create_engine(DATABASE_URL, echo=False, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine)
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(conn, _):
+        # WAL lets readers run during a bulk insert; NORMAL syncs at checkpoints, not every commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
 class Document(Base):
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, index=True)
@@ -21,15 +40,123 @@ class Document(Base):
     raw_text = Column(Text, nullable=True)
     extracted = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (
+        Index("documents_doc_type_id", "doc_type", "id"),
+        Index("documents_created_at", "created_at"),
+    )
+
+class DocumentField(Base):
+    """One extracted value of a document (one row per list element), for GET /documents field filters."""
+    __tablename__ = "document_fields"
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(64), nullable=False)
+    value = Column(String(200), nullable=True)  # lower-cased text, ISO dates compare correctly as text
+    number = Column(Float, nullable=True)
+    # Search walks documents newest first and probes each one's fields, so the index leads with document_id
+    __table_args__ = (
+        Index("document_fields_lookup", "document_id", "name", "number", "value"),
+    )
+
+class Job(Base):
+    """An asynchronous /jobs request. Workers claim queued jobs by taking a time-limited lease."""
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    status = Column(String(16), nullable=False, default="queued", index=True)  # queued, running, done, failed
+    filename = Column(String, nullable=True)
+    content_type = Column(String, nullable=True)
+    payload = Column(LargeBinary, nullable=True)  # uploaded file, cleared once the job finishes
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+# Full-text index on documents.raw_text, kept up to date by the database itself on every insert
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE documents_fts USING fts5(raw_text, content='documents', content_rowid='id')",
+    "CREATE TRIGGER documents_fts_insert AFTER INSERT ON documents BEGIN "
+    "INSERT INTO documents_fts(rowid, raw_text) VALUES (new.id, new.raw_text); END",
+    "CREATE TRIGGER documents_fts_delete AFTER DELETE ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, raw_text) VALUES ('delete', old.id, old.raw_text); END",
+    "CREATE TRIGGER documents_fts_update AFTER UPDATE OF raw_text ON documents BEGIN "
+    "INSERT INTO documents_fts(documents_fts, rowid, raw_text) VALUES ('delete', old.id, old.raw_text); "
+    "INSERT INTO documents_fts(rowid, raw_text) VALUES (new.id, new.raw_text); END",
+    "INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')",  # index rows that predate the table
+]
+POSTGRES_FTS = [
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(raw_text, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS documents_search_vector ON documents USING GIN (search_vector)",
+]
 
 def init_db():
+    new_field_index = not inspect(engine).has_table(DocumentField.__tablename__)
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes of tables that already existed
+    for index in list(Document.__table__.indexes) + list(DocumentField.__table__.indexes):
+        index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            if not conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'")).first():
+                for statement in SQLITE_FTS:
+                    conn.execute(text(statement))
+        elif engine.dialect.name == "postgresql":
+            for statement in POSTGRES_FTS:
+                conn.execute(text(statement))
+        if new_field_index:
+            _backfill_fields(conn)
+
+def _backfill_fields(conn, chunk_size=1000):
+    """Index the extracted fields of documents saved before document_fields existed."""
+    last_id = 0
+    while True:
+        rows = conn.execute(select(Document.id, Document.extracted).where(Document.id > last_id)
+                            .order_by(Document.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        fields = [field for doc_id, extracted in rows for field in field_rows(doc_id, extracted)]
+        if fields:
+            conn.execute(insert(DocumentField), fields)
+        last_id = rows[-1][0]
+
+def field_rows(document_id, extracted):
+    """document_fields rows for the values of an extracted dict."""
+    rows = []
+    for name, value in (extracted or {}).items():
+        if name == "type":
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or isinstance(item, (dict, list)):
+                continue
+            number = float(item) if isinstance(item, (int, float)) and not isinstance(item, bool) else None
+            rows.append({"document_id": document_id, "name": name[:64], "value": str(item).lower()[:200],
+                         "number": number})
+    return rows
 
 def save_document(filename: str, doc_type: str, raw_text: str, extracted: dict):
     db = SessionLocal()
     doc = Document(filename=filename, doc_type=doc_type, raw_text=raw_text, extracted=extracted)
     db.add(doc)
+    db.flush()
+    fields = field_rows(doc.id, extracted)
+    if fields:
+        db.execute(insert(DocumentField), fields)
     db.commit()
     db.refresh(doc)
     db.close()
     return doc.id
+
+def save_documents(records):
+    """Insert many documents (dicts of Document columns) in one transaction: one round trip and one commit."""
+    if not records:
+        return
+    now = datetime.datetime.utcnow()
+    rows = [{"created_at": now, **record} for record in records]
+    with engine.begin() as conn:
+        ids = conn.execute(insert(Document).returning(Document.id, sort_by_parameter_order=True), rows).scalars().all()
+        fields = [field for doc_id, row in zip(ids, rows) for field in field_rows(doc_id, row.get("extracted"))]
+        if fields:
+            conn.execute(insert(DocumentField), fields)
@@ -1,222 +1,266 @@
+"""
+Field extraction for classified documents.
+
+Each document type has a list of field specs in FIELD_SPECS; they are compiled
+once at import. Extracting a document lowers its text once and runs each
+compiled pattern over it at most once, however many fields share the pattern
+(invoice_total and amounts_found, for example). Keyword fields (skills,
+education) are substring tests against the same lowered text, one per distinct
+word however many fields list it.
+
+Case-insensitive patterns are written in lower case and run case-sensitively
+against the lowered text, which lets the regex engine use its fast literal
+search; captured values are cut from the original text so their case is kept.
+Adding a field means adding a spec below.
+"""
 import re
 from datetime import datetime
 
-def extract_invoice(text):
-    """Extract invoice fields with improved patterns."""
-    extracted = {}
-    
-    # Find invoice number - various patterns
-    invoice_patterns = [
-        r"Invoice\s*(?:number|#|no\.?)[\s:]*([A-Z0-9-]+)",
-        r"Involce\s*(?:number|#|no\.?)[\s:]*([A-Z0-9-]+)",  # Handle OCR typo
-        r"Invoice[\s:]+([A-Z0-9-]+)",
-    ]
-    for pattern in invoice_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            extracted["invoice_number"] = match.group(1)
-            break
-    
-    # Find account number
-    account_patterns = [
-        r"Account\s*(?:number|#|no\.?)[\s:]*([A-Z0-9-]+)",
-    ]
-    for pattern in account_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            extracted["account_number"] = match.group(1)
-            break
-    
-    # Find total/subtotal - look for dollar amounts
-    total_patterns = [
-        r"(?:Sub)?total[\s:]*\$?([\d,]+\.?\d*)",
-        r"Total[\s:]*\$?([\d,]+\.?\d*)",
-        r"Amount[\s:]*\$?([\d,]+\.?\d*)",
-    ]
-    totals = []
-    for pattern in total_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            amount = match.replace(',', '')
+# Bump whenever extraction output changes, so cached results are not reused
+EXTRACTOR_VERSION = "1"
+
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%B %d, %Y")
+DOB_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%d-%m-%Y", "%d/%m/%Y")
+AMOUNT = r"\$?([\d,]+\.?\d*)"
+# Characters that IGNORECASE matches against ASCII letters but lower() leaves alone
+UNFOLDED_CHARS = ("\u0131", "\u017f")
+
+
+def field(name, *patterns, many=False, case_sensitive=False, flags=0, convert=None):
+    """Spec for a regex field. Each pattern captures the value in group 1.
+
+    With many=False the first pattern that matches anywhere wins and convert
+    gets its first match; with many=True convert gets every match of every
+    pattern, in pattern order. A field whose converted value is None is left out.
+    """
+    return {"name": name, "patterns": patterns, "many": many, "case_sensitive": case_sensitive,
+            "flags": flags, "convert": convert}
+
+
+def keywords(name, words):
+    """Spec for a keyword field: the words found anywhere in the text (case-insensitive), in list order."""
+    return {"name": name, "words": words}
+
+
+def _parse_dates(dates, formats):
+    parsed = []
+    for d in dates:
+        for fmt in formats:
             try:
-                totals.append(float(amount))
-            except:
-                pass
-
-    if totals:
-        extracted["invoice_total"] = max(totals)  # choose largest as total
-        extracted["amounts_found"] = sorted(set(totals), reverse=True)[:5]
-    
-    # Find dates
-    date_patterns = [
-        r"\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b",
-        r"\b(\d{4}[-/]\d{1,2}[-/]\d{1,2})\b",
-    ]
-    dates = []
-    for pattern in date_patterns:
-        dates.extend(re.findall(pattern, text))
-    def _parse_date_list(dates_list):
-        parsed = []
-        for d in dates_list:
-            for fmt in ("%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%B %d, %Y"):
-                try:
-                    dt = datetime.strptime(d, fmt)
-                    parsed.append(dt.date().isoformat())
-                    break
-                except Exception:
-                    continue
-        return parsed
-
-    if dates:
-        extracted_dates = _parse_date_list(dates)
-        if extracted_dates:
-            extracted["date"] = extracted_dates[0]
+                parsed.append(datetime.strptime(d, fmt).date().isoformat())
+                break
+            except ValueError:
+                continue
+    return parsed
+
+
+def _amounts(values):
+    amounts = []
+    for value in values:
+        try:
+            amounts.append(float(value.replace(',', '')))
+        except ValueError:
+            pass
+    return amounts
+
+
+def _section_amounts(section):
+    return [amt.replace(',', '') for amt in re.findall(AMOUNT, section) if amt]
+
+
+def _first_date(dates):
+    parsed = _parse_dates(dates, DATE_FORMATS)
+    return parsed[0] if parsed else None
+
+
+def _unparsed_dates(dates):
+    if dates and not _parse_dates(dates, DATE_FORMATS):
+        return dates[:3]
+    return None
+
+
+def _dob(value):
+    parsed = _parse_dates([value], DOB_FORMATS)
+    return parsed[0] if parsed else value
+
+
+SKILLS = ['Python', 'Java', 'JavaScript', 'C++', 'React', 'Node', 'SQL', 'AWS',
+          'Docker', 'Kubernetes', 'Angular', 'Vue', 'TypeScript', 'Git']
+EDUCATION = ['Bachelor', 'Master', 'PhD', 'Degree', 'University', 'College']
+TOTAL_PATTERNS = (r"total[\s:]*" + AMOUNT, r"amount[\s:]*" + AMOUNT)  # "total" also covers "subtotal"
+DATE_PATTERNS = (r"\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})\b", r"\b(\d{4}[-/]\d{1,2}[-/]\d{1,2})\b")
+
+FIELD_SPECS = {
+    "invoice": [
+        field("invoice_number",
+              r"invoice\s*(?:number|#|no\.?)[\s:]*([a-z0-9-]+)",
+              r"involce\s*(?:number|#|no\.?)[\s:]*([a-z0-9-]+)",  # Handle OCR typo
+              r"invoice[\s:]+([a-z0-9-]+)"),
+        field("account_number", r"account\s*(?:number|#|no\.?)[\s:]*([a-z0-9-]+)"),
+        field("invoice_total", *TOTAL_PATTERNS, many=True,
+              convert=lambda values: max(_amounts(values), default=None)),  # choose largest as total
+        field("amounts_found", *TOTAL_PATTERNS, many=True,
+              convert=lambda values: sorted(set(_amounts(values)), reverse=True)[:5] or None),
+        field("date", *DATE_PATTERNS, many=True, convert=_first_date),
+        field("dates_found", *DATE_PATTERNS, many=True, convert=_unparsed_dates),
+        field("labor_costs", r"labor.*?amount\s*(.*?)(?:material|subtotal|\Z)", flags=re.DOTALL,
+              convert=_section_amounts),
+        field("material_costs", r"material.*?amount\s*(.*?)(?:subtotal|total|\Z)", flags=re.DOTALL,
+              convert=_section_amounts),
+    ],
+    "cv": [
+        keywords("skills", SKILLS),
+        keywords("technologies", SKILLS),
+        field("experience",
+              r"(\d+)\+?\s*years?\s*(?:of)?\s*experience",
+              r"experience[:\s]*(\d+)\+?\s*years?",
+              convert=int),
+        keywords("education_keywords", EDUCATION),
+    ],
+    "id_card": [
+        field("name",
+              r"Name[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)",
+              r"Full\s*Name[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)",
+              case_sensitive=True),
+        field("dob",
+              r"(?:dob|date of birth|birth date)[\s:]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+              r"born[\s:]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+              convert=_dob),
+        field("id_number",
+              r"id[\s#:]*([a-z0-9-]+)",
+              r"(?:card|license)\s*(?:number|#)[\s:]*([a-z0-9-]+)"),
+        field("address", r"address[:\s]+(.+)", r"addr[:\s]+(.+)", r"residence[:\s]+(.+)",
+              convert=str.strip),
+    ],
+}
+
+# What extract_fields returns per document type, with defaults for fields that weren't found
+OUTPUT_FIELDS = {
+    "invoice": {"company": None, "invoice_total": None, "tax": None, "date": None},
+    "cv": {"skills": [], "experience": None, "technologies": []},
+    "id_card": {"name": None, "dob": None, "address": None},
+}
+
+# Fields whose absence keeps incremental OCR (OCR_EARLY_EXIT) reading further pages
+KEY_FIELDS = {
+    "invoice": ("invoice_total", "date"),
+    "cv": ("skills", "experience"),
+    "id_card": ("name", "dob"),
+}
+
+# Where two-pass OCR (OCR_TWO_PASS) needs full-resolution text: the header and the lines
+# mentioning these labels. Types not listed get their whole text re-OCR'd.
+FINE_REGIONS = {
+    "invoice": {"header": 0.25, "keywords": ("invoice", "involce", "account", "total", "amount", "date",
+                                             "labor", "material")},
+}
+
+
+def _compile(specs):
+    """Compile a document type's specs, sharing one compiled pattern between fields that use it."""
+    patterns = {}
+    fields = []
+    words = set()
+    for spec in specs:
+        if "words" in spec:
+            words.update(word.lower() for word in spec["words"])
+            fields.append(spec)
+            continue
+        keys = []
+        for source in spec["patterns"]:
+            key = (source, spec["flags"], spec["case_sensitive"])
+            if key not in patterns:
+                patterns[key] = {
+                    "regex": re.compile(source, spec["flags"]),
+                    # For text whose lowered form doesn't line up with IGNORECASE matching
+                    "fallback": re.compile(source, spec["flags"] | re.IGNORECASE),
+                    "case_sensitive": spec["case_sensitive"],
+                    "many": False,
+                }
+            patterns[key]["many"] |= spec["many"]
+            keys.append(key)
+        fields.append({**spec, "patterns": [patterns[key] for key in keys]})
+    return {"fields": fields, "words": sorted(words)}
+
+
+COMPILED_SPECS = {doc_type: _compile(specs) for doc_type, specs in FIELD_SPECS.items()}
+
+
+def _run(pattern, text, lowered, memo):
+    """Group 1 of each match of a compiled pattern (only the first unless a many-field uses it)."""
+    key = id(pattern)
+    if key in memo:
+        return memo[key]
+    if pattern["case_sensitive"]:
+        regex, target, source = pattern["regex"], text, text
+    elif lowered is not None:
+        regex, target, source = pattern["regex"], lowered, text
+    else:
+        regex, target, source = pattern["fallback"], text, text
+    if pattern["many"]:
+        values = [source[m.start(1):m.end(1)] for m in regex.finditer(target)]
+    else:
+        m = regex.search(target)
+        values = [source[m.start(1):m.end(1)]] if m else []
+    memo[key] = values
+    return values
+
+
+def scan(doc_type, text):
+    """Extract every field specified for doc_type from text. Fields that weren't found are left out."""
+    compiled = COMPILED_SPECS.get(doc_type)
+    if compiled is None:
+        return {}
+    lowered = text.lower()
+    found = {word for word in compiled["words"] if word in lowered}
+    if not text.isascii() and (len(lowered) != len(text) or any(c in text for c in UNFOLDED_CHARS)):
+        lowered = None
+    memo = {}
+    extracted = {}
+    for spec in compiled["fields"]:
+        if "words" in spec:
+            value = [word for word in spec["words"] if word.lower() in found] or None
+        elif spec["many"]:
+            values = []
+            for pattern in spec["patterns"]:
+                values.extend(_run(pattern, text, lowered, memo))
+            value = spec["convert"](values) if spec["convert"] else values
         else:
-            extracted["dates_found"] = dates[:3]
-    
-    # Find labor/hourly rates
-    labor_pattern = r"LABOR.*?AMOUNT\s*(.*?)(?:MATERIAL|Subtotal|\Z)"
-    labor_match = re.search(labor_pattern, text, re.DOTALL | re.IGNORECASE)
-    if labor_match:
-        labor_section = labor_match.group(1)
-        # Extract amounts from labor section
-        labor_amounts = re.findall(r"\$?([\d,]+\.?\d*)", labor_section)
-        extracted["labor_costs"] = [amt.replace(',', '') for amt in labor_amounts if amt]
-    
-    # Find material costs
-    material_pattern = r"MATERIAL.*?AMOUNT\s*(.*?)(?:Subtotal|Total|\Z)"
-    material_match = re.search(material_pattern, text, re.DOTALL | re.IGNORECASE)
-    if material_match:
-        material_section = material_match.group(1)
-        material_amounts = re.findall(r"\$?([\d,]+\.?\d*)", material_section)
-        extracted["material_costs"] = [amt.replace(',', '') for amt in material_amounts if amt]
-    
+            value = None
+            for pattern in spec["patterns"]:
+                values = _run(pattern, text, lowered, memo)
+                if values:
+                    value = spec["convert"](values[0]) if spec["convert"] else values[0]
+                    break
+        if value is not None:
+            extracted[spec["name"]] = value
     return extracted
 
+
+def extract_invoice(text):
+    """Extract invoice fields."""
+    return scan("invoice", text)
+
+
 def extract_cv(text):
     """Extract CV/Resume fields."""
-    extracted = {}
-    
-    # Find skills - common programming languages and technologies
-    common_skills = ['Python', 'Java', 'JavaScript', 'C++', 'React', 'Node', 'SQL', 'AWS', 
-                     'Docker', 'Kubernetes', 'Angular', 'Vue', 'TypeScript', 'Git']
-    found_skills = [skill for skill in common_skills if skill.lower() in text.lower()]
-    if found_skills:
-        extracted["skills"] = found_skills
-        extracted["technologies"] = found_skills
-    
-    # Find years of experience
-    experience_patterns = [
-        r"(\d+)\+?\s*years?\s*(?:of)?\s*experience",
-        r"experience[:\s]*(\d+)\+?\s*years?",
-    ]
-    for pattern in experience_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            # take first match and convert to int if possible
-            try:
-                extracted["experience"] = int(matches[0])
-            except:
-                extracted["experience"] = matches
-            break
-    
-    # Find education
-    education_keywords = ['Bachelor', 'Master', 'PhD', 'Degree', 'University', 'College']
-    education = [keyword for keyword in education_keywords if keyword.lower() in text.lower()]
-    if education:
-        extracted["education_keywords"] = education
-    
-    return extracted
+    return scan("cv", text)
+
 
 def extract_id(text):
     """Extract ID card fields."""
-    extracted = {}
-    
-    # Find name patterns
-    name_patterns = [
-        r"Name[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)",
-        r"Full\s*Name[\s:]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)",
-    ]
-    for pattern in name_patterns:
-        match = re.search(pattern, text)
-        if match:
-            extracted["name"] = match.group(1)
-            break
-    
-    # Find date of birth
-    dob_patterns = [
-        r"(?:DOB|Date of Birth|Birth Date)[\s:]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-        r"Born[\s:]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-    ]
-    for pattern in dob_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            dob_raw = match.group(1)
-            # try to normalize to ISO
-            for fmt in ("%m/%d/%Y", "%m/%d/%y", "%d-%m-%Y", "%d/%m/%Y"):
-                try:
-                    dob_dt = datetime.strptime(dob_raw, fmt)
-                    extracted["dob"] = dob_dt.date().isoformat()
-                    break
-                except Exception:
-                    continue
-            else:
-                extracted["dob"] = dob_raw
-            break
-    
-    # Find ID number
-    id_patterns = [
-        r"ID[\s#:]*([A-Z0-9-]+)",
-        r"(?:Card|License)\s*(?:Number|#)[\s:]*([A-Z0-9-]+)",
-    ]
-    for pattern in id_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            extracted["id_number"] = match.group(1)
-            break
-
-    # Try to extract address
-    addr_patterns = [r"Address[:\s]+(.+)", r"Addr[:\s]+(.+)", r"Residence[:\s]+(.+)"]
-    for pattern in addr_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            extracted["address"] = match.group(1).strip()
-            break
-    
-    return extracted
+    return scan("id_card", text)
 
 
 def extract_fields(doc_type, text):
     # Return a clean structured JSON depending on document type
-    if doc_type == "invoice":
-        inv = extract_invoice(text)
-        out = {
-            "type": "invoice",
-            "company": inv.get("company") if inv.get("company") else None,
-            "invoice_total": inv.get("invoice_total"),
-            "tax": inv.get("tax"),
-            "date": inv.get("date"),
-        }
-        # remove None keys
-        return {k: v for k, v in out.items() if v is not None}
-    elif doc_type == "cv":
-        cv = extract_cv(text)
-        out = {
-            "type": "cv",
-            "skills": cv.get("skills", []),
-            "experience": cv.get("experience"),
-            "technologies": cv.get("technologies", []),
-        }
-        # Keep keys that are explicitly set (including experience when 0)
-        return {k: v for k, v in out.items() if v is not None}
-    elif doc_type == "id_card":
-        idc = extract_id(text)
-        out = {
-            "type": "id_card",
-            "name": idc.get("name"),
-            "dob": idc.get("dob"),
-            "address": idc.get("address"),
-        }
-        return {k: v for k, v in out.items() if v is not None}
-    else:
+    if doc_type not in OUTPUT_FIELDS:
         return {"message": "No extractor matched"}
+    extracted = scan(doc_type, text)
+    out = {"type": doc_type}
+    for name, default in OUTPUT_FIELDS[doc_type].items():
+        value = extracted.get(name, default)
+        # Keep keys that are explicitly set (including experience when 0)
+        if value is not None:
+            out[name] = value
+    return out
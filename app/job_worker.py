@@ -0,0 +1,121 @@
+"""
+Job worker: claims jobs queued through POST /jobs and runs the document pipeline on them.
+
+Jobs go through the same pipeline as /process (pipeline.build_pipeline): the
+result cache, OCR, classification and extraction in a process pool, and saving
+the document (Supabase, the documents table or the result log, see
+persistence.save_result). The result is then written back to the job. Up to JOB_WORKER_CONCURRENCY jobs run at
+once, and a job is only claimed when there is room for it, so a busy worker
+never holds leases on jobs it hasn't started.
+
+Run one per machine (it uses OCR_POOL_SIZE processes), pointing DATABASE_URL
+at the shared database:
+    python -m app.job_worker
+"""
+import asyncio
+import os
+import socket
+import threading
+import traceback
+import uuid
+from pathlib import Path
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+try:
+    from .config import JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, JOB_WORKER_CONCURRENCY
+    from .database import init_db
+    from .jobs import claim_job, renew_lease, finish_job
+    from .pipeline import PROCESS, build_pipeline
+    from .workers import shutdown_pool
+    from . import persistence, supabase_io
+except ImportError:
+    from config import JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, JOB_WORKER_CONCURRENCY
+    from database import init_db
+    from jobs import claim_job, renew_lease, finish_job
+    from pipeline import PROCESS, build_pipeline
+    from workers import shutdown_pool
+    import persistence, supabase_io
+
+
+def _keep_lease(job_id, worker_id, done):
+    """Renew the lease every third of its length until the job is done."""
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            if not renew_lease(job_id, worker_id):
+                print(f"Lost lease on job {job_id}")
+                return
+        except Exception as e:
+            print(f"Lease renewal warning for job {job_id}: {e}")
+
+
+def finish(doc, error):
+    """Write the outcome of a pipeline run back to its job. Documents without text fail for good,
+    other errors (a busy pool, a database hiccup) put the job back in the queue."""
+    if isinstance(error, HTTPException):
+        finish_job(doc["job_id"], doc["worker_id"], error=error.detail)
+        return
+    if error is not None:
+        finish_job(doc["job_id"], doc["worker_id"], error=f"Processing error: {str(error)}", retry=True)
+        return
+    result = doc["result"]
+    finish_job(doc["job_id"], doc["worker_id"], result={
+        "document_type": result["document_type"],
+        "confidence": result["confidence"],
+        "extracted_data": result["extracted"],
+        "raw_text": result["cleaned"][:500],
+        "pages": result["pages"],
+        "pages_read": result.get("pages_read", len(result["pages"])),
+        "stop_reason": result.get("stop_reason"),
+        "model_version": result.get("model_version"),
+        "near_duplicate": result.get("near_duplicate"),
+        "cached": doc.get("cached", False),
+    })
+
+
+job_pipeline = build_pipeline([PROCESS])
+
+
+async def claimed_jobs(worker_id):
+    """Claim jobs one at a time, forever, as documents for job_pipeline. Each keeps its lease until done."""
+    while True:
+        try:
+            job = await run_in_threadpool(claim_job, worker_id)
+        except Exception as e:
+            print(f"Job claim warning: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        job_id, filename, content_type, payload = job
+        print(f"Processing job {job_id} ({filename})")
+        done = threading.Event()
+        threading.Thread(target=_keep_lease, args=(job_id, worker_id, done), daemon=True).start()
+        yield {"job_id": job_id, "worker_id": worker_id, "filename": filename, "content_type": content_type,
+               "content": payload, "suffix": Path(filename or "").suffix.lower(), "lease_done": done}
+
+
+async def run(worker_id):
+    try:
+        async for doc, error in job_pipeline.run_many(claimed_jobs(worker_id), window=JOB_WORKER_CONCURRENCY):
+            if error is not None and not isinstance(error, HTTPException):
+                traceback.print_exception(error)
+            try:
+                await run_in_threadpool(finish, doc, error)
+            except Exception as e:
+                print(f"Could not finish job {doc['job_id']}: {e}")
+            doc["lease_done"].set()
+    finally:
+        shutdown_pool()
+        persistence.stop()
+        supabase_io.shutdown()
+
+
+def main():
+    init_db()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    print(f"Job worker {worker_id} started ({JOB_WORKER_CONCURRENCY} jobs at once)")
+    asyncio.run(run(worker_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# app/jobs.py
+"""
+Durable job queue on top of the SQLAlchemy layer in database.py.
+
+POST /jobs stores the upload in the jobs table and returns immediately; worker
+processes (python -m app.job_worker, on any machine that can reach the
+database) claim queued jobs by taking a lease. A claim is a conditional UPDATE,
+so only one worker can win a job on both SQLite and Postgres. Workers renew the
+lease while they run; if a worker crashes its lease expires and another worker
+picks the job up again, up to JOB_MAX_ATTEMPTS times.
+"""
+import datetime
+import uuid
+from sqlalchemy import select, update, or_, and_
+try:
+    from .database import SessionLocal, Job
+    from .config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+except ImportError:
+    from database import SessionLocal, Job
+    from config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def create_job(filename: str, content_type: str, content: bytes):
+    db = SessionLocal()
+    try:
+        job = Job(id=uuid.uuid4().hex, status="queued", filename=filename, content_type=content_type, payload=content)
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def get_job(job_id: str):
+    """Return the public view of a job, or None if it doesn't exist."""
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "filename": job.filename,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+            "result": job.result,
+            "error": job.error,
+        }
+    finally:
+        db.close()
+
+
+def _claimable(now):
+    lease_expired = and_(Job.status == "running", Job.lease_expires_at < now)
+    return or_(Job.status == "queued", lease_expired)
+
+
+def _fail_abandoned(db, now):
+    """Jobs whose lease expired too many times are given up on instead of retried forever."""
+    db.execute(
+        update(Job)
+        .where(Job.status == "running", Job.lease_expires_at < now, Job.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status="failed", error=f"Worker lease expired {JOB_MAX_ATTEMPTS} times",
+                payload=None, lease_owner=None, updated_at=now)
+    )
+    db.commit()
+
+
+def claim_job(worker_id: str):
+    """Lease the oldest claimable job to worker_id. Returns (id, filename, content_type, payload) or None."""
+    db = SessionLocal()
+    try:
+        now = _now()
+        _fail_abandoned(db, now)
+        candidates = db.execute(
+            select(Job.id).where(_claimable(now)).order_by(Job.created_at).limit(10)
+        ).scalars().all()
+        for job_id in candidates:
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, _claimable(now))
+                .values(status="running", lease_owner=worker_id, attempts=Job.attempts + 1,
+                        lease_expires_at=now + datetime.timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now)
+            ).rowcount
+            db.commit()
+            if claimed == 1:
+                job = db.get(Job, job_id)
+                return job.id, job.filename, job.content_type, job.payload
+        return None
+    finally:
+        db.close()
+
+
+def renew_lease(job_id: str, worker_id: str):
+    """Extend the lease. Returns False if the worker no longer owns the job."""
+    db = SessionLocal()
+    try:
+        now = _now()
+        renewed = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.lease_owner == worker_id, Job.status == "running")
+            .values(lease_expires_at=now + datetime.timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now)
+        ).rowcount
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def finish_job(job_id: str, worker_id: str, result=None, error=None, retry=False):
+    """Record a job's outcome, unless its lease was lost to another worker meanwhile.
+
+    With retry=True a failed job goes back to the queue while it has attempts left.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None or job.lease_owner != worker_id or job.status != "running":
+            return False
+        now = _now()
+        if error is not None and retry and job.attempts < JOB_MAX_ATTEMPTS:
+            job.status = "queued"
+        else:
+            job.status = "failed" if error is not None else "done"
+            job.payload = None
+        job.result = result
+        job.error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        db.commit()
+        return True
+    finally:
+        db.close()
@@ -1,28 +1,29 @@
-import os
-import tempfile
-from fastapi import FastAPI, UploadFile, HTTPException, File
+from fastapi import APIRouter, FastAPI, UploadFile, HTTPException, File, Request, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from supabase import create_client
-from .ocr import run_ocr
-from .classifier import classify_document
-from .extractor import extract_fields
-from .text_processor import clean_text
-from .config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, ALLOWED_EXTENSIONS, UPLOAD_MAX_SIZE
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from .workers import shutdown_pool, pool_stats, PoolBusy, warm_up_pool, pool_ready, warmup_report, PIPELINED_ANALYSIS
+from .pipeline import StageBusy, READ, PROCESS, OCR, ANALYZE, build_pipeline, pipeline_stats
+from . import cache, classifier, metrics, model_registry, near_dup, persistence, supabase_io
+from .classifier import model_version
+from .database import init_db
+from .search import search_documents
+from .jobs import create_job, get_job
+from .uploads import InMemoryUploadRoute, read_upload, reject_oversized, validate_extension
+import asyncio
+from .config import (RESULT_CACHE_ENABLED, BATCH_MAX_FILES, BATCH_OCR_CONCURRENCY, ADMIN_TOKEN,
+                     PERSIST_WRITE_BEHIND, NEAR_DUP_ENABLED)
 from dotenv import load_dotenv
 import traceback
+from contextlib import aclosing
+import hmac
 import time
-import uuid
 import json
-from pathlib import Path
+from datetime import datetime
+from typing import List, Optional
 
 load_dotenv()
 
-# Initialize Supabase 
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 app = FastAPI(title="Document Intelligence API", version="1.0.0")
 
 # Enable CORS for frontend
@@ -35,164 +36,293 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse uploads whose Content-Length is over the limit before reading the body."""
+    rejected = reject_oversized(request, ("/process", "/jobs"), batch_paths=("/process/batch",))
+    return rejected or await call_next(request)
+
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    """Count and time every request, and add the total to the Server-Timing header."""
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    path = route.path if route is not None else "other"  # the route template keeps /jobs/{job_id} one series
+    metrics.inc("docintel_requests_total", {"path": path, "status": response.status_code})
+    metrics.observe("docintel_request_seconds", {"path": path}, elapsed)
+    timing = response.headers.get("Server-Timing")
+    total = f"total;dur={1000 * elapsed:.1f}"
+    response.headers["Server-Timing"] = f"{timing}, {total}" if timing else total
+    return response
+
+
 @app.get("/")
 async def root():
     return {
         "message": "Document Intelligence API",
         "version": "1.0.0",
-        "endpoints": ["/process", "/health"]
+        "endpoints": ["/process", "/process/batch", "/jobs", "/documents", "/health", "/ready", "/stats", "/metrics",
+                      "/admin/model"]
     }
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "document-intelligence"}
 
-@app.post("/process")
-async def process_document(file: UploadFile = File(...)):
-    """Process uploaded document: OCR → Classify → Extract fields."""
-    
-    tmp_path = None
-    try:
-        # Validate file extension
-        file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File type {file_ext} not allowed. Allowed: {ALLOWED_EXTENSIONS}"
-            )
-        
-        # Read file content
-        content = await file.read()
-        
-        # Validate file size
-        if len(content) > UPLOAD_MAX_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Max size: {UPLOAD_MAX_SIZE / 1024 / 1024}MB"
-            )
-        
-        # Save temp file
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
-        tmp.write(content)
-        tmp.close()
-        tmp_path = tmp.name
-        
-        # Upload to Supabase Storage (optional). Use unique destination name to avoid overwrites.
-        file_url = None
-        storage_path = None
-        if supabase:
-            try:
-                dest_name = f"{int(time.time())}_{uuid.uuid4().hex}_{file.filename}"
-                upload_resp = supabase.storage.from_(SUPABASE_BUCKET).upload(dest_name, tmp_path, {"content-type": file.content_type})
-                print("Supabase upload response:", upload_resp)
-                # get_public_url may return different shapes depending on client version
-                public_resp = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(dest_name)
-                if isinstance(public_resp, dict):
-                    file_url = public_resp.get('publicUrl') or public_resp.get('publicURL') or public_resp.get('public_url')
-                else:
-                    file_url = str(public_resp)
-                storage_path = dest_name
-            except Exception as e:
-                print(f"Supabase upload warning: {e}")
-                file_url = None
-                storage_path = None
-        
-        # Step 1: OCR
-        text = run_ocr(tmp_path)
-        if not text or len(text.strip()) < 10:
-            raise HTTPException(status_code=400, detail="Could not extract text from document")
-        
-        # Step 2: Clean text
-        cleaned = clean_text(text)
-        
-        # Step 3: Classify
-        doc_type, confidence = classify_document(cleaned)
-        
-        # Step 4: Extract fields
-        extracted_json = extract_fields(doc_type, cleaned)
-        
-        # Save to Supabase DB (optional). If Supabase is not configured, append to a local JSONL fallback file.
-        if supabase:
-            try:
-                record = {
-                    "filename": file.filename,
-                    "storage_path": storage_path,
-                    "file_url": file_url,
-                    "document_type": doc_type,
-                    "extracted_text": cleaned[:1000],
-                    "extracted_json": extracted_json
-                }
-                insert_resp = supabase.table("documents").insert(record).execute()
-                print("Supabase insert response:", insert_resp)
-            except Exception as e:
-                print(f"Supabase DB warning: {e}")
-                # Try a reduced insert with only commonly-available columns (some schemas may not have extracted_json)
-                try:
-                    reduced = {
-                        "filename": file.filename,
-                        "document_type": doc_type,
-                        "original_url": file_url,
-                        "extracted_text": cleaned[:1000]
-                    }
-                    insert_resp2 = supabase.table("documents").insert(reduced).execute()
-                    print("Supabase reduced insert response:", insert_resp2)
-                except Exception as e2:
-                    print(f"Supabase reduced insert failed: {e2}")
-                    # On any Supabase failure, fall back to local persistence
-                    try:
-                        fallback = {
-                            "id": uuid.uuid4().hex,
-                            "timestamp": int(time.time()),
-                            "filename": file.filename,
-                            "storage_path": storage_path,
-                            "file_url": file_url,
-                            "document_type": doc_type,
-                            "extracted_text": cleaned[:1000],
-                            "extracted_json": extracted_json
-                        }
-                        with open("processed_documents.jsonl", "a", encoding="utf-8") as fh:
-                            fh.write(json.dumps(fallback, ensure_ascii=False) + "\n")
-                        print("Wrote fallback record to processed_documents.jsonl (after Supabase failure)")
-                    except Exception as e3:
-                        print(f"Local fallback write warning after Supabase failure: {e3}")
-        else:
-            # fallback local persistence (append JSONL)
-            try:
-                fallback = {
-                    "id": uuid.uuid4().hex,
-                    "timestamp": int(time.time()),
-                    "filename": file.filename,
-                    "document_type": doc_type,
-                    "extracted_text": cleaned[:1000],
-                    "extracted_json": extracted_json,
-                    "file_url": None
-                }
-                with open("processed_documents.jsonl", "a", encoding="utf-8") as fh:
-                    fh.write(json.dumps(fallback, ensure_ascii=False) + "\n")
-                print("Wrote fallback record to processed_documents.jsonl")
-            except Exception as e:
-                print(f"Local fallback write warning: {e}")
-        
+@app.get("/ready")
+async def readiness_check():
+    """Ready only once every pool worker has loaded and warmed its models."""
+    report = warmup_report()
+    if not pool_ready():
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+@app.get("/stats")
+async def stats():
+    """Worker pool queue depth and wait times, result cache hit/miss counts, persistence batches."""
+    stats = {"pool": pool_stats()}
+    if PERSIST_WRITE_BEHIND:
+        stats["persistence"] = persistence.persistence_stats()
+    if supabase_io.ENABLED:
+        stats["supabase"] = supabase_io.supabase_stats()
+    if RESULT_CACHE_ENABLED:
+        stats["cache"] = await run_in_threadpool(cache.cache_stats)
+    if NEAR_DUP_ENABLED:
+        stats["near_duplicates"] = await run_in_threadpool(near_dup.near_dup_stats)
+    stats["pipeline"] = pipeline_stats(process_pipeline, batch_pipeline)
+    return stats
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, OCR engine and fallback counters and request metrics, in Prometheus format."""
+    pool = pool_stats()
+    gauges = {
+        "docintel_pool_running": ("Documents being processed by the worker pool", pool["running"]),
+        "docintel_pool_queued": ("Documents waiting for a pool worker", pool["queued"]),
+    }
+    if PERSIST_WRITE_BEHIND:
+        gauges["docintel_persist_queued"] = ("Results waiting to be written to the database",
+                                             persistence.persistence_stats()["queued"])
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+def require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/model")
+async def model_status():
+    """Active classifier version in this process, the registry's versions and rollback history."""
+    def status():
         return {
-            "success": True,
-            "filename": file.filename,
-            "document_type": doc_type,
-            "confidence": confidence,
-            "extracted_data": extracted_json,
-            "raw_text": cleaned[:500],  
-            "file_url": file_url
+            "model_version": model_version(),
+            "registry": model_registry.read_active(),
+            "versions": model_registry.list_versions(),
         }
-    
+    return await run_in_threadpool(status)
+
+async def _switch_model(switch, *args):
+    try:
+        switched = await run_in_threadpool(switch, *args)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Model swap failed, still on {model_version()}: {str(e)}")
+    print(f"Classifier model switched from {switched['previous']} to {switched['active']}")
+    return switched
+
+@app.post("/admin/model/swap")
+async def swap_model(version: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """Load a registry version (default: newest) in the background and switch every worker to it."""
+    require_admin(x_admin_token)
+    return await _switch_model(classifier.swap_model, version)
+
+@app.post("/admin/model/rollback")
+async def rollback_model(x_admin_token: Optional[str] = Header(None)):
+    """Switch back to the previously active model version."""
+    require_admin(x_admin_token)
+    return await _switch_model(classifier.rollback_model)
+
+@app.on_event("startup")
+async def startup():
+    try:
+        init_db()
+    except Exception as e:
+        print(f"Database warning: {e}")
+    try:
+        model_version()
+    except Exception as e:
+        print(f"Classifier model warning: {e}")
+    # Warm up in the background so /health answers immediately while /ready stays 503
+    app.state.warmup_task = asyncio.create_task(warm_up_pool())
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_pool()
+    persistence.stop()
+    supabase_io.shutdown()
+
+def build_response(filename, result, file_url=None, cached=False):
+    return {
+        "success": True,
+        "filename": filename,
+        "document_type": result["document_type"],
+        "confidence": result["confidence"],
+        "extracted_data": result["extracted"],
+        "raw_text": result["cleaned"][:500],
+        "file_url": file_url,
+        "pages": result["pages"],
+        "pages_read": result.get("pages_read", len(result["pages"])),
+        "stop_reason": result.get("stop_reason"),
+        "model_version": result.get("model_version"),
+        "near_duplicate": result.get("near_duplicate"),
+        "cached": cached
+    }
+
+
+def record_trace(trace, body):
+    """Record a finished request's trace under its document type, and its pages unless it was cached."""
+    if body and body.get("success"):
+        metrics.record(trace, body["document_type"], None if body["cached"] else body["pages"])
+    else:
+        metrics.record(trace)
+
+
+# /process runs the whole analysis in the pool worker. /process/batch OCRs in the pool and
+# analyzes here, so the pool starts on the next file meanwhile (unless analysis has to
+# happen between OCR steps, see PIPELINED_ANALYSIS).
+process_pipeline = build_pipeline([PROCESS], intake=[READ])
+batch_pipeline = build_pipeline([OCR, ANALYZE] if PIPELINED_ANALYSIS else [PROCESS], intake=[READ])
+
+# Single-file uploads are parsed into memory; /process/batch keeps Starlette's spooling to disk
+single_file = APIRouter(route_class=InMemoryUploadRoute)
+
+
+@single_file.post("/process")
+async def process_document(response: Response, file: UploadFile = File(...)):
+    """Process uploaded document: OCR → Classify → Extract fields.
+
+    Stage timings are recorded for /metrics and returned in the Server-Timing header.
+    """
+    doc = {"file": file, "trace": metrics.new_trace()}
+    body = None
+    try:
+        body = await _process_document(doc)
+    finally:
+        record_trace(doc["trace"], body)
+    response.headers["Server-Timing"] = metrics.server_timing(doc["trace"])
+    return body
+
+
+async def _process_document(doc):
+    try:
+        await process_pipeline.run(doc)
+        return build_response(doc["file"].filename, doc["result"], doc.get("file_url"), cached=doc.get("cached", False))
+
+    except (PoolBusy, StageBusy) as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy processing other documents, please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except HTTPException:
         raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
-    
-    finally:
-        # Cleanup temp file
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
+
+
+def batch_line(doc, error):
+    """The result line of one file of a batch. Errors become an error line, never an exception."""
+    index, filename = doc["index"], doc["file"].filename
+    if error is None:
+        return {"index": index, **build_response(filename, doc["result"], doc.get("file_url"),
+                                                 cached=doc.get("cached", False))}
+    if isinstance(error, HTTPException):
+        status_code, message = error.status_code, error.detail
+    elif isinstance(error, (PoolBusy, StageBusy)):
+        status_code, message = 503, str(error)
+    else:
+        traceback.print_exception(error)
+        status_code, message = 500, f"Processing error: {str(error)}"
+    return {"index": index, "success": False, "filename": filename, "status_code": status_code, "error": message}
+
+
+@app.post("/process/batch")
+async def process_batch(files: List[UploadFile] = File(...)):
+    """Process many documents in one request, streaming one NDJSON result line per document.
+
+    Files are pipelined: while the worker pool OCRs one file, the previous one is
+    classified, extracted and persisted. Lines are emitted in completion order and
+    carry the file's "index" in the upload; a failed file produces an error line
+    without failing the rest of the batch. The last line is a summary.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files. Max per batch: {BATCH_MAX_FILES}")
+
+    async def results():
+        docs = [{"index": i, "file": f, "trace": metrics.new_trace()} for i, f in enumerate(files)]
+        succeeded = 0
+        # BATCH_OCR_CONCURRENCY files of the batch hold pool workers at most; as many more are
+        # read and looked up, or analyzed and persisted, around them
+        runs = batch_pipeline.run_many(docs, window=2 * BATCH_OCR_CONCURRENCY,
+                                       limits={"ocr": BATCH_OCR_CONCURRENCY, "process": BATCH_OCR_CONCURRENCY})
+        async with aclosing(runs):
+            async for doc, error in runs:
+                line = batch_line(doc, error)
+                record_trace(doc["trace"], line)
+                succeeded += line["success"]
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": True, "total": len(files), "succeeded": succeeded, "failed": len(files) - succeeded}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@single_file.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Queue a document for asynchronous processing and return its job id straight away."""
+    file_ext = validate_extension(file.filename)
+    content = await read_upload(file)
+    try:
+        job_id = await run_in_threadpool(create_job, file.filename, file.content_type, content)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Could not queue job: {str(e)}")
+    return {"job_id": job_id, "status": "queued", "filename": file.filename}
+
+
+app.include_router(single_file)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of a queued job, and its result once it is done."""
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/documents")
+async def list_documents(q: Optional[str] = None, document_type: Optional[str] = None,
+                         created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                         field: List[str] = Query([]), cursor: Optional[str] = None,
+                         limit: int = Query(20, ge=1, le=100)):
+    """Search processed documents, newest first.
+
+    q is a full-text query over the OCR text; each field parameter filters on an
+    extracted value (field=invoice_total>=100&field=skills=python). Pass
+    next_cursor back as cursor for the next page.
+    """
+    try:
+        return await run_in_threadpool(search_documents, q, document_type, created_from, created_to, field,
+                                       cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,170 @@
+"""
+Stage timings and counters, exposed in the Prometheus text format on /metrics.
+
+Each document is traced: tracing() starts a trace in a context variable, and
+stage(name) blocks and count(name) calls anywhere below it (the API handler,
+the pool worker, OCR page threads) add to it. A trace is a plain dict, so the
+pool worker returns it with the result. The API process then merges it into
+the request's trace, record()s it into the histograms and counters below and
+turns it into a Server-Timing header. Outside a trace, stage() and count()
+cost a context variable lookup and nothing is recorded.
+
+Metrics live in the memory of the API process. With several uvicorn workers,
+each serves its own numbers; Prometheus sums them when every process is
+scraped (or run one process per container).
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PAGES_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
+
+METRICS = {
+    "docintel_stage_seconds": ("histogram", "Time spent in each processing stage, per document type"),
+    "docintel_pages_per_document": ("histogram", "Pages read per processed document"),
+    "docintel_ocr_pages_total": ("counter", "Pages by the path that produced their text (OCR engine, text layer, blank)"),
+    "docintel_events_total": ("counter", "Pipeline events: OCR fallbacks, cache and near-duplicate hits"),
+    "docintel_requests_total": ("counter", "HTTP requests by path and status code"),
+    "docintel_request_seconds": ("histogram", "HTTP request latency by path"),
+}
+
+_trace = contextvars.ContextVar("docintel_trace", default=None)
+_lock = threading.Lock()
+_series = {}  # (metric, labels) -> counter value, or [bucket counts..., sum, count] for histograms
+
+
+def new_trace():
+    return {"stages": {}, "counts": {}}
+
+
+@contextmanager
+def tracing(trace=None):
+    """Collect stage timings and counts of the code below into trace (a new one by default)."""
+    trace = new_trace() if trace is None else trace
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current():
+    return _trace.get()
+
+
+def add_time(name, seconds):
+    trace = _trace.get()
+    if trace is not None:
+        # setdefault and append are atomic, so OCR page threads can share the trace
+        trace["stages"].setdefault(name, []).append(seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the block as one observation of stage name."""
+    if _trace.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - started)
+
+
+def count(name, n=1):
+    trace = _trace.get()
+    if trace is not None:
+        trace["counts"].setdefault(name, []).append(n)
+
+
+def carry_context(fn):
+    """Wrap fn to run in a copy of the caller's context, so threads it runs on add to the same trace."""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(fn, *args)
+
+
+def merge(trace, other):
+    """Add the stages and counts of other (e.g. returned by a pool worker) to trace."""
+    if trace is None:
+        return
+    for key in ("stages", "counts"):
+        for name, values in (other or {}).get(key, {}).items():
+            trace[key].setdefault(name, []).extend(values)
+
+
+def server_timing(trace):
+    """Server-Timing header value: total milliseconds per stage."""
+    return ", ".join(f"{name};dur={1000 * sum(values):.1f}" for name, values in trace["stages"].items())
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(metric, labels, n=1):
+    key = (metric, _label_key(labels))
+    with _lock:
+        _series[key] = _series.get(key, 0) + n
+
+
+def observe(metric, labels, value, buckets=SECONDS_BUCKETS):
+    key = (metric, _label_key(labels))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def record(trace, document_type=None, pages=None):
+    """Add a finished document's trace (and page sources) to the histograms and counters."""
+    doc_type = document_type or "unknown"
+    for name, values in trace["stages"].items():
+        for value in values:
+            observe("docintel_stage_seconds", {"stage": name, "document_type": doc_type}, value)
+    for name, values in trace["counts"].items():
+        inc("docintel_events_total", {"event": name}, sum(values))
+    if pages is not None:
+        observe("docintel_pages_per_document", {"document_type": doc_type}, len(pages), PAGES_BUCKETS)
+        for page in pages:
+            inc("docintel_ocr_pages_total", {"source": page.get("source", "none")})
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+def render(gauges=None):
+    """All metrics in the Prometheus text exposition format. gauges: {name: (help, value)} read at scrape time."""
+    with _lock:
+        snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in _series.items()}
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        series = sorted((labels, value) for (name, labels), value in snapshot.items() if name == metric)
+        if not series:
+            continue
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{metric}{_labels(labels)} {value}")
+                continue
+            buckets = PAGES_BUCKETS if metric == "docintel_pages_per_document" else SECONDS_BUCKETS
+            for bound, bucket_count in zip(buckets, value):
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {value[-1]}")
+            lines.append(f"{metric}_sum{_labels(labels)} {value[-2]:.6f}")
+            lines.append(f"{metric}_count{_labels(labels)} {value[-1]}")
+    for name, (help_text, value) in (gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
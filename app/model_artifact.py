@@ -0,0 +1,203 @@
+"""
+Pickle-free classifier artifact.
+
+An artifact is a directory of plain files that any process can load safely:
+
+    meta.json                kind ("tfidf" or "hashing"), classes, tokenizer settings
+    vocabulary.npy           tfidf only: the terms, sorted (fixed-width unicode)
+    vocabulary_index.npy     tfidf only: feature column of each sorted term
+    idf.npy                  optional: IDF weight per feature
+    feature_log_prob.npy     log P(feature | class), shape (n_features, n_classes)
+    class_log_prior.npy      log P(class)
+
+Arrays are opened with mmap, so loading takes milliseconds and every worker
+process shares the same pages through the OS page cache instead of holding its
+own copy. Scoring a batch is one sparse matrix product: the tokenizer is
+scikit-learn's (built from the saved settings), so features match training.
+
+Convert a pickled (MultinomialNB, vectorizer) file once with:
+    python -m app.model_artifact app/model_artifacts/classifier.pkl app/model_artifacts/classifier
+"""
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+
+FORMAT_VERSION = 1
+TOKENIZER_SETTINGS = ("lowercase", "token_pattern", "stop_words", "ngram_range", "strip_accents", "analyzer")
+
+
+def _jsonable(value):
+    if isinstance(value, (frozenset, set)):
+        return sorted(value)
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def save_artifact(directory, vectorizer, model, extra=None):
+    """Write a fitted MultinomialNB and its TfidfVectorizer, CountVectorizer or HashingVectorizer.
+
+    A HashingVectorizer may come with an IDF vector in extra["idf"]. Other keys of
+    extra are stored in meta.json as is (training details, for example).
+    """
+    extra = dict(extra or {})
+    idf = extra.pop("idf", None)
+    os.makedirs(directory, exist_ok=True)
+    params = vectorizer.get_params()
+    meta = {"format": FORMAT_VERSION, "classes": [str(c) for c in model.classes_]}
+    meta.update({name: _jsonable(params[name]) for name in TOKENIZER_SETTINGS})
+    if isinstance(vectorizer, HashingVectorizer):
+        if params["alternate_sign"]:
+            raise ValueError("MultinomialNB needs non-negative features: use alternate_sign=False")
+        meta.update(kind="hashing", n_features=params["n_features"], binary=params["binary"],
+                    norm=params["norm"] if idf is None else "l2", sublinear_tf=False)
+    else:
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        order = np.argsort(np.array(terms))
+        np.save(os.path.join(directory, "vocabulary.npy"), np.array(terms)[order])
+        np.save(os.path.join(directory, "vocabulary_index.npy"), order.astype(np.int64))
+        meta.update(kind="tfidf", n_features=len(terms), binary=params["binary"])
+        if isinstance(vectorizer, TfidfVectorizer):
+            meta.update(norm=params["norm"], sublinear_tf=params["sublinear_tf"])
+            if params["use_idf"]:
+                idf = vectorizer.idf_
+        else:
+            meta.update(norm=None, sublinear_tf=False)
+    if idf is not None:
+        np.save(os.path.join(directory, "idf.npy"), np.asarray(idf, dtype=np.float64))
+    elif os.path.exists(os.path.join(directory, "idf.npy")):
+        os.remove(os.path.join(directory, "idf.npy"))
+    np.save(os.path.join(directory, "feature_log_prob.npy"),
+            np.ascontiguousarray(model.feature_log_prob_.T, dtype=np.float64))
+    np.save(os.path.join(directory, "class_log_prior.npy"), np.asarray(model.class_log_prior_, dtype=np.float64))
+    meta.update(extra)
+    # meta.json last: its presence marks a complete artifact
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def artifact_files(directory):
+    return sorted(name for name in os.listdir(directory) if name == "meta.json" or name.endswith(".npy"))
+
+
+def artifact_version(directory):
+    """Short content hash of every file in an artifact."""
+    digest = hashlib.sha256()
+    for name in artifact_files(directory):
+        digest.update(name.encode())
+        with open(os.path.join(directory, name), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def load_artifact(directory):
+    """Open an artifact with its arrays memory-mapped. Returns a dict used by transform/predict."""
+    meta_path = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No classifier artifact (meta.json) in {directory}")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported classifier artifact format {meta.get('format')} in {directory}")
+
+    def array(name):
+        path = os.path.join(directory, name)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    settings = {name: meta[name] for name in TOKENIZER_SETTINGS}
+    settings["ngram_range"] = tuple(settings["ngram_range"])
+    if meta["kind"] == "hashing":
+        tokenizer = HashingVectorizer(n_features=meta["n_features"], alternate_sign=False, norm=None,
+                                      binary=meta["binary"], **settings)
+    else:
+        tokenizer = CountVectorizer(**settings).build_analyzer()
+    return {
+        "meta": meta,
+        "classes": np.array(meta["classes"]),
+        "tokenizer": tokenizer,
+        "vocabulary": array("vocabulary.npy"),
+        "vocabulary_index": array("vocabulary_index.npy"),
+        "idf": array("idf.npy"),
+        "feature_log_prob": array("feature_log_prob.npy"),
+        "class_log_prior": array("class_log_prior.npy"),
+    }
+
+
+def _count_terms(artifact, texts):
+    """Term counts for a tfidf-kind artifact, looking terms up in the sorted vocabulary."""
+    analyze = artifact["tokenizer"]
+    vocabulary = artifact["vocabulary"]
+    longest = vocabulary.dtype.itemsize // 4  # fixed-width unicode: 4 bytes per character
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        # Longer terms aren't in the vocabulary, and NumPy would truncate them into false matches
+        terms = [term for term in analyze(text) if len(term) <= longest]
+        if not terms:
+            continue
+        terms = np.array(terms, dtype=vocabulary.dtype)
+        positions = np.searchsorted(vocabulary, terms)
+        positions[positions == len(vocabulary)] = 0
+        known = vocabulary[positions] == terms
+        cols.append(artifact["vocabulary_index"][positions[known]])
+        rows.append(np.full(int(known.sum()), row, dtype=np.int64))
+    shape = (len(texts), artifact["meta"]["n_features"])
+    if not cols:
+        return sp.csr_matrix(shape, dtype=np.float64)
+    data = np.ones(sum(len(c) for c in cols), dtype=np.float64)
+    counts = sp.csr_matrix((data, (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+    counts.sum_duplicates()
+    if artifact["meta"]["binary"]:
+        counts.data[:] = 1.0
+    return counts
+
+
+def transform(artifact, texts):
+    """Feature matrix (CSR) for a batch of texts, weighted and normalized like at training time."""
+    meta = artifact["meta"]
+    if meta["kind"] == "hashing":
+        X = artifact["tokenizer"].transform(texts).tocsr().astype(np.float64)
+    else:
+        X = _count_terms(artifact, texts)
+    if meta["sublinear_tf"]:
+        np.log(X.data, X.data)
+        X.data += 1
+    if artifact["idf"] is not None:
+        X = X @ sp.diags(np.asarray(artifact["idf"]))
+    if meta["norm"]:
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel()) if meta["norm"] == "l2" \
+            else np.asarray(abs(X).sum(axis=1)).ravel()
+        norms[norms == 0] = 1.0
+        X = sp.diags(1.0 / norms) @ X
+    return sp.csr_matrix(X)
+
+
+def predict(artifact, texts):
+    """Classify a batch of texts with one sparse matrix product. Returns (labels, confidences)."""
+    X = transform(artifact, texts)
+    joint = np.asarray(X @ artifact["feature_log_prob"]) + artifact["class_log_prior"]
+    joint -= joint.max(axis=1, keepdims=True)
+    probabilities = np.exp(joint)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    best = probabilities.argmax(axis=1)
+    return artifact["classes"][best], probabilities[np.arange(len(texts)), best]
+
+
+def convert_pickle(pickle_path, directory):
+    """One-off conversion of a trusted pickled (MultinomialNB, vectorizer) file."""
+    import pickle
+    with open(pickle_path, "rb") as f:
+        model, vectorizer = pickle.load(f)
+    return save_artifact(directory, vectorizer, model, {"converted_from": os.path.basename(pickle_path)})
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m app.model_artifact <classifier.pkl> <artifact directory>")
+    meta = convert_pickle(sys.argv[1], sys.argv[2])
+    print(f"Wrote {meta['kind']} artifact with {meta['n_features']} features to {sys.argv[2]}")
@@ -0,0 +1,184 @@
+"""
+Versioned registry of classifier artifacts.
+
+    <MODEL_REGISTRY_PATH>/
+        versions/<version>/   one artifact per version (see app/model_artifact.py),
+                              named by its content hash, never modified once published
+        active.json           {"version": ..., "history": [previously active versions]}
+
+Publishing copies an artifact into a temporary directory and renames it into
+place; activating rewrites active.json through a temporary file and
+os.replace. Both are atomic, so a process reading the registry sees either the
+old version or the new one, never a half-written one. Activations hold a lock
+file (.lock) from reading active.json to replacing it, so two at once (a swap
+and a rollback, or two API processes) can't lose each other's history entry. Every process
+(uvicorn workers, pool workers, job workers) notices a change of active.json
+on its next classification and switches to the new version; see
+app/classifier.py.
+
+Publish and activate from the command line:
+    python -m app.model_registry publish app/model_artifacts/classifier --activate
+    python -m app.model_registry list
+"""
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+try:
+    from .config import MODEL_REGISTRY_PATH
+    from .model_artifact import artifact_files, artifact_version
+except ImportError:
+    from config import MODEL_REGISTRY_PATH
+    from model_artifact import artifact_files, artifact_version
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HISTORY_LENGTH = 20  # previous versions kept for rollback
+
+_thread_lock = threading.Lock()
+
+
+def _versions_dir(registry):
+    return os.path.join(registry or MODEL_REGISTRY_PATH, "versions")
+
+
+def _active_path(registry):
+    return os.path.join(registry or MODEL_REGISTRY_PATH, "active.json")
+
+
+def version_path(version, registry=None):
+    """Artifact directory of a published version. Raises LookupError if it doesn't exist."""
+    path = os.path.join(_versions_dir(registry), version)
+    if not version or os.path.basename(version) != version or not os.path.exists(os.path.join(path, "meta.json")):
+        raise LookupError(f"Model version {version!r} is not in the registry")
+    return path
+
+
+def publish(artifact_dir, registry=None):
+    """Copy an artifact into the registry. Returns its version (publishing twice is a no-op)."""
+    version = artifact_version(artifact_dir)
+    versions = _versions_dir(registry)
+    target = os.path.join(versions, version)
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return version
+    os.makedirs(versions, exist_ok=True)
+    staging = os.path.join(versions, f".publishing-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    try:
+        for name in artifact_files(artifact_dir):
+            shutil.copyfile(os.path.join(artifact_dir, name), os.path.join(staging, name))
+        os.replace(staging, target)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(target, "meta.json")):  # not just a concurrent publish of the same version
+            raise
+    return version
+
+
+def list_versions(registry=None):
+    """Published versions, newest first, with a few details from their meta.json."""
+    versions = _versions_dir(registry)
+    if not os.path.isdir(versions):
+        return []
+    found = []
+    for version in os.listdir(versions):
+        meta_path = os.path.join(versions, version, "meta.json")
+        if version.startswith(".") or not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        found.append({"version": version, "published_at": os.path.getmtime(meta_path),
+                      "kind": meta["kind"], "classes": meta["classes"], "training": meta.get("training")})
+    return sorted(found, key=lambda item: item["published_at"], reverse=True)
+
+
+@contextmanager
+def _locked(registry):
+    """Hold the registry's active.json for this thread and process."""
+    with _thread_lock:
+        os.makedirs(registry or MODEL_REGISTRY_PATH, exist_ok=True)
+        with open(os.path.join(registry or MODEL_REGISTRY_PATH, ".lock"), "a+b") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def active_stamp(registry=None):
+    """Cheap token that changes whenever active.json is replaced, or None if nothing is active."""
+    try:
+        st = os.stat(_active_path(registry))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def read_active(registry=None):
+    """{"version", "history", "activated_at"} from active.json, or None if nothing is active."""
+    try:
+        with open(_active_path(registry)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def activate(version, registry=None, rollback=False):
+    """Atomically make a published version the active one. Returns the previously active version.
+
+    Normally the previous version is pushed onto the history; with rollback=True
+    the version must be the head of the history and is popped from it instead.
+    """
+    version_path(version, registry)
+    with _locked(registry):
+        current = read_active(registry) or {"version": None, "history": []}
+        history = current["history"]
+        if rollback:
+            if not history or history[0] != version:
+                raise ValueError(f"Model version {version} is not the one to roll back to")
+            history = history[1:]
+        elif current["version"] and current["version"] != version:
+            history = [current["version"]] + history[:HISTORY_LENGTH - 1]
+        path = _active_path(registry)
+        staging = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(staging, "w") as f:
+            json.dump({"version": version, "history": history, "activated_at": int(time.time())}, f)
+        os.replace(staging, path)
+    return current["version"]
+
+
+def rollback_target(registry=None):
+    """The version a rollback would activate, or None."""
+    current = read_active(registry)
+    return current["history"][0] if current and current["history"] else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "publish":
+        published = publish(sys.argv[2])
+        print(f"Published {sys.argv[2]} as version {published}")
+        if "--activate" in sys.argv[3:]:
+            activate(published)
+            print(f"Activated {published}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "list":
+        active = (read_active() or {}).get("version")
+        for item in list_versions():
+            print(f"{'*' if item['version'] == active else ' '} {item['version']}  {item['kind']}  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(item['published_at']))}  {', '.join(item['classes'])}")
+    else:
+        sys.exit("Usage: python -m app.model_registry publish <artifact directory> [--activate] | list")
@@ -0,0 +1,278 @@
+"""
+Near-duplicate detection, to link (or reuse) the results of documents seen before in another form.
+
+The result cache (app/cache.py) only catches byte-identical re-uploads. The
+same invoice scanned twice, re-saved as a JPEG instead of a PDF or exported at
+another resolution has different bytes, so every processed document also gets
+two fingerprints, kept in a local SQLite index (NEAR_DUP_PATH, WAL mode,
+shared by all processes):
+
+- a MinHash signature of the cleaned text's word 3-grams. When it is at least
+  NEAR_DUP_TEXT_THRESHOLD similar (estimated Jaccard similarity) to an
+  earlier document's, the result links that document. The link is a hint:
+  a few percent of OCR errors and a few changed numbers move the estimate by
+  about as much, which is why a text match never replaces the result.
+- with NEAR_DUP_PAGE_REUSE, a perceptual hash (256-bit dHash) of each page,
+  rendered at low resolution before OCR. Re-saves and re-exports of a page
+  keep 98-100% of its bits. Rendering costs a poppler run per PDF, which the
+  text-layer path otherwise avoids, so pages aren't hashed when reuse is off.
+
+A page hash sees the layout of a page, not its text: two invoices from the
+same template that differ only in their numbers hash as alike as two scans of
+one invoice. So by default the decision rests on the text, after OCR. With
+NEAR_DUP_PAGE_REUSE, a document whose pages are at least
+NEAR_DUP_PAGE_THRESHOLD similar to an earlier document's (same page count)
+gets that document's result straight away, without OCR. Only turn that on
+when the same pages are re-submitted often and forms aren't filled in from
+shared templates.
+
+Lookups go through LSH bands (16 bands of 16 bits of the first page's hash,
+32 bands of 4 MinHash values), so they read the few entries that share a band
+with the document instead of the whole index. Matched results carry
+"near_duplicate": {"match": "text" or "pages", "similarity": ..., "of":
+{"filename", "cache_key"} of the earlier document}, and aren't added to the
+index themselves: the earlier document already stands for them. Only entries
+made with the current classifier model and extractor version match.
+
+check_pages runs in the pool worker, before OCR; remember runs as a pipeline
+stage after analysis (app/pipeline.py), where the document's filename and
+cache key are known.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+import numpy as np
+from PIL import Image, ImageOps
+try:
+    from .config import (NEAR_DUP_ENABLED, NEAR_DUP_PATH, NEAR_DUP_TEXT_THRESHOLD, NEAR_DUP_PAGE_REUSE,
+                         NEAR_DUP_PAGE_THRESHOLD, NEAR_DUP_MAX_ENTRIES)
+    from .classifier import model_version
+    from .extractor import EXTRACTOR_VERSION
+    from .ocr import page_thumbnails
+except ImportError:
+    from config import (NEAR_DUP_ENABLED, NEAR_DUP_PATH, NEAR_DUP_TEXT_THRESHOLD, NEAR_DUP_PAGE_REUSE,
+                        NEAR_DUP_PAGE_THRESHOLD, NEAR_DUP_MAX_ENTRIES)
+    from classifier import model_version
+    from extractor import EXTRACTOR_VERSION
+    from ocr import page_thumbnails
+
+HASH_SIZE = 16  # dHash grid, 16 x 16 = 256 bits per page
+HASH_BITS = HASH_SIZE * HASH_SIZE
+PAGE_BANDS = 16  # first pages within 15 differing bits always share a band
+SHINGLE = 3  # words per shingle
+MIN_SHINGLES = 8  # shorter texts aren't compared
+NUM_PERM = 128
+TEXT_BANDS = 32  # x 4 rows: pairs above ~0.6 similarity almost always share a band
+TEXT_ROWS = NUM_PERM // TEXT_BANDS
+CANDIDATES = 50  # entries verified per lookup, most shared bands first
+_PRIME = 4294967291  # largest prime below 2**32
+
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 31, NUM_PERM, dtype=np.int64).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+_initialized = False
+log = logging.getLogger(__name__)
+
+
+def _connect():
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(NEAR_DUP_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(NEAR_DUP_PATH, timeout=30, isolation_level=None)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY, version TEXT NOT NULL, pages TEXT, signature BLOB, "
+            "result TEXT NOT NULL, created_at REAL NOT NULL, document TEXT)"
+        )
+        try:
+            conn.execute("ALTER TABLE entries ADD COLUMN document TEXT")  # indexes made before it was added
+        except sqlite3.OperationalError:
+            pass  # already there
+        conn.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, entry INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key, entry)")
+        conn.execute("CREATE INDEX IF NOT EXISTS bands_entry ON bands (entry)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters VALUES ('page_matches', 0), ('text_matches', 0), ('misses', 0)")
+        _initialized = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def dhash(image):
+    """256-bit difference hash of a page: whether each cell of a 17 x 16 grid is brighter than its left neighbour.
+
+    Autocontrast evens out scan exposure, and resizing by averaging (BOX)
+    makes the hash independent of resolution and JPEG noise.
+    """
+    gray = ImageOps.autocontrast(image.convert("L")).resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1] + 1  # a small margin keeps flat white areas stable
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def page_similarity(a, b):
+    """Share of matching bits, averaged over pages. 0.0 for documents with different page counts."""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 - bin(x ^ y).count("1") / HASH_BITS for x, y in zip(a, b)) / len(a)
+
+
+def text_signature(text):
+    """MinHash signature (NUM_PERM uint32 values) of the word 3-grams of text, or None if it is too short."""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def text_similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.mean(a == b))
+
+
+def _band_key(kind, band, payload):
+    digest = hashlib.blake2b(f"{kind}{band}:".encode() + payload, digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _page_keys(hashes):
+    first = hashes[0]
+    return [_band_key("p", i, ((first >> (16 * i)) & 0xFFFF).to_bytes(2, "big")) for i in range(PAGE_BANDS)]
+
+
+def _text_keys(signature):
+    return [_band_key("t", i, signature[i * TEXT_ROWS:(i + 1) * TEXT_ROWS].tobytes()) for i in range(TEXT_BANDS)]
+
+
+def _candidates(conn, keys, version):
+    placeholders = ",".join("?" * len(keys))
+    return conn.execute(
+        f"SELECT e.document, e.pages, e.signature, e.result FROM entries e JOIN ("
+        f"SELECT entry, COUNT(*) AS shared FROM bands WHERE key IN ({placeholders}) "
+        f"GROUP BY entry ORDER BY shared DESC LIMIT {CANDIDATES}) c ON c.entry = e.id WHERE e.version = ?",
+        (*keys, version)
+    ).fetchall()
+
+
+def _best(candidates, score):
+    """(earlier document, its result JSON, similarity) of the best scoring candidate."""
+    best_document, best_result, best_score = None, None, 0.0
+    for candidate in candidates:
+        similarity = score(candidate)
+        if similarity > best_score:
+            best_document, best_result, best_score = candidate[0], candidate[3], similarity
+    return json.loads(best_document) if best_document else None, best_result, best_score
+
+
+def _count(conn, name):
+    conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+
+def _version(model):
+    return f"{model}:{EXTRACTOR_VERSION}"
+
+
+def check_pages(source, suffix=None):
+    """With NEAR_DUP_PAGE_REUSE, fingerprint a document's pages before OCR. Returns (page hashes, earlier
+    result or None), or (None, None) when reuse is off.
+
+    Problems never fail a request: they only skip the page fingerprint.
+    """
+    if not (NEAR_DUP_ENABLED and NEAR_DUP_PAGE_REUSE):
+        return None, None
+    try:
+        images = page_thumbnails(source, suffix)
+        try:
+            hashes = [dhash(image) for image in images]
+        finally:
+            for image in images:
+                image.close()
+        if not hashes:
+            return None, None
+        with closing(_connect()) as conn:
+            candidates = _candidates(conn, _page_keys(hashes), _version(model_version()))
+            earlier, result, similarity = _best(
+                candidates, lambda c: page_similarity(hashes, json.loads(c[1]) if c[1] else None))
+            if similarity < NEAR_DUP_PAGE_THRESHOLD:
+                return hashes, None
+            _count(conn, "page_matches")
+    except Exception as e:
+        log.warning("Near-duplicate check skipped: %s", e)
+        return None, None
+    return hashes, {**json.loads(result),
+                    "near_duplicate": {"match": "pages", "similarity": round(similarity, 4), "of": earlier}}
+
+
+def remember(result, page_hashes=None, document=None):
+    """After analysis: link result to an earlier document with near-identical text, or else add it to the index.
+
+    document ({"filename", "cache_key"}) is what later matches link to. Returns
+    result, with "near_duplicate" set on a match.
+    """
+    if (not NEAR_DUP_ENABLED or result.get("cleaned") is None or result.get("ocr_failed")
+            or "near_duplicate" in result):
+        return result
+    try:
+        version = _version(result.get("model_version"))
+        signature = text_signature(result["cleaned"])
+        with closing(_connect()) as conn:
+            match = None
+            if signature is not None:
+                candidates = _candidates(conn, _text_keys(signature), version)
+                earlier, _, similarity = _best(
+                    candidates, lambda c: text_similarity(signature, np.frombuffer(c[2], dtype=np.uint32))
+                    if c[2] else 0.0)
+                if similarity >= NEAR_DUP_TEXT_THRESHOLD:
+                    match = {"match": "text", "similarity": round(similarity, 4), "of": earlier}
+            _count(conn, "text_matches" if match else "misses")
+            if not match:
+                _add(conn, version, page_hashes, signature, result, document)
+    except Exception as e:
+        log.warning("Near-duplicate check skipped: %s", e)
+        return result
+    if match:
+        result["near_duplicate"] = match
+    return result
+
+
+def _add(conn, version, page_hashes, signature, result, document):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        entry_id = conn.execute(
+            "INSERT INTO entries (version, pages, signature, result, created_at, document) VALUES (?, ?, ?, ?, ?, ?)",
+            (version, json.dumps(page_hashes) if page_hashes else None,
+             signature.tobytes() if signature is not None else None,
+             json.dumps(result, ensure_ascii=False), time.time(),
+             json.dumps(document, ensure_ascii=False) if document else None)
+        ).lastrowid
+        keys = _page_keys(page_hashes) if page_hashes else []
+        if signature is not None:
+            keys += _text_keys(signature)
+        conn.executemany("INSERT INTO bands VALUES (?, ?)", [(key, entry_id) for key in keys])
+        if entry_id % 1000 == 0:
+            # Keep the newest NEAR_DUP_MAX_ENTRIES
+            cutoff = entry_id - NEAR_DUP_MAX_ENTRIES
+            conn.execute("DELETE FROM bands WHERE entry <= ?", (cutoff,))
+            conn.execute("DELETE FROM entries WHERE id <= ?", (cutoff,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def near_dup_stats():
+    with closing(_connect()) as conn:
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    return {**counters, "entries": entries}
@@ -1,10 +1,30 @@
 import pytesseract
+import io
 import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from PIL import Image
 import easyocr
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import numpy as np
-import os
+from PyPDF2 import PdfReader
+try:
+    from .config import (OCR_PDF_DPI, OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE, OCR_PAGE_WORKERS,
+                         OCR_PDF_TEXT_LAYER, OCR_TEXT_LAYER_MIN_CHARS, OCR_PDF_MIN_DPI,
+                         OCR_ENGINE, OCR_BATCH_SIZE, OCR_COARSE_SCALE, OCR_FINE_MAX_COVERAGE)
+    from .preprocess import preprocess, open_image, plan_pdf_render, active_steps
+    from . import metrics
+except ImportError:
+    from config import (OCR_PDF_DPI, OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE, OCR_PAGE_WORKERS,
+                        OCR_PDF_TEXT_LAYER, OCR_TEXT_LAYER_MIN_CHARS, OCR_PDF_MIN_DPI,
+                        OCR_ENGINE, OCR_BATCH_SIZE, OCR_COARSE_SCALE, OCR_FINE_MAX_COVERAGE)
+    from preprocess import preprocess, open_image, plan_pdf_render, active_steps
+    import metrics
+
+PROBE_DPI = 72  # low-resolution render used to find blank pages and pick the real DPI
 
 # Lazy load EasyOCR reader to avoid slow startup
 _reader = None
@@ -15,6 +35,141 @@ def get_easyocr_reader():
         _reader = easyocr.Reader(['en'])
     return _reader
 
+
+class OCREngine:
+    """Interface for OCR backends. Subclasses implement recognize(); batched
+    engines also override recognize_batch() to handle many pages per call."""
+    name = "base"
+    batched = False
+
+    def recognize(self, image):
+        raise NotImplementedError
+
+    def recognize_batch(self, images):
+        return [self.recognize(image) for image in images]
+
+
+class TesseractEngine(OCREngine):
+    """pytesseract: one tesseract process per page."""
+    name = "tesseract"
+
+    def recognize(self, image):
+        return pytesseract.image_to_string(image)
+
+
+class BatchTesseractEngine(OCREngine):
+    """Hands a whole list of pages to a single tesseract invocation.
+
+    Tesseract accepts a text file listing image paths and writes every page's
+    text to stdout, separated by form feeds, so start-up and model loading are
+    paid once per batch instead of once per page.
+    """
+    name = "tesseract_batch"
+    batched = True
+
+    def recognize(self, image):
+        return self.recognize_batch([image])[0]
+
+    def recognize_batch(self, images):
+        if not images:
+            return []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, image in enumerate(images):
+                page_path = os.path.join(tmp_dir, f"page{i}.png")
+                # PNG keeps the preprocessed pixels exactly; compress_level=1 keeps encoding cheap
+                image.save(page_path, compress_level=1)
+                paths.append(page_path)
+            list_path = os.path.join(tmp_dir, "pages.txt")
+            with open(list_path, "w") as fh:
+                fh.write("\n".join(paths) + "\n")
+            proc = subprocess.run(
+                [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout"],
+                capture_output=True, check=True,
+            )
+        texts = proc.stdout.decode("utf-8", errors="replace").split("\f")
+        if len(texts) < len(images):
+            raise RuntimeError(f"tesseract returned {len(texts)} pages for {len(images)} images")
+        return texts[:len(images)]
+
+
+class EasyOCREngine(OCREngine):
+    name = "easyocr"
+
+    def recognize(self, image):
+        return "\n".join(get_easyocr_reader().readtext(np.array(image.convert("RGB")), detail=0))
+
+
+ENGINES = {engine.name: engine for engine in (TesseractEngine, BatchTesseractEngine, EasyOCREngine)}
+_engines = {}
+
+
+def get_engine(name=None):
+    """Return the (per-process) engine instance for name, default OCR_ENGINE."""
+    name = name or OCR_ENGINE
+    if name not in _engines:
+        if name not in ENGINES:
+            raise ValueError(f"Unknown OCR engine {name!r}. Available: {sorted(ENGINES)}")
+        _engines[name] = ENGINES[name]()
+    return _engines[name]
+
+
+def recognize_images(images, label, engine=None, fallback_on_empty=False):
+    """OCR a list of preprocessed images with the configured engine, falling back to EasyOCR.
+
+    Returns a list of (text, source) pairs, source being the engine that produced the text.
+    """
+    engine = engine or get_engine()
+    try:
+        with metrics.stage(f"ocr_{engine.name}"):
+            texts = engine.recognize_batch(images)
+        results = [(text, engine.name) if text.strip() else ("", "none") for text in texts]
+        failed = [i for i, (text, _) in enumerate(results) if not text] if fallback_on_empty else []
+    except Exception as e:
+        print(f"{engine.name} failed on {label}, trying EasyOCR: {e}")
+        results = [("", "none")] * len(images)
+        failed = list(range(len(images)))
+    if engine.name == "easyocr":
+        return results
+    for i in failed:
+        metrics.count("easyocr_fallback")
+        try:
+            with metrics.stage("ocr_easyocr_fallback"):
+                results[i] = (get_engine("easyocr").recognize(images[i]), "easyocr")
+        except Exception as e2:
+            print(f"EasyOCR also failed on {label}: {e2}")
+    return results
+
+
+def warm_up(easyocr_reader=True):
+    """Run a dummy inference through each OCR engine so the first request doesn't pay for it.
+
+    Returns per-engine timings in ms; an engine that fails to warm up reports its error.
+    """
+    image = Image.new("L", (200, 60), color=255)
+    timings = {}
+    engine = get_engine()
+    if engine.name != "easyocr":
+        started = time.perf_counter()
+        try:
+            engine.recognize(image)
+            timings[engine.name] = {"first_inference_ms": round(1000 * (time.perf_counter() - started), 1)}
+        except Exception as e:
+            timings[engine.name] = {"error": str(e)}
+    if easyocr_reader or engine.name == "easyocr":
+        started = time.perf_counter()
+        try:
+            reader = get_easyocr_reader()
+            loaded = time.perf_counter()
+            reader.readtext(np.array(image), detail=0)
+            timings["easyocr"] = {
+                "load_ms": round(1000 * (loaded - started), 1),
+                "first_inference_ms": round(1000 * (time.perf_counter() - loaded), 1),
+            }
+        except Exception as e:
+            timings["easyocr"] = {"error": str(e)}
+    return timings
+
 # If Tesseract is installed in a common location but not on PATH, try to set it explicitly
 tesseract_common_paths = [
     r"C:\Program Files\Tesseract-OCR\tesseract.exe",
@@ -28,60 +183,467 @@ for _p in tesseract_common_paths:
     except Exception:
         pass
 
-def run_ocr(path):
-    """Extract text from image or PDF using Tesseract OCR with EasyOCR fallback."""
-    
-    # Handle PDF files
-    if path.lower().endswith('.pdf'):
-        try:
-            # Try converting PDF to images (default, relies on poppler in PATH)
-            images = convert_from_path(path, dpi=300, first_page=1, last_page=3)  # Limit to first 3 pages
-        except Exception as e:
-            # If that fails, try using a common Poppler install location explicitly
+# Pages are OCR'd in parallel threads (each Tesseract call is its own process), so keep
+# Tesseract's internal OpenMP threading from oversubscribing the cores.
+if OCR_PAGE_WORKERS > 1:
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _find_poppler_path(path):
+    """Return the poppler_path to use (None when poppler is on PATH) and the page count."""
+    try:
+        return None, pdfinfo_from_path(path)["Pages"]
+    except Exception:
+        # If that fails, try using a common Poppler install location explicitly
+        poppler_default = r"C:\Program Files\poppler\Library\bin"
+        poppler_path = os.environ.get('POPPLER_PATH') or poppler_default
+        if os.path.exists(os.path.join(poppler_path, 'pdfinfo.exe')):
+            return poppler_path, pdfinfo_from_path(path, poppler_path=poppler_path)["Pages"]
+        raise
+
+
+def _ocr_image(image, label, steps=None):
+    """Preprocess and OCR a single PIL image with the configured engine, falling back to EasyOCR.
+
+    Returns (text, source) where source is the engine that produced the text,
+    or "blank" for an empty page that was skipped.
+    """
+    image, _ = preprocess(image, steps)
+    if image is None:
+        return "", "blank"
+    return recognize_images([image], label)[0]
+
+
+def _render_page(path, page, dpi, poppler_path):
+    with metrics.stage("pdf_render"):
+        return convert_from_path(path, dpi=dpi, first_page=page, last_page=page, poppler_path=poppler_path)[0]
+
+
+def _prepare_pdf_page(path, page, dpi, poppler_path, steps=None):
+    """Render and preprocess one PDF page.
+
+    With blank skipping or adaptive scaling enabled, a cheap PROBE_DPI render
+    decides first whether the page needs OCR at all and at which DPI.
+    Returns {"image", "dpi"}, or {"text": "", "source"} for a page that won't be OCR'd.
+    """
+    active = active_steps(steps)
+    try:
+        if active["blank"] or active["scale"]:
+            probe = _render_page(path, page, PROBE_DPI, poppler_path)
             try:
-                poppler_default = r"C:\Program Files\poppler\Library\bin"
-                poppler_env = os.environ.get('POPPLER_PATH')
-                poppler_path = poppler_env or poppler_default
-                if os.path.exists(os.path.join(poppler_path, 'pdfinfo.exe')):
-                    images = convert_from_path(path, dpi=300, first_page=1, last_page=3, poppler_path=poppler_path)
-                else:
-                    raise
-            except Exception:
-                print(f"PDF processing error: {e}")
-                return f"Error processing PDF: {str(e)}"
+                dpi = plan_pdf_render(probe, PROBE_DPI, dpi, min(dpi, OCR_PDF_MIN_DPI), steps)
+            finally:
+                probe.close()
+            if dpi is None:
+                return {"text": "", "source": "blank"}
+        rendered = _render_page(path, page, dpi, poppler_path)
+    except Exception as e:
+        print(f"PDF processing error on page {page}: {e}")
+        return {"text": "", "source": "none"}
+    # Scaling was handled by the choice of DPI
+    with metrics.stage("preprocess"):
+        image, _ = preprocess(rendered, {**active, "scale": False})
+    if image is not rendered:
+        rendered.close()
+    if image is None:
+        return {"text": "", "source": "blank"}
+    return {"image": image, "dpi": dpi}
+
+
+def _ocr_pdf_pages(path, pages, dpi, poppler_path, steps=None):
+    """Render, OCR and release a group of PDF pages (one engine call for batched engines).
+
+    Returns a list of {"text", "source", "dpi"} in page order.
+    """
+    prepared = [_prepare_pdf_page(path, page, dpi, poppler_path, steps) for page in pages]
+    to_ocr = [p for p in prepared if "image" in p]
+    try:
+        label = f"page {pages[0]}" if len(pages) == 1 else f"pages {pages[0]}-{pages[-1]}"
+        recognized = recognize_images([p["image"] for p in to_ocr], label)
+        for p, (text, source) in zip(to_ocr, recognized):
+            p["text"], p["source"] = text, source
+    finally:
+        for p in to_ocr:
+            p.pop("image").close()
+    return prepared
+
+
+def _usable_text_layer(text):
+    """Whether an embedded text layer is worth using instead of OCR.
+
+    Scanned pages usually have no text layer at all; broken font mappings
+    produce mostly symbols or replacement characters.
+    """
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < OCR_TEXT_LAYER_MIN_CHARS:
+        return False
+    alnum = sum(1 for c in chars if c.isalnum())
+    return alnum / len(chars) >= 0.5
+
+
+def _read_text_layer(source):
+    """Return the PdfReader for a PDF path or bytes, or None if it can't be read without a password."""
+    try:
+        reader = PdfReader(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+        return reader
+    except Exception as e:
+        print(f"PDF text layer unavailable: {e}")
+        return None
+
 
-        all_text = []
-        for i, image in enumerate(images):
+@contextmanager
+def _as_path(source, suffix):
+    """Yield a filesystem path for source, writing bytes to a temporary file only when needed."""
+    if not isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        tmp.write(source)
+        tmp.close()
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+
+def _page_range(first_page, last_page, page_count):
+    last_page = min(last_page, page_count) if last_page else page_count
+    return list(range(first_page, last_page + 1))
+
+
+class OCRError(Exception):
+    """A document could not be read at all; the message is returned as its text."""
+
+
+def _iter_pdf(source, dpi, first_page, last_page, steps, ocr_pages, step=None):
+    """Read a PDF in waves of `step` pages (all at once by default), in page order.
+
+    Pages with a usable text layer are taken from it; the rest go through
+    ocr_pages(path, pages, dpi, poppler_path, steps) in parallel groups. Yields
+    (wave, more) where wave is a list of (page, result) and more tells whether
+    the document has pages after this wave. Raises OCRError if nothing can be read.
+    """
+    reader = _read_text_layer(source) if OCR_PDF_TEXT_LAYER else None
+    layer = {}
+    page_numbers = None
+    page_count = None
+    if reader is not None:
+        page_count = len(reader.pages)
+        page_numbers = _page_range(first_page, last_page, page_count)
+        for page in page_numbers:
             try:
-                # Try Tesseract first
-                text = pytesseract.image_to_string(image)
-                if text.strip():
-                    all_text.append(text)
+                with metrics.stage("pdf_text_layer"):
+                    text = reader.pages[page - 1].extract_text() or ""
             except Exception as e:
-                print(f"Tesseract failed on page {i+1}, trying EasyOCR: {e}")
-                # Fallback to EasyOCR
-                try:
-                    reader = get_easyocr_reader()
-                    # Convert PIL image to numpy array for EasyOCR
-                    img_np = np.array(image)
-                    text = "\n".join(reader.readtext(img_np, detail=0))
-                    all_text.append(text)
-                except Exception as e2:
-                    print(f"EasyOCR also failed on page {i+1}: {e2}")
-
-        return "\n\n".join(all_text) if all_text else "Could not extract text from PDF"
-    
-    # Handle image files
+                print(f"PDF text layer error on page {page}: {e}")
+                text = ""
+            if _usable_text_layer(text):
+                layer[page] = {"text": text, "source": "text_layer"}
+
+    # Poppler is only needed for the pages without a usable text layer
+    needs_poppler = page_numbers is None or len(layer) < len(page_numbers)
+    with _as_path(source, ".pdf") if needs_poppler else nullcontext(None) as path:
+        poppler_path = None
+        if needs_poppler:
+            try:
+                poppler_path, page_count = _find_poppler_path(path)
+            except Exception as e:
+                print(f"PDF processing error: {e}")
+                if not layer:
+                    raise OCRError(f"Error processing PDF: {str(e)}")
+                path = None
+            if page_numbers is None:
+                page_numbers = _page_range(first_page, last_page, page_count)
+
+        step = step or len(page_numbers) or 1
+        # Batched engines get OCR_BATCH_SIZE pages per call; memory stays bounded by workers x group size
+        size = OCR_BATCH_SIZE if get_engine().batched else 1
+        with ThreadPoolExecutor(max_workers=max(1, OCR_PAGE_WORKERS)) as pool:
+            for start in range(0, len(page_numbers), step):
+                wave = page_numbers[start:start + step]
+                results = {page: layer[page] for page in wave if page in layer}
+                scanned = [page for page in wave if page not in layer] if path else []
+                groups = [scanned[i:i + size] for i in range(0, len(scanned), size)]
+                for group, texts in zip(groups, pool.map(metrics.carry_context(
+                        lambda group: ocr_pages(path, group, dpi, poppler_path, steps)), groups)):
+                    results.update(zip(group, texts))
+                more = wave[-1] < page_count
+                yield [(page, results.get(page, {"text": "", "source": "none"})) for page in wave], more
+
+
+def _page_summary(page, result):
+    summary = {"page": page, "source": result["source"], "chars": len(result["text"].strip())}
+    for key in ("dpi", "pixels"):
+        if key in result:
+            summary[key] = result[key]
+    return summary
+
+
+def _join_pages(texts, empty="Could not extract text from PDF"):
+    texts = [text for text in texts if text.strip()]
+    return "\n\n".join(texts) if texts else empty
+
+
+def ocr_pdf(source, dpi=None, first_page=None, last_page=None, steps=None):
+    """Extract text from a PDF (path or bytes) page by page.
+
+    Pages whose embedded text layer is usable are read directly with PyPDF2;
+    only the remaining (scanned) pages are rendered and OCR'd. Poppler needs a
+    file, so PDF bytes are written to a temporary file only in that case. Pages
+    are rendered one at a time and OCR'd in parallel by OCR_PAGE_WORKERS threads,
+    so at most that many page images are held in memory at once. dpi and the
+    page range default to OCR_PDF_DPI / OCR_PDF_FIRST_PAGE / OCR_PDF_LAST_PAGE
+    (a last page of 0 means the end of the document). steps overrides the
+    preprocessing steps from config (see app/preprocess.py).
+
+    Returns (text, pages) where pages lists, for each page, which path produced
+    its text: "text_layer", "tesseract", "easyocr", "blank" or "none", and the
+    DPI OCR'd pages were rendered at.
+    """
+    dpi = dpi or OCR_PDF_DPI
+    first_page = first_page or OCR_PDF_FIRST_PAGE
+    last_page = OCR_PDF_LAST_PAGE if last_page is None else last_page
+
     try:
-        text = pytesseract.image_to_string(Image.open(path))
-        if text.strip():
-            return text
+        results = [item for wave, _ in _iter_pdf(source, dpi, first_page, last_page, steps, _ocr_pdf_pages)
+                   for item in wave]
+    except OCRError as e:
+        return str(e), []
+    pages = [_page_summary(page, result) for page, result in results]
+    return _join_pages(result["text"] for _, result in results), pages
+
+
+def _text_lines(data, width, height):
+    """Group image_to_data words into lines with boxes normalized to the image size."""
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        box = (data["left"][i], data["top"][i],
+               data["left"][i] + data["width"][i], data["top"][i] + data["height"][i])
+        if key in lines:
+            line = lines[key]
+            line["words"].append(word)
+            line["box"] = (min(line["box"][0], box[0]), min(line["box"][1], box[1]),
+                           max(line["box"][2], box[2]), max(line["box"][3], box[3]))
+        else:
+            lines[key] = {"words": [word], "box": box}
+    return [{"text": " ".join(line["words"]),
+             "box": (line["box"][0] / width, line["box"][1] / height,
+                     line["box"][2] / width, line["box"][3] / height)}
+            for line in lines.values()]
+
+
+def _coarse_ocr(prepared, label):
+    """Coarse pass over a prepared page: OCR a downscaled copy and keep its line boxes.
+
+    The full-resolution image stays in prepared["image"] for the fine pass. If
+    image_to_data is unavailable the page is OCR'd at full resolution instead
+    and marked final.
+    """
+    image = prepared["image"]
+    coarse = image
+    if OCR_COARSE_SCALE < 1.0:
+        coarse = image.resize((max(1, int(image.width * OCR_COARSE_SCALE)),
+                               max(1, int(image.height * OCR_COARSE_SCALE))), Image.BILINEAR)
+    try:
+        data = pytesseract.image_to_data(coarse, output_type=pytesseract.Output.DICT)
+        lines = _text_lines(data, coarse.width, coarse.height)
+        prepared.update(text="\n".join(line["text"] for line in lines), source="tesseract_coarse",
+                        lines=lines, pixels=coarse.width * coarse.height)
     except Exception as e:
-        print(f"Tesseract failed, trying EasyOCR: {e}")
-    
-    # Fallback to EasyOCR for images
+        print(f"Coarse OCR failed on {label}, OCR'ing it at full resolution: {e}")
+        text, source = recognize_images([image], label)[0]
+        prepared.update(text=text, source=source, pixels=image.width * image.height)
+        prepared.pop("image").close()
+    finally:
+        if coarse is not image:
+            coarse.close()
+    return prepared
+
+
+def _coarse_pdf_pages(path, pages, dpi, poppler_path, steps=None):
+    prepared = [_prepare_pdf_page(path, page, dpi, poppler_path, steps) for page in pages]
+    return [_coarse_ocr(p, f"page {page}") if "image" in p else p for page, p in zip(pages, prepared)]
+
+
+def _read_image(source, steps=None, coarse=False):
+    """Preprocess and OCR an image file; with coarse=True run the coarse pass on it instead."""
     try:
-        reader = get_easyocr_reader()
-        return "\n".join(reader.readtext(path, detail=0))
+        with metrics.stage("preprocess"):
+            image, _ = preprocess(open_image(source, steps), steps)
     except Exception as e:
-        return f"Error extracting text: {str(e)}"
+        return {"text": f"Error extracting text: {str(e)}", "source": "none"}
+    if image is None:
+        return {"text": "", "source": "blank"}
+    if coarse:
+        return _coarse_ocr({"image": image}, "image")
+    # EasyOCR is also tried when the engine finds no text
+    text, source_name = recognize_images([image], "image", fallback_on_empty=True)[0]
+    return {"text": text, "source": source_name}
+
+
+def document_suffix(source, suffix=None):
+    if suffix is None:
+        suffix = "" if isinstance(source, (bytes, bytearray)) else os.path.splitext(source)[1]
+    return suffix.lower()
+
+
+def iter_pages(source, dpi=None, first_page=None, last_page=None, suffix=None, steps=None, coarse=False, step=None):
+    """Read a document (path, or bytes with their suffix) in waves of `step` pages.
+
+    Yields (wave, more) like _iter_pdf; an image is a single one-page wave.
+    Stopping the iteration early skips the remaining pages. Raises OCRError when
+    a PDF can't be read at all.
+
+    coarse=True runs the first pass of two-pass OCR: pages are prepared as
+    usual, but Tesseract reads a copy downscaled by OCR_COARSE_SCALE and reports
+    line boxes. Those results also carry "lines" and the full-resolution "image",
+    which is held until fine_ocr (or release_layout) is called.
+    """
+    if document_suffix(source, suffix) != '.pdf':
+        yield [(1, _read_image(source, steps, coarse))], False
+        return
+    first_page = first_page or OCR_PDF_FIRST_PAGE
+    last_page = OCR_PDF_LAST_PAGE if last_page is None else last_page
+    ocr_pages = _coarse_pdf_pages if coarse else _ocr_pdf_pages
+    yield from _iter_pdf(source, dpi or OCR_PDF_DPI, first_page, last_page, steps, ocr_pages, step)
+
+
+def page_thumbnails(source, suffix=None, dpi=PROBE_DPI):
+    """Low-resolution renders of the pages OCR reads (OCR_PDF_FIRST_PAGE to OCR_PDF_LAST_PAGE), for
+    fingerprinting. Raises when the document can't be rendered."""
+    if document_suffix(source, suffix) != '.pdf':
+        image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        image.draft("L", (256, 256))  # JPEGs decode straight at a fraction of their size
+        factor = min(image.size) // 256
+        if factor > 1:
+            reduced = image.reduce(factor)
+            image.close()
+            image = reduced
+        return [image]
+    with _as_path(source, ".pdf") as path:
+        poppler_path, page_count = _find_poppler_path(path)
+        pages = _page_range(OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE, page_count)
+        return convert_from_path(path, dpi=dpi, first_page=pages[0], last_page=pages[-1],
+                                 poppler_path=poppler_path, grayscale=True)
+
+
+def join_pages(layout, suffix):
+    """Document text and page summaries for {page: result}, as returned by ocr_document.
+
+    suffix is the document's lower-case suffix, as from document_suffix.
+    """
+    empty = "Could not extract text from PDF" if suffix == ".pdf" else ""
+    pages = [_page_summary(page, result) for page, result in layout.items()]
+    return _join_pages((result["text"] for result in layout.values()), empty), pages
+
+
+def select_regions(layout, keywords=(), header=0.0):
+    """Pick the horizontal bands of each page worth a fine pass.
+
+    A band is the top `header` fraction of the first OCR'd page, plus every
+    coarse line mentioning one of the keywords together with the line after it
+    (where values often sit under their labels). Pages whose bands would cover
+    more than OCR_FINE_MAX_COVERAGE of the page get a whole-page pass (None).
+    Returns {page: [(top, bottom), ...] or None}; pages without bands are left out.
+    """
+    regions = {}
+    first = True
+    for page, result in layout.items():
+        if "image" not in result:
+            continue
+        lines = result["lines"]
+        bands = [(0.0, header)] if first and header > 0 else []
+        first = False
+        if lines:
+            heights = sorted(line["box"][3] - line["box"][1] for line in lines)
+            line_height = heights[len(heights) // 2]
+            for line in lines:
+                text = line["text"].lower()
+                if any(keyword in text for keyword in keywords):
+                    bands.append((max(0.0, line["box"][1] - line_height / 2),
+                                  min(1.0, line["box"][3] + 2 * line_height)))
+        merged = []
+        for top, bottom in sorted(bands):
+            if merged and top <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], bottom))
+            else:
+                merged.append((top, bottom))
+        if sum(bottom - top for top, bottom in merged) > OCR_FINE_MAX_COVERAGE:
+            regions[page] = None
+        elif merged:
+            regions[page] = merged
+    return regions
+
+
+def release_layout(layout):
+    for result in layout.values():
+        image = result.pop("image", None)
+        if image is not None:
+            image.close()
+
+
+def fine_ocr(layout, regions):
+    """Second pass: OCR the chosen regions of the held page images at full resolution.
+
+    regions is {page: [(top, bottom), ...] or None for the whole page}, as from
+    select_regions. Returns {page: {"text", "source", "regions", "pixels"}} and
+    releases every page image in layout.
+    """
+    crops = []
+    for page, bands in regions.items():
+        image = layout[page].get("image")
+        if image is None:
+            continue
+        if bands is None:
+            crops.append((page, image))
+            continue
+        for top, bottom in bands:
+            box = (0, int(top * image.height), image.width, max(int(top * image.height) + 1, int(bottom * image.height)))
+            crops.append((page, image.crop(box)))
+    try:
+        size = OCR_BATCH_SIZE if get_engine().batched else 1
+        groups = [crops[i:i + size] for i in range(0, len(crops), size)]
+        workers = max(1, min(OCR_PAGE_WORKERS, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            recognized = pool.map(metrics.carry_context(
+                lambda group: recognize_images([crop for _, crop in group], f"page {group[0][0]}")), groups)
+            texts = [text_source for group_texts in recognized for text_source in group_texts]
+    finally:
+        for page, crop in crops:
+            if crop is not layout[page].get("image"):
+                crop.close()
+        release_layout(layout)
+    fine = {}
+    for (page, crop), (text, source) in zip(crops, texts):
+        result = fine.setdefault(page, {"text": [], "source": source, "regions": regions[page], "pixels": 0})
+        result["pixels"] += crop.width * crop.height
+        if text.strip():
+            result["text"].append(text.strip())
+    for result in fine.values():
+        result["text"] = "\n".join(result["text"])
+    return fine
+
+
+def ocr_document(source, dpi=None, first_page=None, last_page=None, suffix=None, steps=None):
+    """Extract text from an image or PDF. Returns (text, pages) like ocr_pdf.
+
+    source is a file path, or the file's bytes together with its suffix (".pdf", ".png", ...).
+    """
+    # Handle PDF files
+    if document_suffix(source, suffix) == '.pdf':
+        return ocr_pdf(source, dpi=dpi, first_page=first_page, last_page=last_page, steps=steps)
+    
+    # Handle image files
+    result = _read_image(source, steps)
+    return result["text"], [_page_summary(1, result)]
+
+
+def run_ocr(source, dpi=None, first_page=None, last_page=None, suffix=None):
+    """Extract text from image or PDF using Tesseract OCR with EasyOCR fallback."""
+    text, _ = ocr_document(source, dpi=dpi, first_page=first_page, last_page=last_page, suffix=suffix)
+    return text
@@ -0,0 +1,223 @@
+"""
+Write-behind persistence of processed documents.
+
+Saving a document with one session, INSERT and COMMIT per request costs a
+database round trip and a commit (an fsync) on the request path. Instead,
+/process hands its result to enqueue(), which returns as soon as the record is
+queued. A background thread takes records off the queue and writes them with
+one bulk INSERT per batch, flushing when PERSIST_BATCH_SIZE records are waiting
+or PERSIST_FLUSH_INTERVAL seconds after the first of them arrived.
+
+The queue is bounded (PERSIST_QUEUE_SIZE). When the database falls behind,
+enqueue() waits for room, which slows requests down, and raises
+PersistenceBusy after PERSIST_ENQUEUE_TIMEOUT instead of queueing without
+limit. stop() flushes everything still queued, and the API calls it on
+shutdown. A batch that can't be written is appended to the local result log
+(app/result_log.py) so results aren't lost.
+
+save_result() is where every entry point hands a processed document over: to
+Supabase when it is configured, else to the write-behind queue or the result log.
+By then the document has been OCR'd and analyzed, so when the queue stays full
+save_result() appends it to the result log rather than failing the request.
+
+Works with any DATABASE_URL, including SQLite (sqlite:///documents.db).
+"""
+import queue
+import threading
+import time
+from collections import deque
+try:
+    from .config import (PERSIST_WRITE_BEHIND, PERSIST_BATCH_SIZE, PERSIST_FLUSH_INTERVAL, PERSIST_QUEUE_SIZE,
+                         PERSIST_ENQUEUE_TIMEOUT)
+    from .database import save_documents
+    from . import result_log, supabase_io
+except ImportError:
+    from config import (PERSIST_WRITE_BEHIND, PERSIST_BATCH_SIZE, PERSIST_FLUSH_INTERVAL, PERSIST_QUEUE_SIZE,
+                        PERSIST_ENQUEUE_TIMEOUT)
+    from database import save_documents
+    import result_log, supabase_io
+
+_STOP = object()
+
+_queue = queue.Queue(maxsize=PERSIST_QUEUE_SIZE)
+_thread = None
+_lock = threading.Lock()
+_commit_times = deque(maxlen=1000)  # recent bulk insert durations in seconds
+_batch_sizes = deque(maxlen=1000)
+_counters = {"enqueued": 0, "written": 0, "batches": 0, "failed_batches": 0, "fallback_records": 0, "rejected": 0}
+
+
+class PersistenceBusy(Exception):
+    """Raised when the write-behind queue stays full for PERSIST_ENQUEUE_TIMEOUT seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Persistence queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _write_fallback(records):
+    result_log.append_many([{
+        "filename": record["filename"],
+        "document_type": record["doc_type"],
+        "extracted_text": (record["raw_text"] or "")[:1000],
+        "extracted_json": record["extracted"],
+        "file_url": None
+    } for record in records])
+
+
+def _fall_back(records):
+    try:
+        _write_fallback(records)
+        _counters["fallback_records"] += len(records)
+    except Exception as e:
+        print(f"Local fallback write warning: {e}")
+
+
+def _flush(batch):
+    started = time.perf_counter()
+    try:
+        save_documents(batch)
+    except Exception as e:
+        _counters["failed_batches"] += 1
+        print(f"Persistence warning, writing {len(batch)} record(s) to the local result log: {e}")
+        _fall_back(batch)
+        return
+    _commit_times.append(time.perf_counter() - started)
+    _batch_sizes.append(len(batch))
+    _counters["written"] += len(batch)
+    _counters["batches"] += 1
+
+
+def _run():
+    stopping = False
+    while not stopping:
+        item = _queue.get()
+        if item is _STOP:
+            break
+        batch = [item]
+        deadline = time.monotonic() + PERSIST_FLUSH_INTERVAL
+        while len(batch) < PERSIST_BATCH_SIZE:
+            try:
+                item = _queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        _flush(batch)
+    # Drain whatever was queued behind the stop marker
+    rest = []
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _STOP:
+            rest.append(item)
+    for start in range(0, len(rest), PERSIST_BATCH_SIZE):
+        _flush(rest[start:start + PERSIST_BATCH_SIZE])
+
+
+def start():
+    """Start the writer thread if it isn't running."""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="persistence-writer", daemon=True)
+            _thread.start()
+
+
+def _retry_after():
+    if not _commit_times:
+        return 1
+    avg_commit = sum(_commit_times) / len(_commit_times)
+    batches_queued = _queue.qsize() / max(1, PERSIST_BATCH_SIZE)
+    return max(1, int(avg_commit * batches_queued + PERSIST_FLUSH_INTERVAL + 0.999))
+
+
+def enqueue(filename, doc_type, raw_text, extracted, timeout=None):
+    """Queue a document for the next bulk insert. Blocks while the queue is full (back-pressure).
+
+    Raises PersistenceBusy if there is still no room after timeout seconds
+    (PERSIST_ENQUEUE_TIMEOUT by default).
+    """
+    start()
+    record = {"filename": filename, "doc_type": doc_type, "raw_text": raw_text, "extracted": extracted}
+    try:
+        _queue.put(record, timeout=PERSIST_ENQUEUE_TIMEOUT if timeout is None else timeout)
+    except queue.Full:
+        _counters["rejected"] += 1
+        raise PersistenceBusy(_retry_after())
+    _counters["enqueued"] += 1
+
+
+def save_result(filename, storage_path, file_url, doc_type, cleaned, extracted_json, upload=None):
+    """Save to Supabase DB (optional), in the background once the upload future is done. If Supabase
+    is not configured, queue the document for the write-behind persister (PERSIST_WRITE_BEHIND) or
+    append it to the local result log."""
+    if supabase_io.ENABLED:
+        supabase_io.submit_insert({
+            "filename": filename,
+            "storage_path": storage_path,
+            "file_url": file_url,
+            "document_type": doc_type,
+            "extracted_text": cleaned[:1000],
+            "extracted_json": extracted_json
+        }, upload)
+    elif PERSIST_WRITE_BEHIND:
+        # Queued for the next bulk insert into the documents table
+        try:
+            enqueue(filename, doc_type, cleaned, extracted_json)
+        except PersistenceBusy:
+            print("Persistence warning, queue full: writing the record to the local result log")
+            _fall_back([{"filename": filename, "doc_type": doc_type, "raw_text": cleaned, "extracted": extracted_json}])
+    else:
+        # fallback local persistence (append to the result log)
+        try:
+            record_id = result_log.append({
+                "filename": filename,
+                "document_type": doc_type,
+                "extracted_text": cleaned[:1000],
+                "extracted_json": extracted_json,
+                "file_url": None
+            })
+            print(f"Wrote fallback record {record_id} to the local result log")
+        except Exception as e:
+            print(f"Local fallback write warning: {e}")
+
+
+def stop(timeout=30):
+    """Flush everything queued and stop the writer thread."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            return
+        _queue.put(_STOP)
+        _thread.join(timeout)
+        if _thread.is_alive():
+            print(f"Persistence warning: writer still busy after {timeout}s, {_queue.qsize()} record(s) queued")
+        _thread = None
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def persistence_stats():
+    """Queue depth, batch sizes and commit latency of the bulk inserts."""
+    commits = list(_commit_times)
+    sizes = list(_batch_sizes)
+    return {
+        "queued": _queue.qsize(),
+        "queue_limit": PERSIST_QUEUE_SIZE,
+        **_counters,
+        "batch_size_avg": round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+        "batch_size_max": max(sizes) if sizes else 0,
+        "commit_ms_avg": round(1000 * sum(commits) / len(commits), 1) if commits else 0.0,
+        "commit_ms_p95": round(1000 * _percentile(commits, 95), 1),
+        "commit_ms_max": round(1000 * max(commits), 1) if commits else 0.0,
+    }
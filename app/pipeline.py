@@ -0,0 +1,383 @@
+"""
+Staged document pipeline, shared by the API, the standalone app and the job worker.
+
+A DocumentPipeline takes documents through a list of Stages. A document is a
+dict (filename, content, result, ...); every stage reads what it needs from it
+and adds its own keys. Each stage declares the kind of work it does, which
+decides where it runs:
+
+- "cpu": OCR, classification and extraction, in the worker process pool
+  (workers.submit). The pool admits OCR_POOL_SIZE running and OCR_QUEUE_DEPTH
+  waiting documents and raises PoolBusy past that.
+- "io": storage, cache and database calls. Coroutine functions are awaited on
+  the event loop, plain functions run in the thread pool.
+- "inline": cheap checks, called directly on the event loop.
+
+A stage with a limit runs at most `limit` documents at once, and at most
+`queue` more wait in front of it. A document that has finished a stage keeps
+its place there until the next stage has room. When a stage falls behind (a
+slow database, say), the queues in front of it fill up one by one back to the
+start of the pipeline, and new documents wait or are turned away at the door
+instead of piling up in memory. Limits belong to the stage objects, so
+pipelines sharing a stage share its limit: tuning a stage tunes every entry
+point that runs it.
+
+build_pipeline() puts together the pipeline every entry point runs: cache
+lookup, upload, the pool stages, text check, near-duplicate linking, cache
+store and persistence.
+Entry points only add their own intake stage in front (READ, for uploads) and
+handle the finished document.
+
+run() takes one document through (a /process request). run_many() streams
+documents through, at most `window` at once, and yields them as they finish
+(/process/batch, the job worker). A stage ends a document's run early by
+returning {"done": True} (a cache hit, say). Stage timings go into the
+document's trace (see app/metrics.py).
+"""
+import asyncio
+import time
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+try:
+    from .config import (PIPELINE_QUEUE_DEPTH, PIPELINE_ANALYZE_CONCURRENCY, PIPELINE_IO_CONCURRENCY,
+                         RESULT_CACHE_ENABLED, NEAR_DUP_ENABLED)
+    from . import cache, metrics, near_dup, supabase_io
+    from .persistence import save_result
+    from .uploads import read_upload, validate_extension
+    from .workers import submit, process_file, ocr_file, analyze_ocr
+except ImportError:
+    from config import (PIPELINE_QUEUE_DEPTH, PIPELINE_ANALYZE_CONCURRENCY, PIPELINE_IO_CONCURRENCY,
+                        RESULT_CACHE_ENABLED, NEAR_DUP_ENABLED)
+    import cache, metrics, near_dup, supabase_io
+    from persistence import save_result
+    from uploads import read_upload, validate_extension
+    from workers import submit, process_file, ocr_file, analyze_ocr
+
+KINDS = ("cpu", "io", "inline")
+
+
+class StageBusy(Exception):
+    """Raised by run(block=False) when a stage before the pool has no room left in its queue."""
+
+    def __init__(self, stage, retry_after=1):
+        super().__init__(f"Pipeline stage {stage} is busy, retry after {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Stage:
+    """One step of a DocumentPipeline.
+
+    run(doc) returns a dict of keys to add to the document (or None). With
+    needs, it is called as run(doc[need], ...) instead, and with output its
+    return value is stored as doc[output]; "cpu" stages work this way, since
+    only those values can be sent to a pool worker. A pool worker's trace,
+    returned with its result, is merged into the document's.
+    """
+
+    def __init__(self, name, run, kind="inline", limit=None, queue=PIPELINE_QUEUE_DEPTH, needs=None, output=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown stage kind {kind!r}, expected one of {KINDS}")
+        if kind == "cpu" and not (needs and output):
+            raise ValueError(f"cpu stage {name} needs `needs` and `output`")
+        self.name = name
+        self.run = run
+        self.kind = kind
+        self.limit = limit
+        self.queue = queue
+        self.needs = needs
+        self.output = output
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0}
+        self._loop = None
+
+    def _bind(self):
+        # asyncio semaphores belong to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.limit)
+            self._room = asyncio.Semaphore(self.limit + self.queue)
+            self.inside = 0  # documents holding a place: running, waiting to run or waiting for the next stage
+            self.running = 0
+
+    async def enter(self, block):
+        """Take a place in this stage's queue, waiting for one unless block is False."""
+        self._bind()
+        if not block and self._room.locked():
+            self.counters["rejected"] += 1
+            raise StageBusy(self.name)
+        await self._room.acquire()
+        self.inside += 1
+
+    def leave(self):
+        self.inside -= 1
+        self._room.release()
+
+    async def execute(self, doc, block, limit=None):
+        """Run the stage on doc, within its own limit and the run's limit (a semaphore) if any.
+
+        Returns the keys to add to doc.
+        """
+        started = time.perf_counter()
+        if self.limit:
+            await self._slots.acquire()
+            metrics.add_time(f"wait_{self.name}", time.perf_counter() - started)
+            self.running += 1
+        try:
+            if limit is not None:
+                async with limit:
+                    updates = await self._call(doc, block)
+            else:
+                updates = await self._call(doc, block)
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            if self.limit:
+                self.running -= 1
+                self._slots.release()
+        self.counters["completed"] += 1
+        return updates
+
+    async def _call(self, doc, block):
+        args = [doc[need] for need in self.needs] if self.needs else [doc]
+        if self.kind == "cpu":
+            value = await submit(self.run, *args, block=block)
+        elif self.kind == "inline":
+            value = self.run(*args)
+        else:
+            with metrics.stage(self.name):
+                if asyncio.iscoroutinefunction(self.run):
+                    value = await self.run(*args)
+                else:
+                    value = await run_in_threadpool(self.run, *args)
+        if self.output is None:
+            return dict(value or {})
+        if isinstance(value, dict) and "trace" in value:
+            # Stage timings from the worker go into the request's trace, not into the result
+            metrics.merge(metrics.current(), value.pop("trace"))
+        return {self.output: value}
+
+    def stats(self):
+        limited = self.limit and self._loop is not None
+        return {
+            "kind": self.kind,
+            "limit": self.limit,
+            "queue": self.queue if self.limit else None,
+            "running": self.running if limited else None,
+            "waiting": self.inside - self.running if limited else None,
+            **self.counters,
+        }
+
+
+class DocumentPipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    async def run(self, doc, block=False, limits=None):
+        """Take doc through the stages and return it. Exceptions from a stage propagate.
+
+        With block=False, a document that finds no room in a stage before the
+        pool is turned away (StageBusy), and the pool rejects it when full
+        (PoolBusy). Once the pool has worked on it, it always waits for room, so
+        finished work is never thrown away. limits: {stage name: semaphore} of
+        this run only, on top of the stages' own limits.
+        """
+        held = None  # the limited stage the document still has a place in
+        committed = False
+        with metrics.tracing(doc.setdefault("trace", metrics.new_trace())):
+            try:
+                for stage in self.stages:
+                    if stage.limit:
+                        await stage.enter(block or committed)
+                    if held is not None:
+                        held.leave()
+                    held = stage if stage.limit else None
+                    updates = await stage.execute(doc, block or committed, (limits or {}).get(stage.name))
+                    committed = committed or stage.kind == "cpu"
+                    done = updates.pop("done", False)
+                    doc.update(updates)
+                    if done:
+                        break
+            finally:
+                if held is not None:
+                    held.leave()
+        return doc
+
+    async def run_many(self, docs, window=None, limits=None):
+        """Run documents from docs (an iterable or async iterable), at most window at once (None: all).
+
+        Yields (doc, None) or (doc, exception) as each one finishes. The next
+        document is only taken from docs when there is room, so a source that
+        claims work (the job queue) never claims more than it can start.
+        limits: {stage name: n} for this run only, e.g. how many of a batch's
+        documents may hold pool workers at once.
+        """
+        semaphores = {name: asyncio.Semaphore(n) for name, n in (limits or {}).items()}
+
+        async def one(doc):
+            try:
+                await self.run(doc, block=True, limits=semaphores)
+            except Exception as e:
+                return doc, e
+            return doc, None
+
+        source = docs.__aiter__() if hasattr(docs, "__aiter__") else _as_async(docs)
+        pending = set()
+        taking = None  # task fetching the next document
+        try:
+            while True:
+                if taking is None and source is not None and (window is None or len(pending) < window):
+                    taking = asyncio.ensure_future(source.__anext__())
+                if not pending and taking is None:
+                    return
+                done, _ = await asyncio.wait(pending | ({taking} if taking else set()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if taking in done:
+                    try:
+                        pending.add(asyncio.ensure_future(one(taking.result())))
+                    except StopAsyncIteration:
+                        source = None
+                    taking = None
+                for task in done & pending:
+                    pending.discard(task)
+                    yield task.result()
+        finally:
+            for task in pending | ({taking} if taking else set()):
+                task.cancel()
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+async def _as_async(items):
+    for item in items:
+        yield item
+
+
+def pipeline_stats(*pipelines):
+    """Running, waiting and completed documents per stage, across pipelines (for /stats)."""
+    stats = {}
+    for pipeline in pipelines:
+        stats.update(pipeline.stats())
+    return stats
+
+
+# The intake of the upload endpoints (/process, /process/batch and main_standalone.py). The
+# document dict starts out as {"file": UploadFile}.
+
+async def read_stage(doc):
+    file = doc["file"]
+    suffix = validate_extension(file.filename)
+    # Read file content, stopping as soon as it is over the size limit
+    return {"filename": file.filename, "content_type": file.content_type, "suffix": suffix,
+            "content": await read_upload(file)}
+
+
+READ = Stage("read_upload", read_stage, "io")
+
+
+# The pool stages every entry point shares. PROCESS runs the whole pipeline in a
+# worker; OCR + ANALYZE split it so the pool moves on to the next document while
+# this one is classified and extracted in the calling process (see workers.PIPELINED_ANALYSIS).
+PROCESS = Stage("process", process_file, "cpu", needs=("content", "suffix"), output="result")
+OCR = Stage("ocr", ocr_file, "cpu", needs=("content", "suffix"), output="ocr_output")
+ANALYZE = Stage("analyze", analyze_ocr, "io", limit=PIPELINE_ANALYZE_CONCURRENCY, needs=("ocr_output",),
+                output="result")
+
+
+async def lookup_cache(content, file_ext):
+    """Return (cache key, cached result or None). Cache problems never fail a request."""
+    if not RESULT_CACHE_ENABLED:
+        return None, None
+    try:
+        key = cache.cache_key(content, file_ext)
+        cached = await run_in_threadpool(cache.get, key)
+        if cached:
+            metrics.count("cache_hit")
+        return key, cached
+    except Exception as e:
+        print(f"Result cache warning: {e}")
+        return None, None
+
+
+async def store_cache(key, result):
+    if key:
+        try:
+            await run_in_threadpool(cache.put, key, result)
+        except Exception as e:
+            print(f"Result cache warning: {e}")
+
+
+# The stages around the pool stages. A document reaches them with "filename",
+# "content_type", "suffix" and "content" set by the entry point's intake.
+
+async def cache_lookup_stage(doc):
+    # Identical uploads (retries, re-posts) are answered from the result cache
+    key, cached = await lookup_cache(doc["content"], doc["suffix"])
+    if cached:
+        return {"cache_key": key, "result": cached, "cached": True, "done": True}
+    return {"cache_key": key}
+
+
+async def upload_start_stage(doc):
+    # Upload to Supabase Storage (optional), concurrently with processing
+    return {"upload": await supabase_io.start_upload(doc["content"], doc["filename"], doc.get("content_type"))}
+
+
+def check_text_stage(doc):
+    if doc["result"]["cleaned"] is None:
+        raise HTTPException(status_code=400, detail="Could not extract text from document")
+
+
+async def near_dup_stage(doc):
+    # Link the result to an earlier document with near-identical text, or index it under this
+    # document's filename and cache key for later ones to link to
+    result = {key: value for key, value in doc["result"].items() if key != "page_hashes"}
+    document = {"filename": doc["filename"], "cache_key": doc.get("cache_key")}
+    result = await run_in_threadpool(near_dup.remember, result, doc["result"].get("page_hashes"), document)
+    if result.get("near_duplicate", {}).get("match") == "text":
+        metrics.count("near_duplicate_text")
+    return {"result": result}
+
+
+async def cache_store_stage(doc):
+    await store_cache(doc["cache_key"], doc["result"])
+
+
+async def upload_wait_stage(doc):
+    file_url, storage_path = await supabase_io.upload_result(doc["upload"])
+    return {"file_url": file_url, "storage_path": storage_path}
+
+
+def persist_stage(doc):
+    """Save doc["result"] under doc["filename"] (see persistence.save_result)."""
+    result = doc["result"]
+    save_result(doc["filename"], doc["storage_path"], doc["file_url"], result["document_type"],
+                result["cleaned"], result["extracted"], doc["upload"])
+
+
+CACHE_LOOKUP = Stage("cache_lookup", cache_lookup_stage, "io", limit=PIPELINE_IO_CONCURRENCY)
+UPLOAD_START = Stage("upload_start", upload_start_stage, "io")
+CHECK_TEXT = Stage("check_text", check_text_stage)
+NEAR_DUP = Stage("near_dup_text", near_dup_stage, "io", limit=PIPELINE_IO_CONCURRENCY)
+CACHE_STORE = Stage("cache_store", cache_store_stage, "io", limit=PIPELINE_IO_CONCURRENCY)
+UPLOAD_WAIT = Stage("upload_wait", upload_wait_stage, "io")
+PERSIST = Stage("persist", persist_stage, "io", limit=PIPELINE_IO_CONCURRENCY)
+
+
+def build_pipeline(processing, intake=()):
+    """The pipeline of every entry point: intake stages, then processing (the pool stages) wrapped in the
+    shared cache, upload, text check, near-duplicate and persist stages.
+
+    A document without text fails check_text with a 400 HTTPException; a cache hit ends the run early
+    with "cached" set.
+    """
+    before = [CACHE_LOOKUP] if RESULT_CACHE_ENABLED else []
+    after = [CHECK_TEXT]
+    if NEAR_DUP_ENABLED:
+        after.append(NEAR_DUP)
+    if RESULT_CACHE_ENABLED:
+        after.append(CACHE_STORE)
+    return DocumentPipeline(list(intake) + before + [UPLOAD_START] + list(processing) + after
+                            + [UPLOAD_WAIT, PERSIST])
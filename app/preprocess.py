@@ -0,0 +1,247 @@
+"""
+Image preprocessing before OCR.
+
+Tesseract's run time grows with pixel count, and most uploads carry far more
+pixels than it needs. Each step here can be switched on or off (PREPROCESS_*
+settings, or an explicit steps dict as used by tools/preprocess_report.py):
+
+- blank:     skip pages with no ink, judged on a thumbnail
+- jpeg_draft: decode JPEGs at a reduced scale straight from the DCT data
+- grayscale: OCR one channel instead of three
+- crop:      cut white margins
+- deskew:    straighten pages scanned at a slight angle
+- scale:     downscale so text lines are about PREPROCESS_TARGET_LINE_HEIGHT px
+             tall (for PDFs this picks the render DPI instead)
+- binarize:  Otsu threshold to pure black and white
+
+All measurements are made on a small thumbnail, so the steps themselves cost a
+few milliseconds per page.
+"""
+import io
+import numpy as np
+from PIL import Image
+try:
+    from .config import (PREPROCESS_ENABLED, PREPROCESS_BLANK, PREPROCESS_JPEG_DRAFT, PREPROCESS_GRAYSCALE,
+                         PREPROCESS_CROP, PREPROCESS_DESKEW, PREPROCESS_SCALE, PREPROCESS_BINARIZE,
+                         PREPROCESS_TARGET_LINE_HEIGHT)
+except ImportError:
+    from config import (PREPROCESS_ENABLED, PREPROCESS_BLANK, PREPROCESS_JPEG_DRAFT, PREPROCESS_GRAYSCALE,
+                        PREPROCESS_CROP, PREPROCESS_DESKEW, PREPROCESS_SCALE, PREPROCESS_BINARIZE,
+                        PREPROCESS_TARGET_LINE_HEIGHT)
+
+DEFAULT_STEPS = {
+    "blank": PREPROCESS_BLANK,
+    "jpeg_draft": PREPROCESS_JPEG_DRAFT,
+    "grayscale": PREPROCESS_GRAYSCALE,
+    "crop": PREPROCESS_CROP,
+    "deskew": PREPROCESS_DESKEW,
+    "scale": PREPROCESS_SCALE,
+    "binarize": PREPROCESS_BINARIZE,
+}
+NO_STEPS = {step: False for step in DEFAULT_STEPS}
+
+THUMBNAIL_SIZE = 800  # longest side of the image used for measurements
+MIN_SCALE = 0.25
+INK_CONTRAST = 40  # on a light page, ink is at least this much darker than the paper
+MIN_INK_PIXELS = 20  # ink pixels (touching another one, so specks don't count) a thumbnail needs not to be blank
+
+
+def active_steps(steps=None):
+    if steps is not None:
+        return {**NO_STEPS, **steps}
+    return DEFAULT_STEPS if PREPROCESS_ENABLED else NO_STEPS
+
+
+def _otsu_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_dark = np.cumsum(hist)
+    weight_light = gray.size - weight_dark
+    cum_mean = np.cumsum(hist * levels)
+    mean_dark = cum_mean / np.maximum(weight_dark, 1)
+    mean_light = (cum_mean[-1] - cum_mean) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+def _thumbnail(image):
+    """Grayscale copy no larger than THUMBNAIL_SIZE, and the factor it was shrunk by."""
+    thumb = image.convert("L")
+    ratio = min(1.0, THUMBNAIL_SIZE / max(thumb.size))
+    if ratio < 1.0:
+        thumb = thumb.resize((max(1, int(thumb.width * ratio)), max(1, int(thumb.height * ratio))), Image.BILINEAR)
+    return thumb, ratio
+
+
+def _ink_mask(gray):
+    """Boolean array of 'ink' pixels.
+
+    Otsu's threshold alone splits scanner noise on an empty page, so on a light
+    page ink must also be INK_CONTRAST darker than the paper (the median). This
+    is judged per pixel, so a single line of text on a full page still counts.
+    """
+    threshold = _otsu_threshold(gray)
+    background = float(np.median(gray))
+    if background >= 128:
+        threshold = min(threshold, background - INK_CONTRAST)
+    return gray < threshold
+
+
+def is_blank(mask):
+    """True when the mask has fewer than MIN_INK_PIXELS ink pixels with an ink neighbour."""
+    if mask.sum() < MIN_INK_PIXELS:
+        return True
+    height, width = mask.shape
+    padded = np.pad(mask, 1)
+    neighbours = np.zeros(mask.shape, dtype=bool)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if (dy, dx) != (1, 1):
+                neighbours |= padded[dy:dy + height, dx:dx + width]
+    return int((mask & neighbours).sum()) < MIN_INK_PIXELS
+
+
+def line_height(mask):
+    """Median height in pixels of the text lines in an ink mask, or None if too few lines."""
+    rows = mask.mean(axis=1) > 0.005
+    runs = []
+    run = 0
+    for has_ink in rows:
+        if has_ink:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    if run:
+        runs.append(run)
+    runs = [r for r in runs if r >= 2]
+    if len(runs) < 3:
+        return None
+    return float(np.median(runs))
+
+
+def skew_angle(mask, max_angle=5.0, step=0.5):
+    """Angle in degrees that makes text lines horizontal, by maximising projection-profile variance."""
+    ink = Image.fromarray((mask * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        profile = np.asarray(ink.rotate(angle, resample=Image.NEAREST)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def scale_for(height_px):
+    """Resize factor that brings text lines of height_px to the target height (never upscales)."""
+    if not height_px:
+        return 1.0
+    return max(MIN_SCALE, min(1.0, PREPROCESS_TARGET_LINE_HEIGHT / height_px))
+
+
+def _open(source):
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def open_image(source, steps=None):
+    """Open an image path or bytes, decoding JPEGs at a reduced scale when the text allows it."""
+    steps = active_steps(steps)
+    image = _open(source)
+    if not (steps["jpeg_draft"] and steps["scale"] and image.format == "JPEG"):
+        return image
+
+    # Measure text size on a 1/8 scale DCT decode, then decode at the coarsest scale that keeps it readable
+    width, height = image.size
+    probe = _open(source)
+    probe.draft("L", (width // 8, height // 8))
+    mask = _ink_mask(np.asarray(probe.convert("L")))
+    if is_blank(mask):
+        return image
+    probe_line = line_height(mask)
+    if probe_line is None:
+        return image
+    factor = scale_for(probe_line * width / probe.width)
+    if factor < 1.0:
+        image.draft("L" if steps["grayscale"] else image.mode, (int(width * factor), int(height * factor)))
+    return image
+
+
+def plan_pdf_render(probe, probe_dpi, max_dpi, min_dpi, steps=None):
+    """Pick the DPI to render a PDF page at from a low-resolution probe render of it.
+
+    Returns None when the page is blank and doesn't need rendering at all.
+    """
+    steps = active_steps(steps)
+    mask = _ink_mask(np.asarray(_thumbnail(probe)[0]))
+    if steps["blank"] and is_blank(mask):
+        return None
+    if not steps["scale"] or not mask.any():
+        return max_dpi
+    probe_line = line_height(mask)
+    if probe_line is None:
+        return max_dpi
+    probe_line /= min(1.0, THUMBNAIL_SIZE / max(probe.size))
+    wanted = probe_dpi * PREPROCESS_TARGET_LINE_HEIGHT / probe_line
+    return int(max(min_dpi, min(max_dpi, wanted)))
+
+
+def preprocess(image, steps=None):
+    """Apply the enabled steps to a PIL image.
+
+    Returns (image, info); image is None when the page is blank and should be skipped.
+    """
+    steps = active_steps(steps)
+    info = {}
+    if not any(steps.values()):
+        return image, info
+
+    if steps["grayscale"] and image.mode != "L":
+        image = image.convert("L")
+
+    thumb, ratio = _thumbnail(image)
+    gray = np.asarray(thumb)
+    mask = _ink_mask(gray)
+    if steps["blank"] and is_blank(mask):
+        info["blank"] = True
+        return None, info
+    if not mask.any():
+        return image, info
+
+    if steps["crop"]:
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size and cols.size:
+            pad = int(0.01 * max(image.size)) + 1
+            box = (
+                max(0, int(cols[0] / ratio) - pad),
+                max(0, int(rows[0] / ratio) - pad),
+                min(image.width, int((cols[-1] + 1) / ratio) + pad),
+                min(image.height, int((rows[-1] + 1) / ratio) + pad),
+            )
+            if box != (0, 0, image.width, image.height):
+                image = image.crop(box)
+                mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+                info["crop"] = list(box)
+
+    if steps["deskew"]:
+        angle = skew_angle(mask)
+        if abs(angle) >= 0.5:
+            fill = 255 if image.mode == "L" else (255,) * len(image.getbands())
+            image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=fill)
+            # Measure line height on straight lines; skewed ones smear across extra rows
+            mask = np.asarray(Image.fromarray((mask * 255).astype(np.uint8)).rotate(angle, expand=True)) > 127
+            info["skew"] = angle
+
+    if steps["scale"]:
+        height = line_height(mask)
+        factor = scale_for(height / ratio if height else None)
+        if factor < 1.0:
+            image = image.resize((max(1, int(image.width * factor)), max(1, int(image.height * factor))), Image.LANCZOS)
+            info["scale"] = round(factor, 3)
+
+    if steps["binarize"]:
+        gray_full = np.asarray(image.convert("L"))
+        image = Image.fromarray(np.where(gray_full < _otsu_threshold(gray_full), 0, 255).astype(np.uint8))
+        info["binarize"] = True
+
+    return image, info
@@ -0,0 +1,311 @@
+"""
+Append-only local log of processed documents, for when no database takes them.
+
+    <RESULT_LOG_DIR>/
+        segment-000001.jsonl   one JSON record per line; a new segment is started once
+        segment-000002.jsonl   the current one would grow past RESULT_LOG_SEGMENT_BYTES
+        index.sqlite3          sidecar index: id -> (segment, offset, length), plus
+                               doc_type, timestamp and replay status
+        .lock
+
+Appends from any number of threads and processes (uvicorn workers) are
+serialized by a lock file, so lines never interleave. Each append writes the
+line, then indexes it, so get(id) reads exactly one line instead of scanning
+files, and find() filters by doc_type and time through the index. If a process
+dies between the two steps, the next append indexes the lines it left behind
+(and terminates a torn last line), and reindex() rebuilds the index from the
+segments at any time.
+
+RESULT_LOG_FSYNC sets durability: "always" fsyncs every append, "interval"
+fsyncs at most once per RESULT_LOG_FSYNC_INTERVAL seconds (when an append
+comes in), "never" leaves it to the OS.
+
+tools/replay_result_log.py backfills logged records into the database or
+Supabase once they are reachable again.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+try:
+    from .config import RESULT_LOG_DIR, RESULT_LOG_SEGMENT_BYTES, RESULT_LOG_FSYNC, RESULT_LOG_FSYNC_INTERVAL
+except ImportError:
+    from config import RESULT_LOG_DIR, RESULT_LOG_SEGMENT_BYTES, RESULT_LOG_FSYNC, RESULT_LOG_FSYNC_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+_thread_lock = threading.Lock()  # the lock file only excludes other processes
+_conn = None
+_fds = {}  # segment name -> fd opened for appending
+_last_fsync = 0.0
+
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+
+def _segment_number(name):
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def segments():
+    """Segment file names, oldest first."""
+    if not os.path.isdir(RESULT_LOG_DIR):
+        return []
+    return sorted(name for name in os.listdir(RESULT_LOG_DIR)
+                  if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+
+def _index():
+    global _conn
+    if _conn is None:
+        os.makedirs(RESULT_LOG_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(RESULT_LOG_DIR, "index.sqlite3"), timeout=30,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "seq INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, segment TEXT NOT NULL, "
+            "offset INTEGER NOT NULL, length INTEGER NOT NULL, doc_type TEXT, timestamp INTEGER, replayed TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS records_type_time ON records (doc_type, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS records_time ON records (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS records_pending ON records (replayed, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, segment TEXT, indexed_end INTEGER)")
+        _conn = conn
+    return _conn
+
+
+@contextmanager
+def _locked():
+    """Hold the log for this thread and process."""
+    with _thread_lock:
+        os.makedirs(RESULT_LOG_DIR, exist_ok=True)
+        with open(os.path.join(RESULT_LOG_DIR, ".lock"), "a+b") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield _index()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _fd(segment):
+    fd = _fds.get(segment)
+    if fd is None:
+        fd = os.open(os.path.join(RESULT_LOG_DIR, segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        _fds[segment] = fd
+    return fd
+
+
+def _index_rows(segment, data, start):
+    """Index rows for the complete lines in data, which starts at offset start of segment."""
+    rows = []
+    offset = start
+    for line in data.splitlines(keepends=True):
+        if line.endswith(b"\n"):
+            try:
+                record = json.loads(line)
+                rows.append((record["id"], segment, offset, len(line), record.get("document_type"), record.get("timestamp")))
+            except (ValueError, KeyError, TypeError):
+                print(f"Result log warning: skipping unreadable line at {segment}:{offset}")
+        offset += len(line)
+    return rows
+
+
+def _insert_rows(conn, rows):
+    conn.executemany(
+        "INSERT OR IGNORE INTO records (id, segment, offset, length, doc_type, timestamp) VALUES (?, ?, ?, ?, ?, ?)", rows
+    )
+
+
+def _catch_up(conn, segment, indexed_end):
+    """Index lines appended after indexed_end by a process that died before indexing them."""
+    path = os.path.join(RESULT_LOG_DIR, segment)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size <= indexed_end:
+        return size
+    with open(path, "rb") as f:
+        f.seek(indexed_end)
+        data = f.read()
+    _insert_rows(conn, _index_rows(segment, data, indexed_end))
+    if not data.endswith(b"\n"):
+        # Terminate a torn last line so the next record starts on a line of its own
+        os.write(_fd(segment), b"\n")
+        size += 1
+    return size
+
+
+def _sync(fd):
+    global _last_fsync
+    if RESULT_LOG_FSYNC == "always" or (
+            RESULT_LOG_FSYNC == "interval" and time.monotonic() - _last_fsync >= RESULT_LOG_FSYNC_INTERVAL):
+        os.fsync(fd)
+        _last_fsync = time.monotonic()
+
+
+def append_many(records):
+    """Append records (dicts) to the log in one write. Missing "id" and "timestamp" are filled in.
+
+    Returns the record ids.
+    """
+    records = [{"id": uuid.uuid4().hex, "timestamp": int(time.time()), **record} for record in records]
+    if not records:
+        return []
+    lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+    with _locked() as conn:
+        row = conn.execute("SELECT segment, indexed_end FROM state WHERE name = 'active'").fetchone()
+        if row is None and segments():
+            # Segments without an index (deleted or never built): index them all first
+            _rebuild(conn)
+            row = conn.execute("SELECT segment, indexed_end FROM state WHERE name = 'active'").fetchone()
+        segment, size = (row[0], _catch_up(conn, *row)) if row else (_segment_name(1), 0)
+        if size and size + sum(map(len, lines)) > RESULT_LOG_SEGMENT_BYTES:
+            segment, size = _segment_name(_segment_number(segment) + 1), 0
+        for name in [name for name in _fds if name != segment]:
+            os.close(_fds.pop(name))  # segments other processes (or we) rotated away from
+        fd = _fd(segment)
+        data = b"".join(lines)
+        os.write(fd, data)
+        _sync(fd)
+        conn.execute("BEGIN")
+        _insert_rows(conn, _index_rows(segment, data, size))
+        conn.execute("INSERT OR REPLACE INTO state VALUES ('active', ?, ?)", (segment, size + len(data)))
+        conn.execute("COMMIT")
+    return [record["id"] for record in records]
+
+
+def append(record):
+    """Append one record to the log. Returns its id."""
+    return append_many([record])[0]
+
+
+def _read(segment, offset, length):
+    with open(os.path.join(RESULT_LOG_DIR, segment), "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+def get(record_id):
+    """The record with this id, or None. Reads one line through the index."""
+    row = _index().execute("SELECT segment, offset, length FROM records WHERE id = ?", (record_id,)).fetchone()
+    return _read(*row) if row else None
+
+
+def find(doc_type=None, since=None, until=None, limit=100):
+    """Records by document type and/or timestamp range (unix seconds), newest first."""
+    clauses, params = [], []
+    if doc_type is not None:
+        clauses.append("doc_type = ?")
+        params.append(doc_type)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = _index().execute(
+        f"SELECT segment, offset, length FROM records {where} ORDER BY timestamp DESC, seq DESC LIMIT ?", (*params, limit)
+    ).fetchall()
+    return [_read(*row) for row in rows]
+
+
+def iter_records():
+    """Every record in the log, oldest first, streamed segment by segment."""
+    for segment in segments():
+        with open(os.path.join(RESULT_LOG_DIR, segment), "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+def pending(limit):
+    """Up to limit records not replayed yet, oldest first, as (seq, record)."""
+    rows = _index().execute(
+        "SELECT seq, segment, offset, length FROM records WHERE replayed IS NULL ORDER BY seq LIMIT ?", (limit,)
+    ).fetchall()
+    return [(row[0], _read(*row[1:])) for row in rows]
+
+
+def pending_count():
+    return _index().execute("SELECT COUNT(*) FROM records WHERE replayed IS NULL").fetchone()[0]
+
+
+def mark_replayed(seqs, target):
+    with _thread_lock:
+        _index().executemany("UPDATE records SET replayed = ? WHERE seq = ?", [(target, seq) for seq in seqs])
+
+
+def _rebuild(conn):
+    replayed = dict(conn.execute("SELECT id, replayed FROM records WHERE replayed IS NOT NULL").fetchall())
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM records")
+    conn.execute("DELETE FROM state")
+    existing = segments()
+    for segment in existing:
+        with open(os.path.join(RESULT_LOG_DIR, segment), "rb") as f:
+            offset = 0
+            for chunk in iter(lambda: f.readlines(16 * 1024 * 1024), []):
+                data = b"".join(chunk)
+                _insert_rows(conn, _index_rows(segment, data, offset))
+                offset += len(data)
+    if existing:
+        conn.execute("INSERT INTO state VALUES ('active', ?, ?)",
+                     (existing[-1], os.path.getsize(os.path.join(RESULT_LOG_DIR, existing[-1]))))
+    conn.executemany("UPDATE records SET replayed = ? WHERE id = ?", [(t, i) for i, t in replayed.items()])
+    conn.execute("COMMIT")
+
+
+def reindex():
+    """Rebuild the index from the segments (replay status is kept for records still present)."""
+    with _locked() as conn:
+        _rebuild(conn)
+        return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def import_jsonl(path, batch_size=1000):
+    """Move the records of an old processed_documents.jsonl into the log. Returns how many were imported."""
+    imported = 0
+    batch = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(batch) == batch_size:
+                imported += len(append_many(batch))
+                batch = []
+    return imported + len(append_many(batch))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "import":
+        print(f"Imported {import_jsonl(sys.argv[2])} record(s) into {RESULT_LOG_DIR}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "reindex":
+        print(f"Indexed {reindex()} record(s) in {RESULT_LOG_DIR}")
+    else:
+        sys.exit("Usage: python -m app.result_log import <processed_documents.jsonl> | reindex")
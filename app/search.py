@@ -0,0 +1,133 @@
+"""
+Search over processed documents, for GET /documents.
+
+Full-text queries run against an inverted index that the database keeps up to
+date on every insert: an FTS5 table fed by triggers on SQLite, and a generated
+tsvector column with a GIN index on Postgres (both created by init_db). Other
+databases fall back to a LIKE scan. Extracted fields are filtered through the
+document_fields table, which save_document(s) fill in the same transaction as
+the document itself.
+
+Results come newest first, with keyset pagination: the cursor holds the last
+id returned and the next page starts below it, so deep pages cost the same as
+the first one (no OFFSET).
+"""
+import base64
+import binascii
+import re
+from sqlalchemy import select, exists, func, literal_column, or_, table, column
+try:
+    from .database import engine, Document, DocumentField
+except ImportError:
+    from database import engine, Document, DocumentField
+
+OPERATORS = {
+    ">=": lambda col, value: col >= value,
+    "<=": lambda col, value: col <= value,
+    ">": lambda col, value: col > value,
+    "<": lambda col, value: col < value,
+    "=": lambda col, value: col == value,
+}
+FIELD_FILTER = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<|=)\s*(.+?)\s*$")
+
+_fts = table("documents_fts", column("rowid"))
+
+
+def parse_field_filter(expression):
+    """'invoice_total>=100' -> ('invoice_total', '>=', '100'). Raises ValueError."""
+    match = FIELD_FILTER.match(expression)
+    if not match:
+        raise ValueError(f"Bad field filter {expression!r}, expected name=value, name>=value, name<value, ...")
+    return match.groups()
+
+
+def field_condition(name, op, value):
+    """EXISTS clause matching documents with an extracted value of name that satisfies op value.
+
+    Numbers compare numerically; anything else compares as lower-cased text,
+    which also orders ISO dates (date>=2024-01-01) correctly. An equality test
+    with a number also matches the same text, for string fields holding digits
+    (ID, phone and account numbers).
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        condition = OPERATORS[op](DocumentField.value, value.lower())
+    else:
+        condition = OPERATORS[op](DocumentField.number, number)
+        if op == "=":
+            condition = or_(condition, DocumentField.value == value.lower())
+    return exists().where(DocumentField.document_id == Document.id, DocumentField.name == name, condition)
+
+
+def fts5_query(q):
+    """Quote every word of q so FTS5 operators in user input can't cause syntax errors; a trailing * keeps prefix search."""
+    terms = [f'"{word}"{star}' for word, star in re.findall(r"(\w+)(\*?)", q)]
+    if not terms:
+        raise ValueError("q has no searchable words")
+    return " ".join(terms)
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def search_documents(q=None, document_type=None, created_from=None, created_to=None, fields=(), cursor=None,
+                     limit=20):
+    """Newest documents matching every given condition. Returns {"results": [...], "next_cursor": str or None}.
+
+    Raises ValueError for a malformed field filter, query or cursor.
+    """
+    filters = [parse_field_filter(expression) for expression in fields]
+    key = Document.id
+    stmt = select(Document.id, Document.filename, Document.doc_type, Document.extracted, Document.created_at)
+
+    if q:
+        dialect = engine.dialect.name
+        if dialect == "sqlite":
+            # Order and page on the FTS rowid (= documents.id): FTS5 then walks its index newest first
+            # and stops after limit rows, instead of sorting every match
+            match = fts5_query(q)
+            key = _fts.c.rowid
+            stmt = stmt.join(_fts, _fts.c.rowid == Document.id).where(
+                literal_column("documents_fts").op("MATCH")(match))
+            stmt = stmt.add_columns(func.snippet(literal_column("documents_fts"), 0, "[", "]", "...", 12))
+        elif dialect == "postgresql":
+            query = func.websearch_to_tsquery("english", q)
+            stmt = stmt.where(literal_column("documents.search_vector").op("@@")(query))
+            stmt = stmt.add_columns(func.ts_headline("english", Document.raw_text, query,
+                                                     "StartSel=[, StopSel=], MaxWords=20, MinWords=8"))
+        else:
+            stmt = stmt.where(Document.raw_text.ilike(f"%{q}%")).add_columns(func.substr(Document.raw_text, 1, 120))
+
+    if document_type:
+        stmt = stmt.where(Document.doc_type == document_type)
+    if created_from:
+        stmt = stmt.where(Document.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(Document.created_at < created_to)
+    for name, op, value in filters:
+        stmt = stmt.where(field_condition(name, op, value))
+    if cursor:
+        stmt = stmt.where(key < decode_cursor(cursor))
+    stmt = stmt.order_by(key.desc()).limit(limit + 1)
+
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).all()
+    results = [{
+        "id": row[0],
+        "filename": row[1],
+        "document_type": row[2],
+        "extracted": row[3],
+        "created_at": row[4].isoformat() if row[4] else None,
+        **({"snippet": row[5]} if q else {}),
+    } for row in rows[:limit]]
+    next_cursor = encode_cursor(results[-1]["id"]) if len(rows) > limit else None
+    return {"results": results, "next_cursor": next_cursor}
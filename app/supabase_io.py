@@ -0,0 +1,277 @@
+"""
+Supabase storage uploads and document inserts, off the request path.
+
+Neither call affects the processing result, so /process doesn't wait on them
+before OCR. With SUPABASE_UPLOAD_MODE:
+
+- concurrent (default): the upload starts when the request arrives and runs while
+  the document is OCR'd; the response waits for it only at the end, to report
+  its file_url.
+- background: the response doesn't wait at all. The public URL is computed up
+  front (it is just a string), and the upload finishes in the background.
+- inline: the old behaviour. The upload runs before OCR and the insert after
+  extraction, both on the request path. Useful as a baseline for
+  tools/bench_supabase_offload.py.
+
+Outside inline mode, document inserts are queued and written in the
+background, after the document's upload has finished. Calls go through a
+bounded pool of SUPABASE_MAX_CONNECTIONS clients (one worker thread each) and
+are retried SUPABASE_RETRIES times, with exponential backoff and jitter. An
+insert that still fails, or that finds more than SUPABASE_QUEUE_SIZE calls
+already waiting, goes to the local result log. tools/replay_result_log.py
+replays it later.
+
+tools/fake_supabase.py serves the few endpoints used here, for local testing.
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from fastapi.concurrency import run_in_threadpool
+try:
+    from .config import (SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, SUPABASE_UPLOAD_MODE, SUPABASE_MAX_CONNECTIONS,
+                         SUPABASE_RETRIES, SUPABASE_BACKOFF, SUPABASE_QUEUE_SIZE)
+    from . import result_log
+except ImportError:
+    from config import (SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, SUPABASE_UPLOAD_MODE, SUPABASE_MAX_CONNECTIONS,
+                        SUPABASE_RETRIES, SUPABASE_BACKOFF, SUPABASE_QUEUE_SIZE)
+    import result_log
+
+ENABLED = bool(SUPABASE_URL and SUPABASE_KEY)
+
+_idle = queue.LifoQueue()  # clients not in use; LIFO keeps the warmest connections busy
+_created = 0
+_url_client = None
+_lock = threading.Lock()
+_executor = None
+_pending = 0  # uploads and inserts submitted but not finished
+_upload_times = deque(maxlen=1000)
+_insert_times = deque(maxlen=1000)
+_counters = {"uploads": 0, "upload_failures": 0, "inserts": 0, "insert_failures": 0, "retries": 0, "shed": 0}
+
+
+@contextmanager
+def _client():
+    """Borrow a client from the pool, creating one if fewer than SUPABASE_MAX_CONNECTIONS exist."""
+    global _created
+    try:
+        client = _idle.get_nowait()
+    except queue.Empty:
+        with _lock:
+            create = _created < SUPABASE_MAX_CONNECTIONS
+            if create:
+                _created += 1
+        if create:
+            from supabase import create_client
+            try:
+                client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            except Exception:
+                with _lock:
+                    _created -= 1
+                raise
+        else:
+            client = _idle.get()
+    try:
+        yield client
+    finally:
+        _idle.put(client)
+
+
+def with_retries(call, what):
+    """Run call(client) with a pooled client, retrying failures with exponential backoff and jitter."""
+    for attempt in range(SUPABASE_RETRIES + 1):
+        try:
+            with _client() as client:
+                return call(client)
+        except Exception as e:
+            if attempt == SUPABASE_RETRIES:
+                raise
+            delay = SUPABASE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+            _counters["retries"] += 1
+            print(f"Supabase {what} failed ({e}), retry {attempt + 1}/{SUPABASE_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def _executor_():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SUPABASE_MAX_CONNECTIONS, thread_name_prefix="supabase")
+    return _executor
+
+
+def _reserve(change):
+    global _pending
+    with _lock:
+        _pending += change
+
+
+def _submit(fn, *args):
+    _reserve(1)
+    future = _executor_().submit(fn, *args)
+    future.add_done_callback(lambda _: _reserve(-1))
+    return future
+
+
+def destination(filename):
+    # Unique destination name to avoid overwrites
+    return f"{int(time.time())}_{uuid.uuid4().hex}_{filename}"
+
+
+def public_url(dest_name):
+    global _url_client
+    if _url_client is None:
+        # get_public_url only formats a string, so one shared client outside the pool serves every thread
+        from supabase import create_client
+        _url_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    # get_public_url may return different shapes depending on client version
+    public_resp = _url_client.storage.from_(SUPABASE_BUCKET).get_public_url(dest_name)
+    if isinstance(public_resp, dict):
+        return public_resp.get('publicUrl') or public_resp.get('publicURL') or public_resp.get('public_url')
+    return str(public_resp)
+
+
+def upload(content, filename, content_type, dest_name=None):
+    """Upload the original file to Supabase Storage. Returns (file_url, storage_path), or (None, None) on failure."""
+    dest_name = dest_name or destination(filename)
+    started = time.perf_counter()
+    try:
+        with_retries(lambda client: client.storage.from_(SUPABASE_BUCKET).upload(
+            dest_name, content, {"content-type": content_type or "application/octet-stream"}), "upload")
+        file_url = public_url(dest_name)
+    except Exception as e:
+        _counters["upload_failures"] += 1
+        print(f"Supabase upload warning: {e}")
+        return None, None
+    _counters["uploads"] += 1
+    _upload_times.append(time.perf_counter() - started)
+    return file_url, dest_name
+
+
+def insert(record):
+    """Insert a document row, falling back to commonly-available columns (some schemas may not have
+    extracted_json), then to the local result log. Returns True if Supabase took it."""
+    reduced = {
+        "filename": record["filename"],
+        "document_type": record["document_type"],
+        "original_url": record["file_url"],
+        "extracted_text": record["extracted_text"]
+    }
+
+    def call(client):
+        try:
+            return client.table("documents").insert(record).execute()
+        except Exception as e:
+            print(f"Supabase DB warning: {e}, trying a reduced insert")
+            return client.table("documents").insert(reduced).execute()
+
+    started = time.perf_counter()
+    try:
+        with_retries(call, "insert")
+    except Exception as e:
+        _counters["insert_failures"] += 1
+        print(f"Supabase insert failed: {e}")
+        _log_locally(record)
+        return False
+    _counters["inserts"] += 1
+    _insert_times.append(time.perf_counter() - started)
+    return True
+
+
+def _log_locally(record):
+    try:
+        record_id = result_log.append(record)
+        print(f"Wrote fallback record {record_id} to the local result log (after Supabase failure)")
+    except Exception as e:
+        print(f"Local fallback write warning after Supabase failure: {e}")
+
+
+async def start_upload(content, filename, content_type):
+    """Start uploading an original file. Returns a future of (file_url, storage_path), or None without Supabase.
+
+    In inline mode, or when too many calls are already waiting, the upload
+    finishes before this returns (back-pressure).
+    """
+    if not ENABLED:
+        return None
+    if SUPABASE_UPLOAD_MODE == "inline" or _pending >= SUPABASE_QUEUE_SIZE:
+        future = Future()
+        future.set_result(await run_in_threadpool(upload, content, filename, content_type))
+        return future
+    dest_name = destination(filename)
+    future = _submit(upload, content, filename, content_type, dest_name)
+    if SUPABASE_UPLOAD_MODE == "background":
+        future.planned = (public_url(dest_name), dest_name)
+    return future
+
+
+async def upload_result(future):
+    """(file_url, storage_path) for a response: waits for the upload unless it runs in the background."""
+    if future is None:
+        return None, None
+    planned = getattr(future, "planned", None)
+    if planned and not future.done():
+        return planned
+    return await asyncio.wrap_future(future)
+
+
+def submit_insert(record, upload_future=None):
+    """Insert a document row: now in inline mode, otherwise in the background once its upload is done."""
+    if SUPABASE_UPLOAD_MODE == "inline":
+        insert(record)
+        return
+    if _pending >= SUPABASE_QUEUE_SIZE:
+        _counters["shed"] += 1
+        _log_locally(record)
+        return
+
+    def after_upload(future=None):
+        try:
+            if future is not None and not future.cancelled():
+                file_url, storage_path = future.result()
+                record.update(file_url=file_url, storage_path=storage_path)
+            _submit(insert, record)
+        finally:
+            _reserve(-1)
+
+    # Counted as pending from now on, so shutdown() also waits for inserts still waiting on their upload
+    _reserve(1)
+    if upload_future is not None and not upload_future.done():
+        upload_future.add_done_callback(after_upload)
+    else:
+        after_upload(upload_future)
+
+
+def shutdown():
+    """Wait for queued uploads and inserts to finish."""
+    global _executor
+    if _executor is not None:
+        # Inserts chained to uploads are submitted from upload callbacks, so wait until nothing is left
+        while _pending:
+            time.sleep(0.05)
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _ms(values):
+    values = sorted(values)
+    if not values:
+        return {"avg": 0.0, "p95": 0.0}
+    return {"avg": round(1000 * sum(values) / len(values), 1),
+            "p95": round(1000 * values[min(len(values) - 1, int(len(values) * 0.95))], 1)}
+
+
+def supabase_stats():
+    """Queued calls, pool size, success/failure/retry counts and call latency."""
+    return {
+        "mode": SUPABASE_UPLOAD_MODE,
+        "pending": _pending,
+        "clients": _created,
+        **_counters,
+        "upload_ms": _ms(_upload_times),
+        "insert_ms": _ms(_insert_times),
+    }
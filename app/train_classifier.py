@@ -1,13 +1,15 @@
 """
 Train a document classifier model for invoice, CV, ID card, and receipt classification.
-Run this script to generate the classifier.pkl model file.
+Run this script to generate the classifier artifact (app/model_artifacts/classifier/).
 """
-import pickle
 import os
+import sys
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
 import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_artifact import save_artifact
 
 # Sample training data (in production, you'd have much more data)
 training_data = [
@@ -62,13 +64,9 @@ def train_classifier():
     classifier = MultinomialNB(alpha=0.1)
     classifier.fit(X, labels)
     
-    # Create model directory if it doesn't exist
-    os.makedirs("app/model_artifacts", exist_ok=True)
-    
-    # Save model and vectorizer
-    model_path = "app/model_artifacts/classifier.pkl"
-    with open(model_path, "wb") as f:
-        pickle.dump((classifier, vectorizer), f)
+    # Save model and vectorizer as a pickle-free artifact
+    model_path = "app/model_artifacts/classifier"
+    save_artifact(model_path, vectorizer, classifier, {"training_samples": len(training_data)})
     
     print(f"✅ Model trained and saved to {model_path}")
     print(f"   Classes: {classifier.classes_}")
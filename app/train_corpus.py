@@ -0,0 +1,212 @@
+"""
+Train the document classifier on the processed-documents corpus, out of core.
+
+Labelled records are streamed in chunks from the local result log or an old
+processed_documents.jsonl (document_type, extracted_text), or from the
+documents table (doc_type, raw_text), hashed with a HashingVectorizer and fed
+to MultinomialNB.partial_fit, so memory stays constant however many documents
+there are.
+
+Cross-validation folds are assigned by a hash of each text, so no record has to
+be kept. Each (fold, n_features) pair runs in its own process: it trains on the
+other folds in one pass and scores its fold for every alpha in a second pass
+(alpha only changes the smoothing of the same counts). The best setting is then
+trained on everything and exported as a classifier artifact.
+
+Usage:
+    python app/train_corpus.py --log
+    python app/train_corpus.py --jsonl processed_documents.jsonl
+    python app/train_corpus.py --db --folds 5 --alphas 0.01 0.1 1 --n-features 262144 1048576
+"""
+import argparse
+import json
+import time
+import zlib
+from collections import Counter
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+try:
+    from .model_artifact import save_artifact
+except ImportError:
+    from model_artifact import save_artifact
+
+IGNORED_LABELS = {"", "unknown", "none"}
+
+
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            yield record.get("document_type"), record.get("extracted_text")
+
+
+def iter_log():
+    try:
+        from . import result_log
+    except ImportError:
+        import result_log
+    for record in result_log.iter_records():
+        yield record.get("document_type"), record.get("extracted_text")
+
+
+def iter_db(chunk_size):
+    try:
+        from .database import SessionLocal, Document
+    except ImportError:
+        from database import SessionLocal, Document
+    from sqlalchemy import select
+    db = SessionLocal()
+    try:
+        query = select(Document.doc_type, Document.raw_text).execution_options(yield_per=chunk_size)
+        for doc_type, raw_text in db.execute(query):
+            yield doc_type, raw_text
+    finally:
+        db.close()
+
+
+def iter_records(source, chunk_size):
+    """Labelled (text, label) pairs from ("jsonl", path), ("log", None) or ("db", None), skipping unusable ones."""
+    kind, path = source
+    if kind == "jsonl":
+        records = iter_jsonl(path)
+    elif kind == "log":
+        records = iter_log()
+    else:
+        records = iter_db(chunk_size)
+    for label, text in records:
+        if not label or str(label).lower() in IGNORED_LABELS or not text or not text.strip():
+            continue
+        yield text, str(label)
+
+
+def iter_chunks(source, chunk_size, keep=None):
+    """Lists of texts and labels of at most chunk_size records; keep(text) filters records."""
+    texts, labels = [], []
+    for text, label in iter_records(source, chunk_size):
+        if keep is not None and not keep(text):
+            continue
+        texts.append(text)
+        labels.append(label)
+        if len(texts) == chunk_size:
+            yield texts, labels
+            texts, labels = [], []
+    if texts:
+        yield texts, labels
+
+
+def fold_of(text, folds):
+    return zlib.crc32(text.encode("utf-8", errors="replace")) % folds
+
+
+def make_vectorizer(n_features):
+    # Same tokenization as the TF-IDF model; non-negative features for MultinomialNB
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm="l2",
+                             ngram_range=(1, 2), stop_words="english", lowercase=True)
+
+
+def train(source, classes, n_features, alpha, chunk_size, keep=None):
+    vectorizer = make_vectorizer(n_features)
+    model = MultinomialNB(alpha=alpha)
+    for texts, labels in iter_chunks(source, chunk_size, keep):
+        model.partial_fit(vectorizer.transform(texts), labels, classes=classes)
+    return vectorizer, model
+
+
+def smoothed_log_prob(model, alpha):
+    """feature_log_prob_ of the same counts under another alpha."""
+    counts = model.feature_count_ + alpha
+    return np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))
+
+
+def evaluate_fold(source, classes, folds, fold, n_features, alphas, chunk_size):
+    """Train on every fold but `fold`, then count hits per class on `fold` for each alpha."""
+    vectorizer, model = train(source, classes, n_features, alphas[0], chunk_size,
+                              keep=lambda text: fold_of(text, folds) != fold)
+    if not hasattr(model, "feature_count_"):
+        return {}
+    log_probs = {alpha: smoothed_log_prob(model, alpha).T for alpha in alphas}
+    class_index = {label: i for i, label in enumerate(model.classes_)}
+    hits = {alpha: np.zeros(len(classes), dtype=np.int64) for alpha in alphas}
+    totals = np.zeros(len(classes), dtype=np.int64)
+    for texts, labels in iter_chunks(source, chunk_size, keep=lambda text: fold_of(text, folds) == fold):
+        X = vectorizer.transform(texts)
+        truth = np.array([class_index[label] for label in labels])
+        totals += np.bincount(truth, minlength=len(classes))
+        for alpha in alphas:
+            predicted = np.asarray(X @ log_probs[alpha] + model.class_log_prior_).argmax(axis=1)
+            hits[alpha] += np.bincount(truth[predicted == truth], minlength=len(classes))
+    return {"hits": {alpha: h.tolist() for alpha, h in hits.items()}, "totals": totals.tolist()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--jsonl', help='processed_documents.jsonl to train from')
+    group.add_argument('--log', action='store_true', help='train from the local result log (RESULT_LOG_DIR)')
+    group.add_argument('--db', action='store_true', help='train from the documents table (DATABASE_URL)')
+    parser.add_argument('--output', default='app/model_artifacts/classifier', help='artifact directory to write')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='records vectorized and fitted at a time')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--alphas', type=float, nargs='+', default=[0.01, 0.1, 0.5, 1.0])
+    parser.add_argument('--n-features', type=int, nargs='+', default=[2 ** 18], help='hashing space sizes to try')
+    parser.add_argument('--jobs', type=int, default=-1, help='parallel processes (-1 = all cores)')
+    parser.add_argument('--min-records', type=int, default=20, help='refuse to export a model trained on fewer')
+    args = parser.parse_args()
+    source = ("jsonl", args.jsonl) if args.jsonl else ("log" if args.log else "db", None)
+
+    started = time.perf_counter()
+    label_counts = Counter(label for _, label in iter_records(source, args.chunk_size))
+    total = sum(label_counts.values())
+    classes = sorted(label_counts)
+    print(f"{total} labelled records: " + ", ".join(f"{label} {count}" for label, count in sorted(label_counts.items())))
+    if total < args.min_records or len(classes) < 2:
+        raise SystemExit(f"Need at least {args.min_records} records and 2 classes to train")
+
+    tasks = [(fold, n_features) for n_features in args.n_features for fold in range(args.folds)]
+    results = Parallel(n_jobs=args.jobs)(
+        delayed(evaluate_fold)(source, classes, args.folds, fold, n_features, args.alphas, args.chunk_size)
+        for fold, n_features in tasks
+    )
+
+    scores = {}
+    for (fold, n_features), result in zip(tasks, results):
+        if not result:
+            continue
+        for alpha in args.alphas:
+            hits, totals = scores.setdefault((n_features, alpha), (np.zeros(len(classes)), np.zeros(len(classes))))
+            hits += result["hits"][alpha]
+            totals += result["totals"]
+
+    print(f"\n{args.folds}-fold cross-validation accuracy:")
+    print(f"  {'n_features':>10}{'alpha':>8}{'accuracy':>10}")
+    for (n_features, alpha), (hits, totals) in sorted(scores.items()):
+        print(f"  {n_features:>10}{alpha:>8}{hits.sum() / max(totals.sum(), 1):>10.3f}")
+    (n_features, alpha), (hits, totals) = max(scores.items(), key=lambda item: item[1][0].sum() / max(item[1][1].sum(), 1))
+    per_class = {label: round(float(h / t), 4) if t else None for label, h, t in zip(classes, hits, totals)}
+    accuracy = float(hits.sum() / max(totals.sum(), 1))
+    print(f"\nBest: n_features={n_features} alpha={alpha} accuracy={accuracy:.3f}")
+    print(f"  {'class':<12}{'accuracy':>10}{'records':>10}")
+    for label, t in zip(classes, totals):
+        value = per_class[label]
+        print(f"  {label:<12}{'-' if value is None else f'{value:.3f}':>10}{int(t):>10}")
+
+    vectorizer, model = train(source, classes, n_features, alpha, args.chunk_size)
+    save_artifact(args.output, vectorizer, model, {"training": {
+        "source": args.jsonl or ("result log" if args.log else "database"),
+        "records": total,
+        "folds": args.folds,
+        "alpha": alpha,
+        "cv_accuracy": round(accuracy, 4),
+        "cv_class_accuracy": per_class,
+        "trained_at": int(time.time()),
+    }})
+    print(f"\nSaved hashing artifact to {args.output} ({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Upload handling shared by app/main.py and main_standalone.py.
+
+Single-file uploads are kept in memory end to end: requests whose Content-Length
+is already over the limit are rejected before the body is read, routes using
+InMemoryUploadRoute parse the multipart body with a parser that keeps files up
+to UPLOAD_MAX_SIZE in memory instead of spooling them to disk, and the handlers
+read them in chunks, stopping as soon as the limit is passed. The bytes then go
+straight to OCR, so nothing is written to disk unless a backend needs a path
+(poppler, for scanned PDF pages).
+
+Batch uploads keep Starlette's default parser, which spools every file over 1MB
+to a temporary file, so a batch of hundreds of files isn't held in memory; their
+total size is capped by BATCH_MAX_BYTES.
+"""
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+try:
+    from .config import ALLOWED_EXTENSIONS, UPLOAD_MAX_SIZE, BATCH_MAX_BYTES
+except ImportError:
+    from config import ALLOWED_EXTENSIONS, UPLOAD_MAX_SIZE, BATCH_MAX_BYTES
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries and part headers around a single file
+
+
+class InMemoryMultiPartParser(MultiPartParser):
+    # Starlette spools multipart files over 1MB to a temporary file; keep anything we accept in memory.
+    max_file_size = UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD
+
+
+class InMemoryUploadRoute(APIRoute):
+    """Route class for single-file upload endpoints: parses their form with InMemoryMultiPartParser.
+
+    The parsed form is left on the request, where FastAPI's own form handling picks it up.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            if request.headers.get("content-type", "").startswith("multipart/form-data"):
+                try:
+                    request._form = await InMemoryMultiPartParser(request.headers, request.stream()).parse()
+                except MultiPartException as e:
+                    raise HTTPException(status_code=400, detail=e.message)
+            return await handler(request)
+
+        return route_handler
+
+
+def validate_extension(filename):
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type {file_ext} not allowed. Allowed: {ALLOWED_EXTENSIONS}"
+        )
+    return file_ext
+
+
+def too_large_detail():
+    return f"File too large. Max size: {UPLOAD_MAX_SIZE / 1024 / 1024}MB"
+
+
+def reject_oversized(request, single_file_paths, batch_paths=()):
+    """Return an error response if an upload's Content-Length is over the limit, else None.
+
+    Single-file uploads are held to UPLOAD_MAX_SIZE, batch uploads to BATCH_MAX_BYTES in total.
+    Meant for an HTTP middleware, so oversized requests are refused before their body is read.
+    """
+    if request.method != "POST":
+        return None
+    if request.url.path in single_file_paths:
+        limit, detail = UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD, too_large_detail()
+    elif request.url.path in batch_paths:
+        limit, detail = BATCH_MAX_BYTES, f"Batch too large. Max size: {BATCH_MAX_BYTES / 1024 / 1024}MB"
+    else:
+        return None
+    try:
+        length = int(request.headers.get("content-length", 0))
+    except ValueError:
+        return None
+    if length > limit:
+        return JSONResponse(status_code=400, content={"detail": detail})
+    return None
+
+
+async def read_upload(file: UploadFile, max_size: int = UPLOAD_MAX_SIZE):
+    """Read an upload in chunks, raising 400 as soon as it grows past max_size."""
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_size:
+            raise HTTPException(status_code=400, detail=too_large_detail())
+    return bytes(buffer)
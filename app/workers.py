@@ -0,0 +1,438 @@
+"""
+Process pool for the CPU-bound OCR → clean → classify → extract stages.
+
+The API handlers are async, so running Tesseract or the classifier on the
+event loop blocks every other request (including /health). Work is handed to
+a ProcessPoolExecutor instead, with a bounded number of admitted requests:
+once OCR_POOL_SIZE jobs are running and OCR_QUEUE_DEPTH more are waiting,
+new submissions are rejected with PoolBusy so the API can answer 503 with a
+Retry-After header instead of piling up requests.
+
+A worker killed mid-job (out of memory, a crashing Tesseract) breaks the whole
+executor. The first request to hit it gets PoolBusy too, and the pool is
+replaced and warmed up again.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    from .config import (OCR_POOL_SIZE, OCR_QUEUE_DEPTH, OCR_WARMUP_EASYOCR, OCR_TWO_PASS, OCR_EARLY_EXIT,
+                         OCR_EARLY_EXIT_CONFIDENCE, OCR_EARLY_EXIT_COVERAGE, OCR_EARLY_EXIT_STEP, OCR_PAGE_LIMIT,
+                         OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE)
+    from . import ocr, classifier, near_dup, metrics
+    from .classifier import classify_batch
+    from .extractor import extract_fields, FINE_REGIONS, KEY_FIELDS
+    from .text_processor import clean_text
+except ImportError:
+    from config import (OCR_POOL_SIZE, OCR_QUEUE_DEPTH, OCR_WARMUP_EASYOCR, OCR_TWO_PASS, OCR_EARLY_EXIT,
+                        OCR_EARLY_EXIT_CONFIDENCE, OCR_EARLY_EXIT_COVERAGE, OCR_EARLY_EXIT_STEP, OCR_PAGE_LIMIT,
+                        OCR_PDF_FIRST_PAGE, OCR_PDF_LAST_PAGE)
+    import ocr, classifier, near_dup, metrics
+    from classifier import classify_batch
+    from extractor import extract_fields, FINE_REGIONS, KEY_FIELDS
+    from text_processor import clean_text
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0  # admitted jobs that have not finished yet (running + queued)
+_waits = deque(maxlen=1000)  # recent queue wait times in seconds
+_service_times = deque(maxlen=1000)  # recent run times in seconds
+_counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "restarts": 0}
+_warmup = {"ready": False, "workers": []}
+_slot_freed = None  # asyncio.Condition, created on first blocking submit
+_rewarm_task = None  # warm-up of a pool that replaced a broken one
+_warm_reports = None  # multiprocessing queue the current pool's workers report to once warm
+WARMUP_TIMEOUT = 300  # seconds to wait for every worker to report warm
+
+
+class PoolBusy(Exception):
+    """Raised when the pool and its queue are full."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"OCR pool is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def ocr_file(source, suffix=None):
+    """OCR stage: extract the text of a file path, or of file bytes with their suffix.
+
+    Returns {"ocr": (text, pages, stop_reason), "fingerprint": page hashes} for
+    analyze_ocr, or {"duplicate": earlier result} when the pages are a near-duplicate
+    of a document processed before (see app/near_dup.py). "trace" holds the stage
+    timings (see app/metrics.py).
+    """
+    with metrics.tracing() as trace:
+        with metrics.stage("near_dup_pages"):
+            fingerprint, duplicate = near_dup.check_pages(source, suffix)
+        if duplicate:
+            return {"duplicate": duplicate, "trace": trace}
+        suffix = ocr.document_suffix(source, suffix)
+        layout = {}
+        stop_reason = "end_of_document"
+        try:
+            with metrics.stage("ocr"):
+                for wave, more in ocr.iter_pages(source, suffix=suffix):
+                    layout.update(wave)
+                    stop_reason = "page_range" if more else "end_of_document"
+        except ocr.OCRError as e:
+            return {"ocr": (str(e), [], stop_reason), "fingerprint": fingerprint, "trace": trace}
+    return {"ocr": (*ocr.join_pages(layout, suffix), stop_reason), "fingerprint": fingerprint, "trace": trace}
+
+
+def analyze_ocr(output):
+    """Analysis stage for the output of ocr_file: analyze_text, keeping the page hashes for near_dup.remember."""
+    with metrics.tracing(output.get("trace")) as trace:
+        if "duplicate" in output:
+            result = output["duplicate"]
+            metrics.count("near_duplicate_pages")
+        else:
+            result = _with_page_hashes(analyze_text(*output["ocr"]), output["fingerprint"])
+    return {**result, "trace": trace}
+
+
+def _with_page_hashes(result, fingerprint):
+    # The near-duplicate stage (app/pipeline.py) indexes the document under its page hashes and drops them
+    return {**result, "page_hashes": fingerprint} if fingerprint else result
+
+
+def analyze_text(text, pages, stop_reason=None):
+    """Clean, classify and extract fields from OCR output.
+
+    Cheap compared to OCR, so /process/batch runs it in the API process while the
+    pool OCRs the next file. result["ocr_failed"] is True when no page was read
+    or a page's OCR failed (an OCRError's message or an engine error stands in
+    for the text); such results may be transient and are never cached.
+    """
+    ocr_failed = not pages or any(page.get("source") == "none" for page in pages)
+    result = {"text": text, "pages": pages, "pages_read": len(pages), "stop_reason": stop_reason,
+              "ocr_failed": ocr_failed}
+    if not text or len(text.strip()) < 10:
+        return {**result, "cleaned": None, "document_type": None, "confidence": None, "extracted": None,
+                "model_version": None}
+
+    with metrics.stage("clean"):
+        cleaned = clean_text(text)
+    with metrics.stage("classify"):
+        version, [(doc_type, confidence)] = classify_batch([cleaned])
+    with metrics.stage("extract"):
+        extracted = extract_fields(doc_type, cleaned)
+    return {**result, "cleaned": cleaned, "document_type": doc_type, "confidence": confidence, "extracted": extracted,
+            "model_version": version}
+
+
+def _early_exit_reason(result, pages_read):
+    """Why incremental reading may stop after pages_read pages, or None to read on."""
+    if result["cleaned"] is None:
+        return None
+    key_fields = KEY_FIELDS.get(result["document_type"], ())
+    found = sum(1 for name in key_fields if result["extracted"].get(name) not in (None, []))
+    if key_fields and found / len(key_fields) < OCR_EARLY_EXIT_COVERAGE:
+        return None
+    if result["confidence"] >= OCR_EARLY_EXIT_CONFIDENCE:
+        return "confident"
+    # Key fields are in but the classifier stays unsure: more pages rarely help past the usual range
+    if OCR_PDF_LAST_PAGE and pages_read >= OCR_PDF_LAST_PAGE - OCR_PDF_FIRST_PAGE + 1:
+        return "page_budget"
+    return None
+
+
+def read_document(source, suffix=None, coarse=False):
+    """OCR and analyze a document. Returns (result, layout).
+
+    With OCR_EARLY_EXIT, pages are OCR'd OCR_EARLY_EXIT_STEP at a time and the
+    text so far is classified and extracted after each step. Reading stops once
+    the classifier is confident and the type's KEY_FIELDS are found, and goes on
+    past the usual page range (up to OCR_PAGE_LIMIT) while key fields are missing.
+    result["stop_reason"] is "confident", "page_budget", "page_limit",
+    "page_range" or "end_of_document". coarse=True reads with the coarse pass of
+    two-pass OCR; layout then holds the page images for fine_ocr.
+    """
+    suffix = ocr.document_suffix(source, suffix)
+    layout = {}
+    result = None
+    stop_reason = "end_of_document"
+    last_page = None
+    if OCR_EARLY_EXIT:
+        last_page = OCR_PDF_FIRST_PAGE + OCR_PAGE_LIMIT - 1 if OCR_PAGE_LIMIT else 0
+    try:
+        pages_iter = ocr.iter_pages(source, last_page=last_page, suffix=suffix, coarse=coarse,
+                                    step=OCR_EARLY_EXIT_STEP if OCR_EARLY_EXIT else None)
+        # "ocr" covers reading the pages, not the early-exit analysis between waves
+        wave_started = time.perf_counter()
+        for wave, more in pages_iter:
+            metrics.add_time("ocr", time.perf_counter() - wave_started)
+            wave_started = time.perf_counter()
+            layout.update(wave)
+            result = None
+            stop_reason = "end_of_document"
+            if not more:
+                break
+            if not OCR_EARLY_EXIT:
+                stop_reason = "page_range"
+                continue
+            stop_reason = "page_limit"
+            result = analyze_text(*ocr.join_pages(layout, suffix), stop_reason)
+            reason = _early_exit_reason(result, len(layout))
+            if reason:
+                result["stop_reason"] = reason
+                pages_iter.close()
+                break
+            wave_started = time.perf_counter()
+    except ocr.OCRError as e:
+        return analyze_text(str(e), [], stop_reason), layout
+    if result is None:
+        result = analyze_text(*ocr.join_pages(layout, suffix), stop_reason)
+    return result, layout
+
+
+def process_two_pass(source, suffix=None):
+    """Coarse-to-fine pipeline: classify from a low-resolution pass, then re-OCR at full
+    resolution only what the matched extractor needs (FINE_REGIONS), or the whole
+    text for document types without regions."""
+    result, layout = read_document(source, suffix, coarse=True)
+    if result["cleaned"] is None or not any("image" in page for page in layout.values()):
+        ocr.release_layout(layout)
+        return result
+
+    hints = FINE_REGIONS.get(result["document_type"])
+    if hints:
+        regions = ocr.select_regions(layout, **hints)
+    else:
+        regions = {page: None for page, page_result in layout.items() if "image" in page_result}
+    with metrics.stage("ocr_fine"):
+        fine = ocr.fine_ocr(layout, regions)
+    pages = result["pages"]
+    for page in pages:
+        if page["page"] in fine:
+            page["fine_regions"] = len(fine[page["page"]]["regions"] or [None])
+            page["fine_pixels"] = fine[page["page"]]["pixels"]
+
+    if hints:
+        # Fields found in the sharper region text win; the coarse text fills in the rest
+        fine_text = "\n".join(fine[page]["text"] for page in sorted(fine))
+        fine_fields = extract_fields(result["document_type"], clean_text(fine_text)) if fine_text.strip() else {}
+        result["extracted"].update({k: v for k, v in fine_fields.items() if v not in (None, [])})
+        return result
+    texts = [fine[page]["text"] if page in fine else page_result["text"] for page, page_result in layout.items()]
+    text = "\n\n".join(t for t in texts if t.strip()) or result["text"]
+    fine_result = analyze_text(text, pages, result["stop_reason"])
+    return fine_result if fine_result["cleaned"] is not None else result
+
+
+def process_file(source, suffix=None):
+    """Run the full document pipeline on a file path or file bytes. Executed inside a pool worker.
+
+    A near-duplicate of a document processed before gets that document's result
+    without OCR (see app/near_dup.py); other results carry their "page_hashes"
+    for near_dup.remember, if pages were hashed. result["trace"] holds the stage
+    timings (see app/metrics.py).
+    """
+    with metrics.tracing() as trace:
+        with metrics.stage("near_dup_pages"):
+            fingerprint, duplicate = near_dup.check_pages(source, suffix)
+        if duplicate:
+            result = duplicate
+            metrics.count("near_duplicate_pages")
+        else:
+            if OCR_TWO_PASS:
+                result = process_two_pass(source, suffix)
+            else:
+                result, _ = read_document(source, suffix)
+            result = _with_page_hashes(result, fingerprint)
+    return {**result, "trace": trace}
+
+
+# /process/batch OCRs in the pool and analyzes in the API process, unless analysis
+# has to happen between OCR steps (early exit, two-pass)
+PIPELINED_ANALYSIS = not (OCR_EARLY_EXIT or OCR_TWO_PASS)
+
+
+def _init_worker(reports):
+    """Pool initializer: load and warm the OCR engines and classifier in this process, then report to reports."""
+    timings = {}
+    try:
+        timings["classifier"] = classifier.warm_up()
+    except Exception as e:
+        timings["classifier"] = {"error": str(e)}
+    timings.update(ocr.warm_up(easyocr_reader=OCR_WARMUP_EASYOCR))
+    reports.put({"pid": os.getpid(), "timings": timings})
+
+
+def _start_worker():
+    return os.getpid()
+
+
+def _timed_call(fn, args):
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+def get_executor():
+    global _executor, _warm_reports
+    with _executor_lock:
+        if _executor is None:
+            # Map the classifier artifact before forking so workers inherit the mapping
+            try:
+                classifier.load_model()
+            except Exception as e:
+                print(f"Classifier not loaded before starting the pool: {e}")
+            context = multiprocessing.get_context()
+            _warm_reports = context.Queue()
+            _executor = ProcessPoolExecutor(max_workers=OCR_POOL_SIZE, mp_context=context,
+                                            initializer=_init_worker, initargs=(_warm_reports,))
+        return _executor
+
+
+def _replace_broken_pool(broken):
+    """Drop a broken executor and warm up a new one in the background (once per broken executor)."""
+    global _executor, _rewarm_task
+    with _executor_lock:
+        if _executor is not broken:
+            return  # another request got here first
+        _executor = None
+        _counters["restarts"] += 1
+        _warmup["ready"] = False
+    print("Worker pool broken (a worker process died), starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+    _rewarm_task = asyncio.get_running_loop().create_task(warm_up_pool())
+
+
+async def warm_up_pool():
+    """Start every pool worker, wait for each to finish warming up and record its timings.
+
+    Every worker reports its pid from the pool initializer, and the pool is
+    ready once OCR_POOL_SIZE different workers have. Until then pool_ready() is
+    False, so /ready keeps a cold worker out of rotation.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    reports = _warm_reports
+    started = time.perf_counter()
+    workers = {}
+    try:
+        # A job per worker makes the executor start them all; each reports once its initializer is done
+        await asyncio.gather(*[loop.run_in_executor(executor, _start_worker) for _ in range(OCR_POOL_SIZE)])
+        deadline = time.monotonic() + WARMUP_TIMEOUT
+        while len(workers) < OCR_POOL_SIZE:
+            report = await loop.run_in_executor(None, reports.get, True, max(0.0, deadline - time.monotonic()))
+            workers[report["pid"]] = report["timings"]
+    except queue.Empty:
+        print(f"Worker pool warm-up failed: {len(workers)} of {OCR_POOL_SIZE} workers warm after {WARMUP_TIMEOUT}s")
+        _warmup["error"] = f"{len(workers)} of {OCR_POOL_SIZE} workers warm after {WARMUP_TIMEOUT}s"
+        return
+    except Exception as e:
+        print(f"Worker pool warm-up failed: {e}")
+        _warmup["error"] = str(e)
+        return
+    if executor is not _executor:
+        return  # the pool broke while warming up; its replacement warms up on its own
+    _warmup.pop("error", None)
+    _warmup["workers"] = [{"pid": pid, "timings": timings} for pid, timings in workers.items()]
+    _warmup["total_ms"] = round(1000 * (time.perf_counter() - started), 1)
+    _warmup["ready"] = True
+    print(f"Worker pool warm: {len(workers)} worker(s) in {_warmup['total_ms']}ms")
+
+
+def pool_ready():
+    return _warmup["ready"]
+
+
+def warmup_report():
+    return dict(_warmup)
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+    _warmup["ready"] = False
+
+
+def _retry_after():
+    """Estimate how long until a slot frees up, in whole seconds."""
+    if not _service_times:
+        return 1
+    avg_service = sum(_service_times) / len(_service_times)
+    queued = max(0, _pending - OCR_POOL_SIZE)
+    return max(1, math.ceil(avg_service * (queued + 1) / OCR_POOL_SIZE))
+
+
+def _pool_full():
+    return _pending >= OCR_POOL_SIZE + OCR_QUEUE_DEPTH
+
+
+async def submit(fn, *args, block=False):
+    """Run fn(*args) in the pool.
+
+    If the pool and its queue are full, raise PoolBusy, or with block=True wait
+    for a slot instead (used by batch processing, which paces itself).
+    """
+    global _pending, _slot_freed
+    if _pool_full():
+        if not block:
+            _counters["rejected"] += 1
+            raise PoolBusy(_retry_after())
+        if _slot_freed is None:
+            _slot_freed = asyncio.Condition()
+        async with _slot_freed:
+            await _slot_freed.wait_for(lambda: not _pool_full())
+
+    _pending += 1
+    _counters["submitted"] += 1
+    submitted = time.time()
+    executor = get_executor()
+    try:
+        loop = asyncio.get_running_loop()
+        started, finished, result = await loop.run_in_executor(executor, _timed_call, fn, args)
+    except BrokenProcessPool as e:
+        _counters["failed"] += 1
+        _replace_broken_pool(executor)
+        raise PoolBusy(max(1, math.ceil(_warmup.get("total_ms", 1000) / 1000))) from e
+    except Exception:
+        _counters["failed"] += 1
+        raise
+    finally:
+        _pending -= 1
+        if _slot_freed is not None:
+            async with _slot_freed:
+                _slot_freed.notify()
+
+    _counters["completed"] += 1
+    metrics.add_time("pool_wait", max(0.0, started - submitted))
+    _waits.append(max(0.0, started - submitted))
+    _service_times.append(finished - started)
+    return result
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def pool_stats():
+    """Current queue depth and recent wait/run times, for sizing the pool."""
+    waits = list(_waits)
+    service = list(_service_times)
+    return {
+        "pool_size": OCR_POOL_SIZE,
+        "queue_limit": OCR_QUEUE_DEPTH,
+        "running": min(_pending, OCR_POOL_SIZE),
+        "queued": max(0, _pending - OCR_POOL_SIZE),
+        **_counters,
+        "wait_ms_avg": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+        "wait_ms_p95": round(1000 * _percentile(waits, 95), 1),
+        "wait_ms_max": round(1000 * max(waits), 1) if waits else 0.0,
+        "run_ms_avg": round(1000 * sum(service) / len(service), 1) if service else 0.0,
+    }
@@ -2,11 +2,10 @@
 Standalone FastAPI application for Document Intelligence System.
 Run with: uvicorn main_standalone:app --reload
 """
-import os
+import asyncio
 import sys
-import tempfile
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, HTTPException, File
+from fastapi import APIRouter, FastAPI, UploadFile, HTTPException, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import traceback
@@ -15,11 +14,13 @@ import traceback
 sys.path.insert(0, str(Path(__file__).parent / "app"))
 
 # Import modules
-import ocr
-import classifier
-import extractor
-import text_processor
-from config import ALLOWED_EXTENSIONS, UPLOAD_MAX_SIZE
+import persistence
+import supabase_io
+from classifier import model_version
+from database import init_db
+from uploads import InMemoryUploadRoute, reject_oversized
+from pipeline import StageBusy, READ, PROCESS, build_pipeline
+from workers import PoolBusy, shutdown_pool, warm_up_pool
 
 load_dotenv()
 
@@ -34,6 +35,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse uploads whose Content-Length is over the limit before reading the body."""
+    rejected = reject_oversized(request, ("/process",))
+    return rejected or await call_next(request)
+
 @app.get("/")
 async def root():
     return {
@@ -47,72 +54,63 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "document-intelligence"}
 
-@app.post("/process")
+@app.on_event("startup")
+async def startup():
+    try:
+        init_db()
+    except Exception as e:
+        print(f"Database warning: {e}")
+    try:
+        model_version()
+    except Exception as e:
+        print(f"Classifier model warning: {e}")
+    # Load Tesseract, EasyOCR and the classifier in every pool worker before the first upload
+    app.state.warmup_task = asyncio.create_task(warm_up_pool())
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_pool()
+    persistence.stop()
+    supabase_io.shutdown()
+
+# Read, then the same stages as app/main.py's /process: cache, upload, OCR → clean →
+# classify → extract in the worker pool, text check and persistence (see app/pipeline.py)
+pipeline = build_pipeline([PROCESS], intake=[READ])
+
+# Uploads are parsed into memory instead of being spooled to disk (see app/uploads.py)
+single_file = APIRouter(route_class=InMemoryUploadRoute)
+
+@single_file.post("/process")
 async def process_document(file: UploadFile = File(...)):
     """Process uploaded document: OCR → Classify → Extract fields."""
     
-    tmp_path = None
     try:
-        # Validate file extension
-        file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File type {file_ext} not allowed. Allowed: {list(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read file content
-        content = await file.read()
-        
-        # Validate file size
-        if len(content) > UPLOAD_MAX_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Max size: {UPLOAD_MAX_SIZE / 1024 / 1024}MB"
-            )
-        
-        # Save temp file
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
-        tmp.write(content)
-        tmp.close()
-        tmp_path = tmp.name
-        
-        # Step 1: OCR
-        text = ocr.run_ocr(tmp_path)
-        if not text or len(text.strip()) < 10:
-            raise HTTPException(status_code=400, detail="Could not extract text from document")
-        
-        # Step 2: Clean text
-        cleaned = text_processor.clean_text(text)
-        
-        # Step 3: Classify
-        doc_type, confidence = classifier.classify_document(cleaned)
-        
-        # Step 4: Extract fields
-        extracted_json = extractor.extract_fields(doc_type, cleaned)
+        doc = await pipeline.run({"file": file})
+        result = doc["result"]
         
         return {
             "success": True,
             "filename": file.filename,
-            "document_type": doc_type,
-            "confidence": confidence,
-            "extracted_data": extracted_json,
-            "raw_text": cleaned[:500],  # Preview
+            "document_type": result["document_type"],
+            "confidence": result["confidence"],
+            "extracted_data": result["extracted"],
+            "raw_text": result["cleaned"][:500],  # Preview
+            "cached": doc.get("cached", False),
         }
     
+    except (PoolBusy, StageBusy) as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy processing other documents, please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except HTTPException:
         raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
-    
-    finally:
-        # Cleanup temp file
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
+
+app.include_router(single_file)
 
 # Note: Do NOT add uvicorn.run() here when using --reload
 # Run with: uvicorn main_standalone:app --reload --port 8000
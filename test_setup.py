@@ -33,7 +33,7 @@ def check_dependencies():
 def check_model():
     """Check if classifier model exists."""
     print("\n🤖 Checking ML model...")
-    model_path = Path("app/model_artifacts/classifier.pkl")
+    model_path = Path("app/model_artifacts/classifier/meta.json")
     
     if model_path.exists():
         print(f"  ✅ Model found at {model_path}")
@@ -0,0 +1,53 @@
+"""
+Shared test setup.
+
+Settings point every store (database, result cache, near-duplicate index,
+result log) at a temporary directory before the app is imported, and Supabase
+is switched off. The OCR engines are replaced by a fixed-text fake where
+Tesseract or EasyOCR isn't installed, so the pipeline runs end to end on any
+machine; pool workers are forked and inherit the fake.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="docintel-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TMP}/test.db",
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+    "RESULT_CACHE_PATH": f"{TMP}/results.sqlite3",
+    "NEAR_DUP_PATH": f"{TMP}/near_dup.sqlite3",
+    "RESULT_LOG_DIR": f"{TMP}/result_log",
+    "CLASSIFIER_MODEL_PATH": os.path.join(ROOT, "app", "model_artifacts", "classifier"),
+    "MODEL_REGISTRY_PATH": f"{TMP}/registry",
+    "OCR_POOL_SIZE": "2",
+    "OCR_WARMUP_EASYOCR": "false",
+})
+
+OCR_TEXT = "Invoice number: 6312 Subtotal 58,658.00 Date: 11/15/2025 Total: $1,234.50"
+
+try:
+    import easyocr  # noqa: F401
+except ImportError:
+    easyocr = types.ModuleType("easyocr")
+
+    class Reader:
+        def __init__(self, langs, **kwargs):
+            pass
+
+        def readtext(self, image, detail=0, **kwargs):
+            return [OCR_TEXT]
+
+    easyocr.Reader = Reader
+    sys.modules["easyocr"] = easyocr
+
+import pytesseract  # noqa: E402
+
+if shutil.which("tesseract") is None:
+    pytesseract.image_to_string = lambda image, *args, **kwargs: OCR_TEXT
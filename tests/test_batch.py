@@ -0,0 +1,34 @@
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+from conftest import ROOT
+
+
+def test_bad_files_get_error_lines_and_the_batch_a_summary():
+    with open(os.path.join(ROOT, "test.jpg"), "rb") as f:
+        image = f.read()
+    files = [
+        ("files", ("good-1.jpg", image + os.urandom(8), "image/jpeg")),
+        ("files", ("notes.txt", b"not a document", "text/plain")),
+        ("files", ("good-2.jpg", image + os.urandom(8), "image/jpeg")),
+        ("files", ("setup.exe", b"MZ", "application/octet-stream")),
+    ]
+    with TestClient(app) as client:
+        response = client.post("/process/batch", files=files)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *lines, summary = [json.loads(line) for line in response.text.splitlines()]
+    assert summary == {"summary": True, "total": 4, "succeeded": 2, "failed": 2}
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[0]["success"] and by_index[2]["success"]
+    assert by_index[1] == {"index": 1, "success": False, "filename": "notes.txt", "status_code": 400,
+                           "error": by_index[1]["error"]}
+    assert "not allowed" in by_index[1]["error"]
+    assert not by_index[3]["success"] and by_index[3]["status_code"] == 400
+    assert by_index[0]["filename"] == "good-1.jpg" and by_index[2]["filename"] == "good-2.jpg"
@@ -0,0 +1,48 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app import cache
+from app.main import app
+from app.workers import analyze_text
+
+from conftest import ROOT
+
+
+def test_failed_ocr_is_not_cached():
+    result = analyze_text("Error processing PDF: Unable to get page count. Is poppler installed?", [])
+    assert result["ocr_failed"]
+    key = cache.cache_key(b"broken", ".pdf")
+    cache.put(key, result)
+    assert cache.get(key) is None
+
+
+def test_successful_result_is_cached():
+    result = analyze_text("Invoice number 12 Total: $1,234.50 due 2025-11-15", [{"page": 1, "source": "tesseract"}])
+    assert not result["ocr_failed"]
+    key = cache.cache_key(b"good", ".png")
+    cache.put(key, result)
+    assert cache.get(key)["document_type"] == result["document_type"]
+
+
+def test_unreadable_pdf_is_processed_again_on_reupload():
+    broken = b"%PDF-1.4\nnot really a pdf " + os.urandom(8)
+    with TestClient(app) as client:
+        for _ in range(2):
+            response = client.post("/process", files={"file": ("broken.pdf", broken, "application/pdf")})
+            assert not response.json().get("cached")
+        with open(os.path.join(ROOT, "test.jpg"), "rb") as f:
+            image = f.read() + os.urandom(8)
+        first = client.post("/process", files={"file": ("cached.jpg", image, "image/jpeg")}).json()
+        second = client.post("/process", files={"file": ("cached.jpg", image, "image/jpeg")}).json()
+    assert first["cached"] is False and second["cached"] is True
+
+
+def test_preprocessing_settings_change_the_key(monkeypatch):
+    from app import preprocess
+    key = cache.cache_key(b"same bytes", ".png")
+    monkeypatch.setitem(preprocess.DEFAULT_STEPS, "deskew", not preprocess.DEFAULT_STEPS["deskew"])
+    assert cache.cache_key(b"same bytes", ".png") != key
+    monkeypatch.undo()
+    monkeypatch.setattr(cache, "PREPROCESS_TARGET_LINE_HEIGHT", 24)
+    assert cache.cache_key(b"same bytes", ".png") != key
@@ -0,0 +1,22 @@
+import importlib
+import os
+
+from app import config
+
+
+def _reload(monkeypatch, cpus, **env):
+    monkeypatch.setattr(os, "cpu_count", lambda: cpus)
+    monkeypatch.delenv("OCR_PAGE_WORKERS", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return importlib.reload(config)
+
+
+def test_page_workers_share_the_cores_between_pool_processes(monkeypatch):
+    try:
+        assert _reload(monkeypatch, 8, OCR_POOL_SIZE="2").OCR_PAGE_WORKERS == 4
+        assert _reload(monkeypatch, 8, OCR_POOL_SIZE="8").OCR_PAGE_WORKERS == 1
+        assert _reload(monkeypatch, 2, OCR_POOL_SIZE="4").OCR_PAGE_WORKERS == 1
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from app import extractor
+
+import legacy_extractor
+from conftest import OCR_TEXT, ROOT
+
+SAMPLES = {
+    "invoice": [
+        OCR_TEXT,
+        "INVOICE # A-1029\nAccount No. 55-21\nLABOR HOURS RATE AMOUNT\n4 50.00 $200.00\n3 20.00 60.00\n"
+        "MATERIAL QTY AMOUNT\n2 $1,250.00\nSubtotal: $1,510.00\nTax 120.80\nTOTAL $1,630.80\nDate 2025-03-04",
+        "Involce no: 77 amount: 19.99 due 31/12/2024 and 13/45/2024",
+        "invoice total 40 date 99/99/99",
+        "Rechnung über 12,00 — Total: 12,00 Datum 2024-02-30 ınvoice 5",
+        "",
+    ],
+    "cv": [
+        "Jane Doe\nSkills: Python, Docker, AWS, react, node.js, SQL\n5+ years of experience\n"
+        "Bachelor of Science, State University",
+        "Experience: 12 years with TypeScript and Git. PhD, MIT college",
+        "JAVASCRIPT and c++ developer, 0 years experience",
+        "No keywords here at all",
+    ],
+    "id_card": [
+        "REPUBLIC ID CARD\nName: Jane Ann Smith\nDOB: 02/14/1990\nID# X9-1234\nAddress: 12 High Street, Springfield \n",
+        "Full Name: John Smith\nborn 31-12-1985\nLicense Number: DL-99\nResidence: Flat 4, Rue Haute",
+        "name: lower case\nDate of Birth: 13/13/1999\nidentity unknown\naddr:   somewhere  ",
+        "Nothing useful",
+    ],
+}
+
+
+def _logged_texts():
+    with open(os.path.join(ROOT, "processed_documents.jsonl"), encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [(r["document_type"], r["extracted_text"]) for r in records if r["document_type"] in SAMPLES]
+
+
+CASES = [(doc_type, text) for doc_type, texts in SAMPLES.items() for text in texts] + _logged_texts()
+FIELD_EXTRACTORS = {"invoice": "extract_invoice", "cv": "extract_cv", "id_card": "extract_id"}
+
+
+@pytest.mark.parametrize("doc_type, text", CASES)
+def test_output_matches_the_regex_extractor(doc_type, text):
+    assert extractor.extract_fields(doc_type, text) == legacy_extractor.extract_fields(doc_type, text)
+
+
+@pytest.mark.parametrize("doc_type, text", CASES)
+def test_every_field_matches_the_regex_extractor(doc_type, text):
+    new = getattr(extractor, FIELD_EXTRACTORS[doc_type])(text)
+    old = getattr(legacy_extractor, FIELD_EXTRACTORS[doc_type])(text)
+    assert new == old
+
+
+def test_unknown_type():
+    assert extractor.extract_fields("receipt", "Total 5") == legacy_extractor.extract_fields("receipt", "Total 5")
@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+from app import job_worker, persistence, workers
+from app.database import init_db
+from app.jobs import create_job, get_job
+from app.search import search_documents
+
+from conftest import ROOT
+
+
+def test_job_result_is_persisted_and_searchable():
+    init_db()
+    with open(os.path.join(ROOT, "test.jpg"), "rb") as f:
+        # Trailing bytes make the upload unique, so it isn't answered from the result cache
+        job_id = create_job("job-persisted.jpg", "image/jpeg", f.read() + os.urandom(16))
+
+    async def run_one():
+        jobs = job_worker.claimed_jobs("test-worker")
+        try:
+            doc = await jobs.__anext__()
+            await job_worker.job_pipeline.run(doc, block=True)
+            job_worker.finish(doc, None)
+            doc["lease_done"].set()
+        finally:
+            await jobs.aclose()
+
+    try:
+        asyncio.run(run_one())
+    finally:
+        workers.shutdown_pool()
+        persistence.stop()  # flushes the write-behind queue
+
+    job = get_job(job_id)
+    assert job["status"] == "done", job
+    found = search_documents(document_type=job["result"]["document_type"])["results"]
+    assert "job-persisted.jpg" in [doc["filename"] for doc in found]
+
+
+def test_job_pipeline_matches_the_api():
+    from app.main import process_pipeline
+    api = [stage.name for stage in process_pipeline.stages]
+    assert [stage.name for stage in job_worker.job_pipeline.stages] == api[1:]  # all but reading the upload
@@ -0,0 +1,31 @@
+import os
+import re
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+from conftest import ROOT
+
+
+def test_process_reports_stage_timings_and_metrics_render():
+    with open(os.path.join(ROOT, "test.jpg"), "rb") as f:
+        image = f.read() + os.urandom(8)
+    with TestClient(app) as client:
+        response = client.post("/process", files={"file": ("metrics.jpg", image, "image/jpeg")})
+        health = client.get("/health")
+        exposition = client.get("/metrics")
+
+    assert response.status_code == 200
+    timings = dict(re.findall(r"([\w-]+);dur=([\d.]+)", response.headers["Server-Timing"]))
+    assert {"read_upload", "total"} <= timings.keys()
+    assert "total" in health.headers["Server-Timing"]
+
+    assert exposition.status_code == 200
+    assert exposition.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = exposition.text
+    for metric in ("docintel_stage_seconds", "docintel_requests_total", "docintel_request_seconds",
+                   "docintel_pool_running"):
+        assert f"# TYPE {metric} " in text
+    assert re.search(r'docintel_requests_total\{path="/process",status="200"\} [1-9]', text)
+    assert re.search(r'docintel_stage_seconds_bucket\{.*stage="read_upload".*le="\+Inf"\} [1-9]', text)
@@ -0,0 +1,44 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from app.model_artifact import convert_pickle, load_artifact, predict
+from app.train_classifier import training_data
+
+TEXTS = [
+    "Invoice Total $500 Tax $50 Company ABC",
+    "Skills Python Java 5 years experience University degree",
+    "Name John Doe DOB 01-01-1990 Address 1 Main Street",
+    "Receipt Coffee Shop Amount $8.50",
+    "",
+    "zzz unseen words only qqq",
+    "INVOICE invoice Invoice amount due amount due",
+]
+
+VECTORIZERS = {
+    "tfidf": lambda: TfidfVectorizer(max_features=1000, ngram_range=(1, 2), stop_words="english"),
+    "tfidf_sublinear": lambda: TfidfVectorizer(sublinear_tf=True, norm="l1"),
+    "counts": lambda: CountVectorizer(binary=True),
+    "hashing": lambda: HashingVectorizer(n_features=2 ** 12, alternate_sign=False),
+}
+
+
+@pytest.mark.parametrize("kind", VECTORIZERS)
+def test_artifact_predicts_like_the_pickled_model(kind, tmp_path):
+    texts, labels = zip(*training_data)
+    vectorizer = VECTORIZERS[kind]()
+    model = MultinomialNB(alpha=0.1).fit(vectorizer.fit_transform(texts), labels)
+    with open(tmp_path / "classifier.pkl", "wb") as f:
+        pickle.dump((model, vectorizer), f)
+
+    convert_pickle(str(tmp_path / "classifier.pkl"), str(tmp_path / "artifact"))
+    artifact = load_artifact(str(tmp_path / "artifact"))
+    assert isinstance(artifact["feature_log_prob"], np.memmap)
+
+    probabilities = model.predict_proba(vectorizer.transform(TEXTS))
+    labels, confidences = predict(artifact, TEXTS)
+    assert list(labels) == list(model.classes_[probabilities.argmax(axis=1)])
+    np.testing.assert_allclose(confidences, probabilities.max(axis=1), rtol=1e-9)
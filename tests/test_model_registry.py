@@ -0,0 +1,81 @@
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from app import classifier, model_registry, workers
+from app.model_artifact import save_artifact
+from app.train_classifier import training_data
+
+
+def train_artifact(directory, alpha):
+    """A small artifact trained on the bundled samples; each alpha gives a different version."""
+    texts, labels = zip(*training_data)
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), stop_words="english")
+    model = MultinomialNB(alpha=alpha).fit(vectorizer.fit_transform(texts), labels)
+    save_artifact(str(directory), vectorizer, model, {"alpha": alpha})
+    return str(directory)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    path = str(tmp_path / "registry")
+    versions = [model_registry.publish(train_artifact(tmp_path / f"model-{alpha}", alpha), path)
+                for alpha in (0.1, 0.5, 1.0)]
+    return path, versions
+
+
+def _activate_many(registry, versions, rounds, changes):
+    switched = 0
+    for i in range(rounds):
+        version = versions[i % len(versions)]
+        switched += model_registry.activate(version, registry) not in (None, version)
+    changes.put(switched)
+
+
+def test_concurrent_activations_keep_every_history_entry(registry, monkeypatch):
+    path, versions = registry
+    monkeypatch.setattr(model_registry, "HISTORY_LENGTH", 10_000)
+    changes = multiprocessing.get_context("fork").Queue()
+    workers = [multiprocessing.get_context("fork").Process(
+        target=_activate_many, args=(path, versions[i:] + versions[:i], 40, changes)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    switched = sum(changes.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+    # Every activation that replaced another version pushed exactly that version onto the history
+    assert len(model_registry.read_active(path)["history"]) == switched
+
+
+@pytest.fixture
+def shared_registry(tmp_path):
+    """Versions published to the registry every process reads (MODEL_REGISTRY_PATH), emptied afterwards."""
+    versions = [model_registry.publish(train_artifact(tmp_path / f"model-{alpha}", alpha)) for alpha in (0.2, 0.7)]
+    yield versions
+    os.remove(os.path.join(model_registry.MODEL_REGISTRY_PATH, "active.json"))
+    workers.shutdown_pool()
+
+
+def test_swap_and_rollback_switch_the_model_in_every_process(shared_registry):
+    first, second = shared_registry
+    bundled = classifier.model_version()
+
+    async def versions_in_pool():
+        return set(await asyncio.gather(*(workers.submit(classifier.model_version) for _ in range(8))))
+
+    async def scenario():
+        await workers.warm_up_pool()
+        seen = [await versions_in_pool()]
+        for switch in (lambda: classifier.swap_model(first), lambda: classifier.swap_model(second),
+                       classifier.rollback_model):
+            switched = switch()
+            assert classifier.model_version() == switched["active"]
+            seen.append(await versions_in_pool())
+        return seen
+
+    assert asyncio.run(scenario()) == [{bundled}, {first}, {second}, {first}]
+    assert model_registry.read_active()["history"] == []
@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import near_dup
+from app.main import app
+from app.workers import analyze_text
+
+from conftest import ROOT
+
+
+def _no_render(*args, **kwargs):
+    raise AssertionError("pages rendered with page reuse off")
+
+
+def test_pages_not_rendered_without_page_reuse(monkeypatch):
+    monkeypatch.setattr(near_dup, "NEAR_DUP_PAGE_REUSE", False)
+    monkeypatch.setattr(near_dup, "page_thumbnails", _no_render)
+    assert near_dup.check_pages(b"%PDF-1.4", ".pdf") == (None, None)
+
+
+def test_render_failure_is_logged_not_raised(monkeypatch, caplog):
+    monkeypatch.setattr(near_dup, "NEAR_DUP_PAGE_REUSE", True)
+    monkeypatch.setattr(near_dup, "page_thumbnails", _no_render)
+    assert near_dup.check_pages(b"%PDF-1.4", ".pdf") == (None, None)
+    assert "Near-duplicate check skipped" in caplog.text
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(near_dup, "NEAR_DUP_ENABLED", True)
+    monkeypatch.setattr(near_dup, "NEAR_DUP_PATH", str(tmp_path / "near_dup.sqlite3"))
+    monkeypatch.setattr(near_dup, "_initialized", False)
+    yield near_dup
+    monkeypatch.setattr(near_dup, "_initialized", False)
+
+
+INVOICE = ("Invoice number 4471 from Acme Supplies Ltd, 12 Harbour Road. Bill to Wombat Holdings. "
+           "Description: printer paper, toner cartridges, delivery. Subtotal 1,120.00 Tax 112.00 "
+           "Total: $1,232.00 Date: 03/02/2025 Payment due within thirty days of the invoice date. "
+           "Please quote the invoice number with your payment and send remittance advice to the "
+           "accounts team. Late payments may be charged interest at the statutory rate. Thank you "
+           "for your business, we look forward to working with you again next quarter.")
+
+
+def test_text_match_links_the_earlier_document_and_is_not_indexed_again(index):
+    first = index.remember(analyze_text(INVOICE, [{"page": 1, "source": "tesseract"}]), None,
+                           {"filename": "scan.pdf", "cache_key": "key-1"})
+    assert "near_duplicate" not in first
+    rescan = INVOICE.replace("Road.", "R0ad,")  # an OCR slip
+    second = index.remember(analyze_text(rescan, [{"page": 1, "source": "tesseract"}]), None,
+                            {"filename": "scan.jpg", "cache_key": "key-2"})
+    assert second["near_duplicate"]["match"] == "text"
+    assert second["near_duplicate"]["of"] == {"filename": "scan.pdf", "cache_key": "key-1"}
+    assert index.near_dup_stats()["entries"] == 1
+
+
+def test_responses_link_the_earlier_upload_by_filename(index):
+    with open(os.path.join(ROOT, "test.jpg"), "rb") as f:
+        image = f.read()
+    original, resaved = image + os.urandom(8), image + os.urandom(8)
+    with TestClient(app) as client:
+        first = client.post("/process", files={"file": ("original.jpg", original, "image/jpeg")}).json()
+        second = client.post("/process", files={"file": ("resaved.jpg", resaved, "image/jpeg")}).json()
+    assert first["near_duplicate"] is None
+    assert second["near_duplicate"]["of"]["filename"] == "original.jpg"
+    assert second["near_duplicate"]["of"]["cache_key"].startswith(hashlib.sha256(original).hexdigest())
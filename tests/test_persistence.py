@@ -0,0 +1,50 @@
+import os
+import queue
+
+import pytest
+
+from app import persistence, result_log
+from app.database import init_db
+from app.search import search_documents
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_log, "RESULT_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(result_log, "_conn", None)
+    monkeypatch.setattr(result_log, "_fds", {})
+    yield result_log
+    for fd in result_log._fds.values():
+        os.close(fd)
+    if result_log._conn is not None:
+        result_log._conn.close()
+
+
+def test_result_goes_to_the_result_log_when_the_queue_stays_full(log, monkeypatch):
+    full = queue.Queue(maxsize=1)
+    full.put({"filename": "queued.pdf"})
+    monkeypatch.setattr(persistence, "_queue", full)
+    monkeypatch.setattr(persistence, "start", lambda: None)  # no writer to make room
+    monkeypatch.setattr(persistence, "PERSIST_WRITE_BEHIND", True)
+    monkeypatch.setattr(persistence, "PERSIST_ENQUEUE_TIMEOUT", 0.01)
+
+    persistence.save_result("overflow.pdf", None, None, "invoice", "Invoice total 10", {"total": 10})
+
+    [record] = log.find(doc_type="invoice")
+    assert record["filename"] == "overflow.pdf"
+    assert full.qsize() == 1
+
+
+def test_stop_flushes_everything_still_queued(monkeypatch):
+    init_db()
+    monkeypatch.setattr(persistence, "PERSIST_FLUSH_INTERVAL", 60)  # only stop() ends the batch
+    written = persistence.persistence_stats()["written"]
+    for i in range(5):
+        persistence.enqueue(f"write-behind-{i}.pdf", "invoice", f"Invoice {i} for wombat holdings", {"n": i})
+    assert persistence.persistence_stats()["written"] == written
+
+    persistence.stop()
+
+    assert persistence.persistence_stats()["written"] == written + 5
+    found = search_documents(q="wombat", limit=10)["results"]
+    assert sorted(doc["filename"] for doc in found) == [f"write-behind-{i}.pdf" for i in range(5)]
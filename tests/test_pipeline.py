@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.pipeline import DocumentPipeline, Stage, StageBusy
+
+
+async def _sleep_for_delay(doc):
+    await asyncio.sleep(doc["delay"])
+    return {"slept": True}
+
+
+def test_run_many_yields_in_completion_order():
+    pipeline = DocumentPipeline([Stage("sleep", _sleep_for_delay, "io")])
+    docs = [{"index": i, "delay": delay} for i, delay in enumerate([0.3, 0.05, 0.15])]
+
+    async def collect():
+        return [(doc["index"], error) async for doc, error in pipeline.run_many(docs)]
+
+    assert asyncio.run(collect()) == [(1, None), (2, None), (0, None)]
+
+
+def test_run_many_pulls_a_document_only_when_there_is_room():
+    running = {"now": 0, "max": 0}
+    pulled = []
+    finished = []
+
+    async def work(doc):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.02)
+        running["now"] -= 1
+
+    async def source():
+        for i in range(10):
+            # Never more than window documents started and unfinished
+            assert len(pulled) - len(finished) < 3
+            pulled.append(i)
+            yield {"index": i}
+
+    pipeline = DocumentPipeline([Stage("work", work, "io")])
+
+    async def collect():
+        async for doc, error in pipeline.run_many(source(), window=3):
+            assert error is None
+            finished.append(doc["index"])
+
+    asyncio.run(collect())
+    assert sorted(finished) == list(range(10))
+    assert running["max"] == 3
+
+
+def _two_stages(inside):
+    async def slow(doc):
+        inside.append(first.inside)
+        await asyncio.sleep(0.05)
+
+    first = Stage("first", lambda doc: None, limit=1, queue=1)
+    second = Stage("second", slow, "io", limit=1, queue=0)
+    return first, second, DocumentPipeline([first, second])
+
+
+def test_full_stage_turns_documents_away():
+    first, second, pipeline = _two_stages([])
+
+    async def burst():
+        return await asyncio.gather(*[pipeline.run({}) for _ in range(4)], return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert [isinstance(r, StageBusy) for r in results].count(True) == 3
+    assert second.counters["completed"] == 1
+
+
+def test_blocked_documents_hold_their_place_until_the_next_stage_has_room():
+    inside = []
+    first, second, pipeline = _two_stages(inside)
+
+    async def burst():
+        return await asyncio.gather(*[pipeline.run({}, block=True) for _ in range(6)])
+
+    asyncio.run(burst())
+    assert second.counters["completed"] == 6
+    # A document waiting for `second` keeps its place in `first`, which holds limit + queue at most
+    assert max(inside) <= 2 and first.inside == 0
+
+
+def test_stage_errors_and_early_exit():
+    later = Stage("later", lambda doc: {"reached": True})
+    done = DocumentPipeline([Stage("hit", lambda doc: {"done": True, "cached": True}), later])
+    doc = asyncio.run(done.run({}))
+    assert doc["cached"] and "reached" not in doc
+
+    failing = DocumentPipeline([Stage("fail", lambda doc: 1 / 0), later])
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(failing.run({}))
+    assert later.counters["completed"] == 0
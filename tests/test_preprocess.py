@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from app.preprocess import preprocess, plan_pdf_render
+
+
+def _page(size, text=None, noise=0.0):
+    image = Image.new("L", size, 255)
+    if text:
+        try:
+            font = ImageFont.truetype("DejaVuSans.ttf", max(12, size[1] // 70))
+        except OSError:
+            font = ImageFont.load_default()
+        ImageDraw.Draw(image).text((size[0] // 10, size[1] // 2), text, fill=0, font=font)
+    if noise:
+        pixels = np.asarray(image, dtype=np.float64) + np.random.default_rng(0).normal(0, noise, image.size[::-1])
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return image
+
+
+def test_one_line_a4_page_is_not_blank():
+    page = _page((2480, 3508), "Subtotal 1,000.00   Total: $1,234.50")
+    image, info = preprocess(page, {"blank": True})
+    assert image is not None and "blank" not in info
+
+
+def test_one_line_small_image_is_not_blank():
+    image, _ = preprocess(_page((400, 200), "Total: $1,234.50"), {"blank": True})
+    assert image is not None
+
+
+def test_one_line_pdf_probe_is_rendered():
+    probe = _page((595, 842), "Total: $1,234.50")  # A4 at the 72 dpi probe resolution
+    assert plan_pdf_render(probe, 72, 300, 150, {"blank": True, "scale": True}) is not None
+
+
+def test_empty_pages_are_blank():
+    assert preprocess(_page((2480, 3508)), {"blank": True})[0] is None
+    assert preprocess(_page((2480, 3508), noise=8), {"blank": True})[0] is None
+    assert plan_pdf_render(_page((595, 842), noise=8), 72, 300, 150, {"blank": True}) is None
+
+
+def test_one_line_on_a_noisy_scan_is_not_blank():
+    image, _ = preprocess(_page((2480, 3508), "Total: $1,234.50", noise=8), {"blank": True})
+    assert image is not None
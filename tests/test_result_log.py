@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from app import result_log
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_log, "RESULT_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(result_log, "_conn", None)
+    monkeypatch.setattr(result_log, "_fds", {})
+    yield result_log
+    for fd in result_log._fds.values():
+        os.close(fd)
+    if result_log._conn is not None:
+        result_log._conn.close()
+
+
+def _segment_path(log):
+    return os.path.join(log.RESULT_LOG_DIR, log.segments()[-1])
+
+
+def test_lines_left_unindexed_by_a_crash_are_recovered(log):
+    first = log.append({"document_type": "invoice", "extracted_text": "one"})
+    # A process died after writing a full line and half of another, before indexing either
+    with open(_segment_path(log), "ab") as f:
+        f.write((json.dumps({"id": "orphan", "document_type": "cv", "timestamp": 1}) + "\n").encode())
+        f.write(b'{"id": "torn", "document_ty')
+    after = log.append({"document_type": "receipt", "extracted_text": "two"})
+
+    assert log.get(first)["extracted_text"] == "one"
+    assert log.get("orphan")["document_type"] == "cv"
+    assert log.get(after)["extracted_text"] == "two"
+    assert log.get("torn") is None
+    assert [r["id"] for r in log.iter_records()] == [first, "orphan", after]
+
+
+def test_reindex_rebuilds_a_lost_index(log):
+    ids = log.append_many([{"document_type": "invoice", "n": i} for i in range(5)])
+    log._conn.execute("DELETE FROM records")
+    assert log.get(ids[0]) is None
+
+    assert log.reindex() == 5
+    assert [log.get(i)["n"] for i in ids] == list(range(5))
+    assert log.pending_count() == 5
+
+
+def test_reindex_keeps_replay_status(log):
+    log.append_many([{"document_type": "invoice", "n": i} for i in range(5)])
+    log.mark_replayed([seq for seq, _ in log.pending(2)], "database")
+
+    assert log.reindex() == 5
+    assert log.pending_count() == 3
+    assert [record["n"] for _, record in log.pending(10)] == [2, 3, 4]
+
+
+def test_segments_rotate_and_stay_readable(log, monkeypatch):
+    monkeypatch.setattr(log, "RESULT_LOG_SEGMENT_BYTES", 400)
+    ids = [log.append({"document_type": "invoice", "extracted_text": "x" * 100}) for _ in range(6)]
+    assert len(log.segments()) > 1
+    assert all(log.get(i)["id"] == i for i in ids)
+    assert len(log.find(doc_type="invoice", limit=10)) == 6
@@ -0,0 +1,54 @@
+import pytest
+
+from app.database import init_db, save_documents
+from app.search import search_documents
+
+
+@pytest.fixture(scope="module")
+def documents():
+    init_db()
+    save_documents([{
+        "filename": f"paging-{i}.pdf",
+        "doc_type": "invoice",
+        "raw_text": f"Invoice {i} for the aardvark account, total {100 * i}",
+        "extracted": {"invoice_total": 100 * i, "vendor": "Aardvark Ltd"},
+    } for i in range(7)])
+
+
+def _all_pages(limit, **filters):
+    pages, cursor = [], None
+    while True:
+        page = search_documents(cursor=cursor, limit=limit, **filters)
+        pages.append([doc["filename"] for doc in page["results"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_cover_every_match_once_newest_first(documents):
+    pages = _all_pages(3, q="aardvark")
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [name for page in pages for name in page] == [f"paging-{i}.pdf" for i in reversed(range(7))]
+
+
+def test_field_filters_page_the_same_way(documents):
+    pages = _all_pages(2, fields=["invoice_total>=300", "vendor=aardvark ltd"])
+    assert [name for page in pages for name in page] == [f"paging-{i}.pdf" for i in (6, 5, 4, 3)]
+
+
+def test_bad_cursor_is_rejected(documents):
+    with pytest.raises(ValueError):
+        search_documents(cursor="not-a-cursor")
+
+
+def test_equality_matches_numeric_looking_strings(documents):
+    save_documents([{
+        "filename": "id-card-numeric.png",
+        "doc_type": "id_card",
+        "raw_text": "Name Jane Smith ID 00421 phone 5551234",
+        "extracted": {"id_number": "00421", "phone": "5551234", "age": 42},
+    }])
+    for expression in ("id_number=00421", "phone=5551234", "age=42", "age=42.0"):
+        found = search_documents(fields=[expression])["results"]
+        assert [doc["filename"] for doc in found] == ["id-card-numeric.png"], expression
+    assert search_documents(fields=["id_number=421"])["results"] == []
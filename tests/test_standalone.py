@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+from app.main import process_pipeline
+
+from conftest import ROOT
+
+# main_standalone imports the app modules without the package prefix, so it gets its own
+# process rather than a second copy of every module (and worker pool) in this one
+SCRIPT = """
+import json, os, sys
+sys.path.insert(0, "tests")
+import conftest  # the same settings and OCR stand-ins as this process
+from fastapi.testclient import TestClient
+import main_standalone
+with TestClient(main_standalone.app) as client:
+    warmed = hasattr(main_standalone.app.state, "warmup_task")
+    with open("test.jpg", "rb") as f:
+        image = f.read() + os.urandom(8)
+    statuses = [client.post("/process", files={"file": ("a.jpg", image, "image/jpeg")}).json()["cached"]
+                for _ in range(2)]
+    rejected = client.post("/process", files={"file": ("a.txt", b"text", "text/plain")}).status_code
+print(json.dumps({"stages": [stage.name for stage in main_standalone.pipeline.stages],
+                  "cached": statuses, "rejected": rejected, "warmed": warmed}))
+"""
+
+
+def test_standalone_app_runs_the_shared_pipeline():
+    output = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, env=os.environ, check=True,
+                            capture_output=True, text=True, timeout=300).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    assert report["stages"] == [stage.name for stage in process_pipeline.stages]
+    assert report["cached"] == [False, True]
+    assert report["rejected"] == 400
+    assert report["warmed"]
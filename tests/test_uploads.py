@@ -0,0 +1,41 @@
+from fastapi import APIRouter, FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.formparsers import MultiPartParser
+
+from app import uploads
+from app.main import app as api
+
+
+def _spooled_app():
+    app = FastAPI()
+    single_file = APIRouter(route_class=uploads.InMemoryUploadRoute)
+
+    @single_file.post("/one")
+    async def one(file: UploadFile = File(...)):
+        return {"on_disk": file.file._rolled, "size": len(await uploads.read_upload(file))}
+
+    @app.post("/many")
+    async def many(files: list[UploadFile] = File(...)):
+        return {"on_disk": [f.file._rolled for f in files]}
+
+    app.include_router(single_file)
+    return app
+
+
+def test_only_single_file_routes_keep_uploads_in_memory():
+    content = b"x" * (2 * 1024 * 1024)
+    with TestClient(_spooled_app()) as client:
+        one = client.post("/one", files={"file": ("a.png", content, "image/png")}).json()
+        many = client.post("/many", files=[("files", ("a.png", content, "image/png"))] * 2).json()
+    assert one == {"on_disk": False, "size": len(content)}
+    assert many == {"on_disk": [True, True]}
+    assert MultiPartParser.max_file_size == 1024 * 1024
+
+
+def test_batch_over_the_total_limit_is_refused_before_reading(monkeypatch):
+    monkeypatch.setattr(uploads, "BATCH_MAX_BYTES", 1000)
+    files = [("files", (f"{i}.png", b"x" * 600, "image/png")) for i in range(2)]
+    with TestClient(api) as client:
+        response = client.post("/process/batch", files=files)
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Batch too large")
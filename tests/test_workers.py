@@ -0,0 +1,43 @@
+import asyncio
+import os
+import signal
+
+import pytest
+
+from app import workers
+
+
+def _pid():
+    return os.getpid()
+
+
+def _die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.fixture
+def pool():
+    yield workers
+    workers.shutdown_pool()
+
+
+def test_broken_pool_answers_busy_then_recovers(pool):
+    async def scenario():
+        await pool.warm_up_pool()
+        restarts = pool.pool_stats()["restarts"]
+        with pytest.raises(pool.PoolBusy):
+            await pool.submit(_die)
+        assert pool.pool_stats()["restarts"] == restarts + 1
+        assert not pool.pool_ready()
+        await pool._rewarm_task
+        return await pool.submit(_pid)
+
+    assert asyncio.run(scenario()) != os.getpid()
+    assert pool.pool_ready()
+
+
+def test_ready_once_every_worker_is_warm(pool):
+    asyncio.run(pool.warm_up_pool())
+    report = pool.warmup_report()
+    assert report["ready"]
+    assert len({worker["pid"] for worker in report["workers"]}) == pool.OCR_POOL_SIZE
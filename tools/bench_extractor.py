@@ -0,0 +1,88 @@
+"""
+Benchmark field extraction on large synthetic documents.
+
+Times extract_fields for each document type on generated text of a few sizes.
+With --baseline, the extractor from that git revision is loaded alongside and
+timed on the same texts, and its output is checked against the current one.
+
+Usage: python tools/bench_extractor.py [--sizes 10000 100000 1000000] [--baseline <git rev>]
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import types
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from app import extractor
+
+FILLER = ("worked on a team delivering customer projects with modern tooling and clear "
+          "documentation while mentoring juniors and reviewing code").split()
+SNIPPETS = {
+    "cv": ["Skills: Python, Docker, AWS, React", "5+ years of experience in backend development",
+           "Bachelor of Science, State University", "Experience: 3 years with TypeScript and Git"],
+    "invoice": ["Invoice number: INV-2291", "Account no. ACC-77", "Subtotal: $1,250.00", "Total 1,362.50",
+                "Date: 11/15/2025", "LABOR HOURS RATE AMOUNT 4 50.00 200.00 MATERIAL"],
+    "id_card": ["Name: Jane Ann Smith", "DOB: 02/14/1990", "ID# X9-1234", "Address: 12 High Street, Springfield"],
+}
+
+
+def make_text(doc_type, size, seed=0):
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(SNIPPETS[doc_type]) if rng.random() < 0.02 else rng.choice(FILLER)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def load_baseline(rev):
+    source = subprocess.run(["git", "show", f"{rev}:app/extractor.py"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType("baseline_extractor")
+    exec(compile(source, f"{rev}:app/extractor.py", "exec"), module.__dict__)
+    return module
+
+
+def timed(fn, doc_type, text, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(doc_type, text)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10_000, 100_000, 1_000_000],
+                        help='text sizes in characters')
+    parser.add_argument('--types', nargs='*', default=['cv', 'invoice', 'id_card'], choices=sorted(SNIPPETS))
+    parser.add_argument('--runs', type=int, default=5, help='runs per measurement (median is reported)')
+    parser.add_argument('--baseline', help='git revision whose extractor to compare against')
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    header = f"  {'type':<10}{'chars':>10}{'current':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'speedup':>10}{'same output':>13}"
+    print(header)
+    for doc_type in args.types:
+        for size in args.sizes:
+            text = make_text(doc_type, size)
+            current = timed(extractor.extract_fields, doc_type, text, args.runs)
+            line = f"  {doc_type:<10}{size:>10}{current:>10.2f}ms"
+            if baseline:
+                before = timed(baseline.extract_fields, doc_type, text, args.runs)
+                same = baseline.extract_fields(doc_type, text) == extractor.extract_fields(doc_type, text)
+                line += f"{before:>10.2f}ms{before / current:>9.1f}x{str(same):>13}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
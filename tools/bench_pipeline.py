@@ -0,0 +1,351 @@
+"""
+Benchmark the document pipeline, stage by stage and end to end, on a synthetic corpus.
+
+Generates a reproducible corpus (same --seed, same documents) of invoices,
+CVs, ID cards and receipts rendered with PIL: one-page documents as PNG, JPEG
+and PDF, multi-page invoices and CVs as PDF, each at every --dpi. Then runs,
+in this process and one document at a time:
+
+- the stages in isolation: ocr (ocr_document), clean, classify and extract on
+  the OCR output of each document;
+- the whole pipeline (process_file, as a pool worker runs it, with the current
+  OCR settings), plus the stage timings from its trace (see app/metrics.py),
+  reported as pipeline.<stage>.
+
+Reports throughput and p50/p95/p99 latency per stage and document type (or
+--group-by format, dpi or pages). --save writes the report as JSON; --baseline
+compares against a saved report and exits with status 1 when a p50 or p95 got
+more than --threshold slower (and by more than --min-delta-ms).
+
+Usage: python tools/bench_pipeline.py [--dpi 150 300] [--pages 1 3] [--runs 3] [--save report.json] [--baseline report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from PIL import Image, ImageDraw, ImageFont
+
+TYPES = ['invoice', 'cv', 'id_card', 'receipt']
+MULTI_PAGE = {'invoice', 'cv'}  # ID cards and receipts are always one page
+PAGE_INCHES = {'invoice': (8.27, 11.69), 'cv': (8.27, 11.69), 'id_card': (3.37, 2.13), 'receipt': (3.15, 7.0)}
+FONT_POINTS = {'invoice': 11, 'cv': 11, 'id_card': 8, 'receipt': 9}
+STAGES = ['ocr', 'clean', 'classify', 'extract', 'end_to_end']
+FIRST_NAMES = ['Jane', 'Omar', 'Li', 'Maria', 'Samuel', 'Aisha', 'Tom', 'Priya']
+LAST_NAMES = ['Smith', 'Khan', 'Chen', 'Garcia', 'Okafor', 'Novak', 'Brown', 'Patel']
+ITEMS = ['Consulting services', 'Hosting (monthly)', 'Support plan', 'Design work', 'Licence fee',
+         'Training session', 'Hardware', 'Travel expenses']
+SKILLS = ['Python', 'Docker', 'AWS', 'React', 'SQL', 'Kubernetes', 'TypeScript', 'Git', 'Linux', 'Java']
+SHOP_ITEMS = ['Milk 1L', 'Bread', 'Coffee beans', 'Apples 1kg', 'Eggs x12', 'Butter', 'Rice 2kg', 'Tea']
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _date(rng):
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(2020, 2025)}"
+
+
+def invoice_lines(rng, page, pages):
+    lines = []
+    if page == 1:
+        lines += [f"INVOICE   Invoice number: INV-{rng.randint(1000, 9999)}", f"Date: {_date(rng)}",
+                  f"Bill to: {_name(rng)}, {rng.randint(1, 99)} Market Street", "",
+                  "Description                     Qty     Price      Amount"]
+    subtotal = 0.0
+    for _ in range(rng.randint(6, 14)):
+        qty, price = rng.randint(1, 9), rng.randint(20, 900) + 0.5
+        subtotal += qty * price
+        lines.append(f"{rng.choice(ITEMS):<30}{qty:>5}{price:>10.2f}{qty * price:>12,.2f}")
+    if page == pages:
+        lines += ["", f"Subtotal {subtotal:,.2f}", f"Tax {subtotal * 0.1:,.2f}", f"Total {subtotal * 1.1:,.2f}",
+                  f"Account no. ACC-{rng.randint(10, 99)}"]
+    return lines
+
+
+def cv_lines(rng, page, pages):
+    lines = []
+    if page == 1:
+        lines += [_name(rng), "Curriculum Vitae", "", "Summary",
+                  f"Software engineer with {rng.randint(2, 15)}+ years of experience in backend development.",
+                  "", f"Skills: {', '.join(rng.sample(SKILLS, 5))}", ""]
+    lines.append("Experience")
+    for _ in range(rng.randint(3, 5)):
+        lines += [f"{rng.randint(2010, 2024)} - present   Senior Developer, Example Corp",
+                  "Worked on a team delivering customer projects with modern tooling,",
+                  "mentoring juniors and reviewing code."]
+    if page == pages:
+        lines += ["", "Education", "Bachelor of Science in Computer Science, State University"]
+    return lines
+
+
+def id_card_lines(rng, page, pages):
+    return ["IDENTITY CARD", f"Name: {_name(rng)}", f"DOB: {_date(rng)}",
+            f"ID# {rng.choice('XYZ')}{rng.randint(1, 9)}-{rng.randint(1000, 9999)}",
+            f"Address: {rng.randint(1, 99)} High Street, Springfield", f"Expiry: {_date(rng)}"]
+
+
+def receipt_lines(rng, page, pages):
+    lines = ["CORNER STORE", f"{rng.randint(1, 99)} Main Road", f"Date: {_date(rng)}  Till {rng.randint(1, 6)}", ""]
+    total = 0.0
+    for _ in range(rng.randint(4, 10)):
+        price = rng.randint(50, 1500) / 100
+        total += price
+        lines.append(f"{rng.choice(SHOP_ITEMS):<16}{price:>8.2f}")
+    return lines + ["", f"TOTAL {total:.2f}", f"CASH {total + rng.randint(0, 5):.2f}", "Thank you for shopping"]
+
+
+LINES = {'invoice': invoice_lines, 'cv': cv_lines, 'id_card': id_card_lines, 'receipt': receipt_lines}
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_page(doc_type, lines, dpi):
+    """A white page of the document type's physical size at dpi, with lines of text at FONT_POINTS."""
+    width, height = (round(inches * dpi) for inches in PAGE_INCHES[doc_type])
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    size = max(8, round(FONT_POINTS[doc_type] * dpi / 72))
+    font = _font(size)
+    margin = round(0.08 * min(width, height))
+    for i, line in enumerate(lines):
+        y = margin + round(i * size * 1.4)
+        if y + size > height - margin:
+            break
+        draw.text((margin, y), line, fill=0, font=font)
+    return page
+
+
+def corpus_plan(dpis, page_counts):
+    """(doc_type, pages, dpi, format) for every document of the corpus."""
+    plan = []
+    for doc_type in TYPES:
+        for dpi in dpis:
+            for pages in page_counts:
+                if pages > 1 and doc_type not in MULTI_PAGE:
+                    continue
+                for fmt in (['png', 'jpg', 'pdf'] if pages == 1 else ['pdf']):
+                    plan.append((doc_type, pages, dpi, fmt))
+    return plan
+
+
+def build_corpus(directory, dpis, page_counts, copies, seed):
+    """Render the corpus into directory (reused when already built with the same parameters). Returns the manifest."""
+    params = {"dpis": dpis, "page_counts": page_counts, "copies": copies, "seed": seed}
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+        if manifest["params"] == params:
+            return manifest
+        for document in manifest["documents"]:
+            os.remove(os.path.join(directory, document["file"]))
+    os.makedirs(directory, exist_ok=True)
+    documents = []
+    for copy in range(copies):
+        for doc_type, pages, dpi, fmt in corpus_plan(dpis, page_counts):
+            rng = random.Random(f"{seed}:{doc_type}:{pages}:{dpi}:{fmt}:{copy}")
+            images = [render_page(doc_type, LINES[doc_type](rng, page, pages), dpi) for page in range(1, pages + 1)]
+            name = f"{doc_type}_{pages}p_{dpi}dpi_{copy}.{fmt}"
+            path = os.path.join(directory, name)
+            if fmt == 'pdf':
+                images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+            elif fmt == 'jpg':
+                images[0].save(path, "JPEG", quality=85, dpi=(dpi, dpi))
+            else:
+                images[0].save(path, "PNG", dpi=(dpi, dpi))
+            documents.append({"file": name, "type": doc_type, "pages": pages, "dpi": dpi, "format": fmt})
+    manifest = {"params": params, "documents": documents}
+    with open(manifest_path, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+    return manifest
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    """samples: list of (seconds, pages). Latency percentiles in ms and throughput."""
+    times = [seconds for seconds, _ in samples]
+    total = sum(times)
+    return {
+        "n": len(times),
+        "p50_ms": round(1000 * statistics.median(times), 3),
+        "p95_ms": round(1000 * percentile(times, 95), 3),
+        "p99_ms": round(1000 * percentile(times, 99), 3),
+        "mean_ms": round(1000 * total / len(times), 3),
+        "docs_per_s": round(len(times) / total, 2) if total else None,
+        "pages_per_s": round(sum(pages for _, pages in samples) / total, 2) if total else None,
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def run(manifest, directory, runs, group_by):
+    """Time every stage on every document runs times.
+
+    Returns ({stage: {group: stats}}, {type: share classified as that type}, {file: first error}).
+    """
+    from app import classifier, ocr, workers
+    from app.config import OCR_WARMUP_EASYOCR
+    from app.extractor import extract_fields
+    from app.text_processor import clean_text
+
+    classifier.warm_up()
+    ocr.warm_up(easyocr_reader=OCR_WARMUP_EASYOCR)
+    samples = {}
+    classified = {}
+    errors = {}
+
+    def add(stage, document, seconds):
+        for group in (str(document[group_by]), "all"):
+            samples.setdefault(stage, {}).setdefault(group, []).append((seconds, document["pages"]))
+
+    for document in manifest["documents"]:
+        path = os.path.join(directory, document["file"])
+        for attempt in range(runs + 1):
+            warmup = attempt == 0  # the first run of each document only warms caches
+            try:
+                ocr_time, (text, pages) = timed(ocr.ocr_document, path)
+                if not pages:
+                    raise RuntimeError(f"no pages read ({text})")
+                clean_time, cleaned = timed(clean_text, text)
+                classify_time, (_, [(doc_type, _)]) = timed(classifier.classify_batch, [cleaned])
+                extract_time, _ = timed(extract_fields, doc_type, cleaned)
+                total_time, result = timed(workers.process_file, path)
+            except Exception as e:
+                errors.setdefault(document["file"], f"{type(e).__name__}: {e}")
+                break
+            if warmup:
+                continue
+            for stage, seconds in zip(STAGES, (ocr_time, clean_time, classify_time, extract_time, total_time)):
+                add(stage, document, seconds)
+            for stage, values in result["trace"]["stages"].items():
+                add(f"pipeline.{stage}", document, sum(values))
+            classified.setdefault(document["type"], []).append(document["type"] == result.get("document_type"))
+    accuracy = {doc_type: round(sum(hits) / len(hits), 3) for doc_type, hits in classified.items()}
+    report = {stage: {group: summarize(values) for group, values in sorted(groups.items())}
+              for stage, groups in samples.items()}
+    return report, accuracy, errors
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def settings():
+    """The settings that change what the pipeline does, recorded with the report."""
+    from app import config
+    names = ["OCR_ENGINE", "OCR_PDF_DPI", "OCR_PAGE_WORKERS", "OCR_TWO_PASS", "OCR_EARLY_EXIT", "OCR_PDF_TEXT_LAYER",
+             "OCR_PDF_FIRST_PAGE", "OCR_PDF_LAST_PAGE", "NEAR_DUP_ENABLED", "NEAR_DUP_PAGE_REUSE"]
+    return {name: getattr(config, name) for name in names if hasattr(config, name)}
+
+
+def print_report(report, accuracy):
+    print(f"  {'stage':<26}{'group':<10}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'docs/s':>9}{'pages/s':>9}")
+    for stage in sorted(report, key=lambda s: (s.startswith("pipeline."), STAGES.index(s) if s in STAGES else 0, s)):
+        for group, stats in report[stage].items():
+            print(f"  {stage:<26}{group:<10}{stats['n']:>5}{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms"
+                  f"{stats['p99_ms']:>8.1f}ms{stats['docs_per_s'] or 0:>9.1f}{stats['pages_per_s'] or 0:>9.1f}")
+    if accuracy:
+        print("  classified as their own type: " + ", ".join(f"{t} {a:.0%}" for t, a in sorted(accuracy.items())))
+
+
+def compare(report, baseline, threshold, min_delta_ms):
+    """Print the p50/p95 changes against baseline. Returns the regressions."""
+    regressions = []
+    print(f"\n  {'stage':<26}{'group':<10}{'p50 before':>12}{'after':>10}{'p95 before':>12}{'after':>10}")
+    for stage, groups in report.items():
+        for group, stats in groups.items():
+            before = baseline.get(stage, {}).get(group)
+            if not before:
+                continue
+            flags = []
+            for key in ("p50_ms", "p95_ms"):
+                if (stats[key] > before[key] * (1 + threshold)
+                        and stats[key] - before[key] > min_delta_ms):
+                    flags.append(key[:3])
+            if flags:
+                regressions.append((stage, group, flags))
+            print(f"  {stage:<26}{group:<10}{before['p50_ms']:>10.1f}ms{stats['p50_ms']:>8.1f}ms"
+                  f"{before['p95_ms']:>10.1f}ms{stats['p95_ms']:>8.1f}ms"
+                  f"{'  SLOWER (' + ', '.join(flags) + ')' if flags else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dpi', type=int, nargs='*', default=[150, 300], help='resolutions to render at')
+    parser.add_argument('--pages', type=int, nargs='*', default=[1, 3], help='page counts of invoices and CVs')
+    parser.add_argument('--copies', type=int, default=1, help='documents per type, page count, resolution and format')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=3, help='timed runs per document, after one warm-up run')
+    parser.add_argument('--corpus', default=os.path.join(ROOT, 'cache', 'bench_corpus'), help='corpus directory')
+    parser.add_argument('--group-by', default='type', choices=['type', 'format', 'dpi', 'pages'])
+    parser.add_argument('--save', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed slowdown before failing (0.15 = 15%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manifest = build_corpus(args.corpus, args.dpi, args.pages, args.copies, args.seed)
+    print(f"Corpus: {len(manifest['documents'])} documents in {args.corpus} ({time.perf_counter() - started:.1f}s)")
+    # Keep the benchmark's documents out of the near-duplicate index the API uses
+    os.environ["NEAR_DUP_PATH"] = os.path.join(args.corpus, "near_dup.sqlite3")
+
+    report, accuracy, errors = run(manifest, args.corpus, args.runs, args.group_by)
+    for name, error in sorted(errors.items()):
+        print(f"  {name}: failed, {error}")
+    print_report(report, accuracy)
+
+    output = {
+        "meta": {"revision": git_revision(), "python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "corpus": manifest["params"], "runs": args.runs,
+                 "group_by": args.group_by, "settings": settings()},
+        "results": report,
+        "classified": accuracy,
+        "errors": errors,
+    }
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(output, fh, indent=1)
+        print(f"Report saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        for key in ("corpus", "group_by", "settings"):
+            if baseline["meta"].get(key) != output["meta"][key]:
+                print(f"Warning: baseline was run with another {key}: {baseline['meta'].get(key)}")
+        regressions = compare(report, baseline["results"], args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against "
+                  f"{baseline['meta'].get('revision') or args.baseline}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
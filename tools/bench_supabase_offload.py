@@ -0,0 +1,88 @@
+"""
+Compare /process latency with Supabase uploads and inserts on and off the request path.
+
+Starts tools/fake_supabase.py with a fixed per-call latency, then sends the
+same documents through the API (in-process, via FastAPI's TestClient) once per
+SUPABASE_UPLOAD_MODE: inline (upload before OCR, insert after extraction),
+concurrent and background. Each mode runs in its own process, because
+settings are read at import. The result cache is off, so every request does
+the full work. After each run the fake server's counts show that the uploads
+and inserts still happened.
+
+Usage: python tools/bench_supabase_offload.py [files...] [--requests 20] [--latency 0.2] [--fail-rate 0.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MODES = ['inline', 'concurrent', 'background']
+SAMPLES = ['test.jpg', 'page0.png']
+
+
+def run_child(files, requests):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    latencies = []
+    with TestClient(app) as client:
+        while not client.get('/ready').status_code == 200:
+            time.sleep(0.1)
+        for i in range(requests):
+            path = files[i % len(files)]
+            with open(path, 'rb') as fh:
+                started = time.perf_counter()
+                response = client.post('/process', files={'file': (os.path.basename(path), fh)})
+                latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                print(f"{path}: {response.status_code} {response.text[:200]}", file=sys.stderr)
+        drain_started = time.perf_counter()
+    # Leaving the client ran the shutdown hooks, which wait for queued uploads and inserts
+    print(json.dumps({"latencies": latencies, "drain": time.perf_counter() - drain_started}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', default=SAMPLES)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per fake Supabase call')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=54329)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    files = [f for f in args.files if os.path.exists(f)]
+    if not files:
+        sys.exit("No input files found")
+    if args.child:
+        return run_child(files, args.requests)
+
+    from fake_supabase import serve
+    server = serve(args.port, args.latency, args.fail_rate)
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"{args.requests} requests per mode, fake Supabase latency {args.latency * 1000:.0f}ms per call")
+    print(f"  {'mode':<12}{'p50':>9}{'p95':>9}{'mean':>9}{'drain':>9}{'uploads':>9}{'rows':>7}")
+    for mode in MODES:
+        before = json.load(urllib.request.urlopen(f"{url}/_stats"))
+        env = {**os.environ, "SUPABASE_URL": url, "SUPABASE_KEY": "fake.fake.fake", "SUPABASE_UPLOAD_MODE": mode,
+               "SUPABASE_BACKOFF": "0.05", "RESULT_CACHE_ENABLED": "false"}
+        child = subprocess.run([sys.executable, __file__, '--child', '--requests', str(args.requests), *files],
+                               env=env, capture_output=True, text=True)
+        lines = [line for line in child.stdout.splitlines() if line.startswith('{"latencies"')]
+        if child.returncode != 0 or not lines:
+            print(f"  {mode:<12}failed:\n{child.stderr[-2000:]}")
+            continue
+        report = json.loads(lines[-1])
+        after = json.load(urllib.request.urlopen(f"{url}/_stats"))
+        ms = sorted(1000 * t for t in report["latencies"])
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        print(f"  {mode:<12}{statistics.median(ms):>7.0f}ms{p95:>7.0f}ms{statistics.mean(ms):>7.0f}ms"
+              f"{report['drain'] * 1000:>7.0f}ms{after['uploads'] - before['uploads']:>9}{after['rows'] - before['rows']:>7}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Minimal local stand-in for the Supabase endpoints the API uses, for testing.
+
+Serves storage uploads (POST /storage/v1/object/<bucket>/<path>) and table
+inserts (POST /rest/v1/<table>), keeping everything in memory. Every call
+waits --latency seconds, and a --fail-rate share of calls answer 503, to
+exercise retries and backoff. GET /_stats returns the counts.
+
+Point the API at it with:
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=fake.fake.fake
+
+Usage: python tools/fake_supabase.py [--port 54321] [--latency 0.1] [--fail-rate 0.0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, fail_rate):
+    stats = {"uploads": 0, "upload_bytes": 0, "rows": 0, "failures": 0}
+    tables = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                with lock:
+                    return self._reply(200, {**stats, "tables": {name: len(rows) for name, rows in tables.items()}})
+            self._reply(404, {"message": "not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            if random.random() < fail_rate:
+                with lock:
+                    stats["failures"] += 1
+                return self._reply(503, {"message": "fake outage", "statusCode": "503", "error": "unavailable"})
+            if self.path.startswith("/storage/v1/object/"):
+                with lock:
+                    stats["uploads"] += 1
+                    stats["upload_bytes"] += len(body)
+                return self._reply(200, {"Key": self.path[len("/storage/v1/object/"):]})
+            if self.path.startswith("/rest/v1/"):
+                table = self.path[len("/rest/v1/"):].split("?")[0]
+                rows = json.loads(body or b"[]")
+                rows = rows if isinstance(rows, list) else [rows]
+                with lock:
+                    tables.setdefault(table, []).extend(rows)
+                    stats["rows"] += len(rows)
+                return self._reply(201, rows)
+            self._reply(404, {"message": "not found"})
+
+    return Handler
+
+
+def serve(port=54321, latency=0.1, fail_rate=0.0):
+    """Start the fake server on a background thread. Returns the server (call shutdown() to stop it)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every call')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of calls answered with 503')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.fail_rate))
+    print(f"Fake Supabase on http://127.0.0.1:{args.port} (latency {args.latency}s, fail rate {args.fail_rate})")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+Load-test a running API: throughput, latency percentiles, rejections and server-side stage timings.
+
+Sends a weighted mix of files (file or file:weight, e.g. test.pdf:1 test.jpg:3)
+to POST /process, POST /process/batch (--batch-size files per request) or
+POST /jobs (then polls GET /jobs/{id} until the job is done or failed), for
+--duration seconds, either:
+
+- closed loop: --concurrency clients, each sending its next request as soon as
+  the previous one answers (or once its Retry-After has passed);
+- open loop: --rate requests per second with Poisson arrivals, whatever the
+  server's response times. Latency counts from the scheduled send time, so
+  a slow server isn't hidden by the client waiting for it. Arrivals that find
+  --max-in-flight requests outstanding are dropped and counted.
+
+Requests sent during --warmup aren't counted. The summary covers throughput,
+latency percentiles (overall and per file), status codes, error and rejection
+rates (429, and 503 with Retry-After, which is how the API sheds load), and
+the Server-Timing stages of /process responses. --output writes everything as
+JSON; --compare prints the differences against an earlier report.
+
+Start the API first (uvicorn app.main:app), then:
+Usage: python tools/load_test.py [files...] [--url http://localhost:8000] [--concurrency 4 | --rate 2] [--duration 60]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SAMPLES = ['test.pdf', 'test.jpg', 'page0.png']
+CONTENT_TYPES = {'.pdf': 'application/pdf', '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+PERCENTILES = (50, 90, 95, 99)
+
+_local = threading.local()
+
+
+def session():
+    """One keep-alive connection per client thread."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def parse_files(specs):
+    """['test.pdf:2', 'test.jpg'] -> [(name, bytes, content type, weight)], read once up front."""
+    files = []
+    for spec in specs:
+        path, weight = spec, 1.0
+        head, _, tail = spec.rpartition(':')
+        if head and not os.path.exists(spec):
+            try:
+                path, weight = head, float(tail)
+            except ValueError:
+                pass
+        if not os.path.exists(path) and os.path.exists(os.path.join(ROOT, path)):
+            path = os.path.join(ROOT, path)
+        if not os.path.exists(path):
+            print(f"Skipping {spec}: not found")
+            continue
+        with open(path, 'rb') as fh:
+            content = fh.read()
+        content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+        files.append((os.path.basename(path), content, content_type, weight))
+    return files
+
+
+def parse_server_timing(header):
+    """'ocr;dur=12.5, total;dur=40.1' -> {'ocr': 12.5, 'total': 40.1}"""
+    timings = {}
+    for metric in (header or '').split(','):
+        name, *params = [part.strip() for part in metric.split(';')]
+        for param in params:
+            if name and param.startswith('dur='):
+                try:
+                    timings[name] = timings.get(name, 0.0) + float(param[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+class LoadTest:
+    def __init__(self, args, files):
+        self.args = args
+        self.files = files
+        self.weights = [weight for *_, weight in files]
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.arrivals = random.Random(args.seed + 1)  # own generator: arrival times don't depend on thread timing
+        self.records = []
+        self.records_lock = threading.Lock()
+        self.dropped = 0
+        self.started = None
+
+    def pick(self, count=1):
+        with self.rng_lock:
+            return self.rng.choices(self.files, weights=self.weights, k=count)
+
+    def send(self, scheduled=None):
+        """Send one request and record it. scheduled: perf_counter time the request was due (open loop)."""
+        args = self.args
+        chosen = self.pick(args.batch_size if args.endpoint == 'batch' else 1)
+        began = time.perf_counter()
+        record = {"t": round((scheduled or began) - self.started, 3), "file": chosen[0][0], "status": None}
+        try:
+            if args.endpoint == 'batch':
+                upload = [('files', (name, content, content_type)) for name, content, content_type, _ in chosen]
+                response = session().post(f"{args.url}/process/batch", files=upload, timeout=args.timeout)
+                lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+                summary = lines[-1] if lines and lines[-1].get("summary") else {}
+                record["items"] = summary.get("total", 0)
+                record["items_failed"] = summary.get("failed", 0)
+                record["file"] = f"batch of {len(chosen)}"
+            else:
+                name, content, content_type, _ = chosen[0]
+                path = '/jobs' if args.endpoint == 'jobs' else '/process'
+                response = session().post(f"{args.url}{path}", files={'file': (name, content, content_type)},
+                                          timeout=args.timeout)
+                if args.endpoint == 'jobs' and response.status_code == 202:
+                    response = self.wait_for_job(response.json()["job_id"])
+            record["status"] = response.status_code
+            record["retry_after"] = response.headers.get("Retry-After")
+            record["server_timing"] = parse_server_timing(response.headers.get("Server-Timing"))
+            if response.status_code == 200 and args.endpoint == 'jobs':
+                record["job_status"] = response.json().get("status")
+        except (requests.RequestException, ValueError, KeyError) as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency"] = time.perf_counter() - (scheduled or began)
+        with self.records_lock:
+            self.records.append(record)
+        return record
+
+    def wait_for_job(self, job_id):
+        deadline = time.perf_counter() + self.args.timeout
+        while True:
+            response = session().get(f"{self.args.url}/jobs/{job_id}", timeout=self.args.timeout)
+            if response.status_code != 200 or response.json().get("status") in ("done", "failed"):
+                return response
+            if time.perf_counter() > deadline:
+                raise requests.Timeout(f"job {job_id} still {response.json().get('status')}")
+            time.sleep(self.args.poll_interval)
+
+    def closed_loop(self, end):
+        def client():
+            while time.perf_counter() < end:
+                record = self.send()
+                if record.get("retry_after") and not self.args.ignore_retry_after:
+                    # Back off like a well-behaved client instead of hammering a busy server
+                    try:
+                        time.sleep(max(0.0, min(float(record["retry_after"]), end - time.perf_counter())))
+                    except ValueError:
+                        pass
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def open_loop(self, end):
+        in_flight = threading.BoundedSemaphore(self.args.max_in_flight)
+
+        def run(scheduled):
+            try:
+                self.send(scheduled)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as pool:
+            due = time.perf_counter()
+            while True:
+                due += self.arrivals.expovariate(self.args.rate)
+                if due >= end:
+                    break
+                time.sleep(max(0.0, due - time.perf_counter()))
+                if not in_flight.acquire(blocking=False):
+                    if due - self.started >= self.args.warmup:
+                        self.dropped += 1
+                    continue
+                pool.submit(run, due)
+
+    def run(self):
+        self.started = time.perf_counter()
+        end = self.started + self.args.warmup + self.args.duration
+        if self.args.rate:
+            self.open_loop(end)
+        else:
+            self.closed_loop(end)
+        return time.perf_counter() - self.started
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    stats = {f"p{pct}_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 1)
+             for pct in PERCENTILES}
+    return {"n": len(values), "mean_ms": round(1000 * statistics.mean(values), 1), **stats,
+            "max_ms": round(1000 * ordered[-1], 1)}
+
+
+def summarize(records, window, dropped, endpoint):
+    """Aggregate the measured records. window: seconds of the measured period."""
+    ok = [r for r in records if r["status"] == 200 and r.get("job_status", "done") == "done"]
+    statuses = {}
+    for r in records:
+        key = str(r["status"]) if r["status"] is not None else "client_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    rate_limited = sum(1 for r in records if r["status"] == 429)
+    busy = sum(1 for r in records if r["status"] == 503 and r.get("retry_after"))
+    total = len(records)
+    summary = {
+        "requests": total,
+        "succeeded": len(ok),
+        "window_s": round(window, 1),
+        "throughput_rps": round(len(ok) / window, 2) if window else None,
+        "offered_rps": round(total / window, 2) if window else None,
+        "error_rate": round((total - len(ok)) / total, 4) if total else None,
+        "rate_limited_429": rate_limited,
+        "rate_limited_rate": round(rate_limited / total, 4) if total else None,
+        "busy_503": busy,
+        "busy_rate": round(busy / total, 4) if total else None,
+        "dropped_by_client": dropped,
+        "latency": percentiles([r["latency"] for r in ok]),
+        "latency_all": percentiles([r["latency"] for r in records]),
+    }
+    if endpoint == 'batch':
+        items = sum(r.get("items", 0) - r.get("items_failed", 0) for r in ok)
+        summary["documents_per_s"] = round(items / window, 2) if window else None
+    by_file = {}
+    for r in ok:
+        by_file.setdefault(r["file"], []).append(r["latency"])
+    stages = {}
+    for r in ok:
+        for name, ms in r.get("server_timing", {}).items():
+            stages.setdefault(name, []).append(ms / 1000)
+    errors = {}
+    for r in records:
+        if r.get("error"):
+            errors[r["error"][:200]] = errors.get(r["error"][:200], 0) + 1
+    return {
+        "summary": summary,
+        "status_codes": dict(sorted(statuses.items())),
+        "by_file": {name: percentiles(values) for name, values in sorted(by_file.items())},
+        # Present on responses that ran a stage: a cache hit has no ocr
+        "server_timing": {name: percentiles(values) for name, values in sorted(stages.items())},
+        "errors": errors,
+    }
+
+
+def print_report(report):
+    s = report["summary"]
+    print(f"\n{s['requests']} requests in {s['window_s']}s: {s['succeeded']} succeeded, "
+          f"{s['throughput_rps']} req/s" + (f", {s['documents_per_s']} documents/s" if "documents_per_s" in s else ""))
+    print(f"  errors {s['error_rate']:.1%}   429 {s['rate_limited_rate']:.1%}   503 busy {s['busy_rate']:.1%}"
+          f"   dropped by client {s['dropped_by_client']}" if s['requests'] else "  no requests completed")
+    print(f"  status codes: {', '.join(f'{code} x{n}' for code, n in report['status_codes'].items())}")
+    header = f"  {'':<26}{'n':>6}{'mean':>10}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'max':>10}"
+    rows = [("latency (succeeded)", s["latency"]), ("latency (all)", s["latency_all"])]
+    rows += [(f"  {name}", stats) for name, stats in report["by_file"].items()]
+    rows += [(f"server: {name}", stats) for name, stats in report["server_timing"].items()]
+    print(header)
+    for label, stats in rows:
+        if stats:
+            print(f"  {label:<26}{stats['n']:>6}{stats['mean_ms']:>8.0f}ms"
+                  + "".join(f"{stats[f'p{p}_ms']:>8.0f}ms" for p in PERCENTILES) + f"{stats['max_ms']:>8.0f}ms")
+    for error, n in report["errors"].items():
+        print(f"  {n} x {error}")
+
+
+def compare(report, before):
+    """Print the headline numbers of two reports side by side."""
+    rows = [("throughput req/s", lambda r: r["summary"]["throughput_rps"]),
+            ("error rate", lambda r: r["summary"]["error_rate"]),
+            ("503 busy rate", lambda r: r["summary"]["busy_rate"])]
+    rows += [(f"latency p{p} ms", lambda r, p=p: r["summary"]["latency"].get(f"p{p}_ms")) for p in PERCENTILES]
+    rows += [(f"server {name} p50 ms", lambda r, name=name: r["server_timing"].get(name, {}).get("p50_ms"))
+             for name in report["server_timing"]]
+    print(f"\n  {'':<30}{'before':>12}{'after':>12}{'change':>10}")
+    for label, value in rows:
+        old, new = value(before), value(report)
+        change = f"{(new - old) / old:+.0%}" if old and new is not None else ""
+        print(f"  {label:<30}{str(old):>12}{str(new):>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', default=SAMPLES, help='file or file:weight (default: the sample files)')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--endpoint', default='process', choices=['process', 'batch', 'jobs'])
+    parser.add_argument('--batch-size', type=int, default=4, help='files per /process/batch request')
+    parser.add_argument('--concurrency', type=int, default=4, help='closed loop: clients sending back to back')
+    parser.add_argument('--ignore-retry-after', action='store_true',
+                        help='closed loop: retry rejected requests straight away')
+    parser.add_argument('--rate', type=float, help='open loop: requests per second (Poisson arrivals)')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='open loop: outstanding requests before dropping')
+    parser.add_argument('--duration', type=float, default=60, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds before measuring')
+    parser.add_argument('--timeout', type=float, default=300, help='per request (per job with --endpoint jobs)')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between GET /jobs/{id}')
+    parser.add_argument('--seed', type=int, default=1, help='seeds the file mix and arrival times')
+    parser.add_argument('--output', help='write the report to this JSON file')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare against')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    files = parse_files(args.files)
+    if not files:
+        sys.exit("No input files found")
+    try:
+        requests.get(f"{args.url}/health", timeout=10).raise_for_status()
+    except requests.RequestException as e:
+        sys.exit(f"API not reachable at {args.url}: {e}")
+    mode = f"{args.rate} req/s open loop" if args.rate else f"{args.concurrency} concurrent clients"
+    print(f"{args.endpoint}: {mode}, {args.warmup:.0f}s warm-up + {args.duration:.0f}s, "
+          f"files {', '.join(f'{name} x{weight:g}' for name, _, _, weight in files)}")
+
+    test = LoadTest(args, files)
+    elapsed = test.run()
+    measured = [r for r in test.records if r["t"] >= args.warmup]
+    # Requests still answering after the end extend the window they were measured over
+    window = max(args.duration, elapsed - args.warmup)
+    report = summarize(measured, window, test.dropped, args.endpoint)
+    report["config"] = {
+        "url": args.url, "endpoint": args.endpoint, "files": {name: weight for name, _, _, weight in files},
+        "mode": "open" if args.rate else "closed", "rate": args.rate,
+        "concurrency": None if args.rate else args.concurrency, "ignore_retry_after": args.ignore_retry_after,
+        "batch_size": args.batch_size if args.endpoint == 'batch' else None, "duration": args.duration,
+        "warmup": args.warmup, "seed": args.seed, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        report["server_stats"] = requests.get(f"{args.url}/stats", timeout=10).json()
+    except (requests.RequestException, ValueError):
+        report["server_stats"] = None
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=1, sort_keys=True)
+        print(f"Report saved to {args.output}")
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(report, json.load(fh))
+
+
+if __name__ == '__main__':
+    main()
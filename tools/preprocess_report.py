@@ -0,0 +1,63 @@
+"""
+Report how much OCR latency each preprocessing step saves, and how much it changes the text.
+
+Runs OCR on the sample files in the repo with no preprocessing (the baseline),
+with each step enabled on its own, and with the default set of steps. Text
+similarity is measured against the baseline text (1.000 = identical).
+
+Usage: python tools/preprocess_report.py [files...] [--runs 3]
+"""
+import argparse
+import difflib
+import os
+import re
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.ocr import ocr_document
+from app.preprocess import DEFAULT_STEPS, NO_STEPS
+
+SAMPLES = ['test.jpg', 'page0.png', 'test.pdf']
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def measure(path, steps, runs):
+    times = []
+    text = ""
+    for _ in range(runs):
+        started = time.perf_counter()
+        text, _ = ocr_document(path, steps=steps)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), normalize(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', default=SAMPLES)
+    parser.add_argument('--runs', type=int, default=3, help='OCR runs per configuration (median is reported)')
+    args = parser.parse_args()
+
+    configs = [('baseline (none)', NO_STEPS)]
+    configs += [(step, {step: True}) for step in NO_STEPS]
+    configs.append(('defaults', DEFAULT_STEPS))
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"Skipping {path}: not found")
+            continue
+        print(f"\n{path}")
+        print(f"  {'steps':<18}{'latency':>10}{'saved':>10}{'text similarity':>18}")
+        base_time, base_text = measure(path, NO_STEPS, args.runs)
+        for name, steps in configs:
+            elapsed, text = (base_time, base_text) if steps is NO_STEPS else measure(path, steps, args.runs)
+            saved = 100 * (base_time - elapsed) / base_time if base_time else 0.0
+            similarity = difflib.SequenceMatcher(None, base_text, text).ratio() if base_text or text else 1.0
+            print(f"  {name:<18}{elapsed * 1000:>8.0f}ms{saved:>9.0f}%{similarity:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
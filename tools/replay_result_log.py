@@ -0,0 +1,80 @@
+"""
+Backfill the local result log into the SQL database or Supabase.
+
+Records land in the result log (RESULT_LOG_DIR) while the database or Supabase
+is unreachable. This replays the ones not replayed yet, oldest first, in
+batches: each batch is one bulk insert, and is marked as replayed in the log's
+index only once the insert succeeded, so the tool can be stopped and rerun at
+any time. It stops at the first failed batch (the target is still down).
+
+Usage: python tools/replay_result_log.py --target db|supabase [--batch-size 500] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import result_log
+from app.config import SUPABASE_URL, SUPABASE_KEY
+
+
+def to_db(records):
+    from app.database import init_db, save_documents
+    init_db()
+    save_documents([{
+        "filename": record.get("filename"),
+        "doc_type": record.get("document_type"),
+        "raw_text": record.get("extracted_text"),
+        "extracted": record.get("extracted_json"),
+    } for record in records])
+
+
+def supabase_writer():
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        sys.exit("SUPABASE_URL and SUPABASE_KEY must be set to replay into Supabase")
+    from supabase import create_client
+    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+    def to_supabase(records):
+        client.table("documents").insert([{
+            "filename": record.get("filename"),
+            "storage_path": record.get("storage_path"),
+            "file_url": record.get("file_url"),
+            "document_type": record.get("document_type"),
+            "extracted_text": record.get("extracted_text"),
+            "extracted_json": record.get("extracted_json"),
+        } for record in records]).execute()
+    return to_supabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--target', choices=['db', 'supabase'], required=True)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='count what would be replayed')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        print(f"{result_log.pending_count()} record(s) in {result_log.RESULT_LOG_DIR} waiting to be replayed")
+        return
+
+    write = to_db if args.target == 'db' else supabase_writer()
+    replayed = 0
+    started = time.perf_counter()
+    while True:
+        batch = result_log.pending(args.batch_size)
+        if not batch:
+            break
+        try:
+            write([record for _, record in batch])
+        except Exception as e:
+            print(f"Replay into {args.target} failed after {replayed} record(s), try again later: {e}")
+            sys.exit(1)
+        result_log.mark_replayed([seq for seq, _ in batch], args.target)
+        replayed += len(batch)
+        print(f"  replayed {replayed} record(s)")
+    print(f"Replayed {replayed} record(s) into {args.target} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()